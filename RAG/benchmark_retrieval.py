@@ -0,0 +1,365 @@
+"""
+benchmark_retrieval.py
+Retrieval benchmark on synthetic corpora - no embedding model download needed.
+
+Generates random or clustered unit-norm embeddings for corpora of the given
+sizes and, for each one, measures:
+
+- build time: writing the index with RAGSystem.save_index
+- load time: reading the embeddings and index mapping back
+- memory: embedding bytes and process RSS growth
+- query latency (p50/p99/mean) and QPS at several concurrency levels
+- recall@k against exact float64 search
+
+for the three search paths in this directory: EmbeddingModel.similarity_search,
+RAGSystem.retrieve and light_rag.find_similar_chunks. Query embeddings are
+precomputed, so the numbers cover search and result assembly, not the
+embedding model itself.
+
+    python benchmark_retrieval.py                                 # 1k, 10k, 100k chunks
+    python benchmark_retrieval.py --sizes 1000000 --distribution clustered
+    python benchmark_retrieval.py --output results/$(git rev-parse --short HEAD).json
+
+Results are written as JSON (tagged with the git commit) so runs can be
+compared across commits. 5M chunks at 384 dimensions needs ~8 GB of RAM for
+the embeddings alone; use --dim or smaller sizes on small machines.
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from rag_system import RAGSystem, IndexSnapshot
+from utils.chunk_metadata import ChunkMetadata
+from utils.document_processor import DocumentProcessor
+from utils.embeddings import EmbeddingModel
+from utils.index_manifest import IndexManifest, MANIFEST_FILE
+from utils.index_versions import current_index_dir
+from utils.streaming_chunker import ChunkStore
+
+TARGETS = ("similarity_search", "rag_retrieve", "light_rag")
+CHUNKS_PER_DOCUMENT = 100
+
+
+# ---------------------------------------------------------------------- #
+# synthetic data                                                         #
+# ---------------------------------------------------------------------- #
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def make_corpus(size: int, dim: int, distribution: str, seed: int, block: int = 100_000) -> np.ndarray:
+    """Unit-norm float32 embeddings; "clustered" mimics topical document sets."""
+    rng = np.random.default_rng(seed)
+    embeddings = np.empty((size, dim), dtype=np.float32)
+    if distribution == "clustered":
+        n_clusters = max(8, size // 1000)
+        centers = normalize(rng.standard_normal((n_clusters, dim)).astype(np.float32))
+    # Generate in blocks so peak memory stays near the final array size
+    for start in range(0, size, block):
+        end = min(start + block, size)
+        noise = rng.standard_normal((end - start, dim)).astype(np.float32)
+        if distribution == "clustered":
+            assignment = rng.integers(0, n_clusters, end - start)
+            noise = centers[assignment] + 0.35 * noise / np.sqrt(dim)
+        embeddings[start:end] = normalize(noise)
+    return embeddings
+
+
+def make_queries(corpus: np.ndarray, count: int, seed: int) -> np.ndarray:
+    """Queries near (but not on) corpus points, like real questions about the documents."""
+    rng = np.random.default_rng(seed + 1)
+    picks = rng.integers(0, len(corpus), count)
+    noise = rng.standard_normal((count, corpus.shape[1])).astype(np.float32)
+    return normalize(corpus[picks] + 0.5 * noise / np.sqrt(corpus.shape[1]))
+
+
+def chunk_text(idx: int) -> str:
+    return f"synthetic chunk {idx}"
+
+
+def chunk_id(text: str) -> int:
+    return int(text.rsplit(" ", 1)[1])
+
+
+def write_documents(num_chunks: int, documents_dir: str) -> ChunkStore:
+    """One file per CHUNKS_PER_DOCUMENT chunks, a chunk per line, so retrieval reads real spans."""
+    os.makedirs(documents_dir, exist_ok=True)
+    paths, spans = [], []
+    for first in range(0, num_chunks, CHUNKS_PER_DOCUMENT):
+        texts = [chunk_text(i).encode("utf-8") for i in range(first, min(first + CHUNKS_PER_DOCUMENT, num_chunks))]
+        lengths = np.array([len(t) for t in texts], dtype=np.int64)
+        ends = np.cumsum(lengths + 1) - 1
+        path = os.path.join(documents_dir, f"doc_{first // CHUNKS_PER_DOCUMENT}.txt")
+        with open(path, "wb") as f:
+            f.write(b"\n".join(texts) + b"\n")
+        paths.append(path)
+        spans.append(np.stack([ends - lengths, ends], axis=1))
+    return ChunkStore.from_documents(paths, spans)
+
+
+class SyntheticEmbeddingModel(EmbeddingModel):
+    """EmbeddingModel whose "embeddings" for the benchmark queries are precomputed."""
+
+    def __init__(self, queries: np.ndarray):
+        self.model_name = "synthetic"
+        self.embedding_dim = queries.shape[1]
+        self.queries = queries
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return self.queries[int(query.split("-")[1])]
+
+    def encode(self, texts, **kwargs) -> np.ndarray:
+        # light_rag calls the SentenceTransformer API directly
+        return np.stack([self.embed_query(t) for t in texts])
+
+
+# ---------------------------------------------------------------------- #
+# measurement helpers                                                    #
+# ---------------------------------------------------------------------- #
+def rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # Peak rather than current RSS, but better than nothing off Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def latency_summary(seconds):
+    ms = np.array(seconds) * 1000
+    return {
+        "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+    }
+
+
+def exact_top_k(corpus: np.ndarray, queries: np.ndarray, k: int, block: int = 65536) -> np.ndarray:
+    """Ground-truth neighbours by float64 cosine, scanning the corpus in blocks."""
+    best_scores = np.full((len(queries), k), -np.inf)
+    best_ids = np.zeros((len(queries), k), dtype=np.int64)
+    q = queries.astype(np.float64)
+    for start in range(0, len(corpus), block):
+        scores = q @ corpus[start:start + block].astype(np.float64).T
+        ids = np.broadcast_to(np.arange(start, start + scores.shape[1]), scores.shape)
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate([best_ids, ids], axis=1)
+        keep = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(scores, keep, axis=1)
+        best_ids = np.take_along_axis(ids, keep, axis=1)
+    return best_ids
+
+
+def recall_at_k(found, truth) -> float:
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return round(hits / max(sum(len(t) for t in truth), 1), 4)
+
+
+# ---------------------------------------------------------------------- #
+# search paths under test                                                #
+# ---------------------------------------------------------------------- #
+def build_rag(corpus: np.ndarray, model: SyntheticEmbeddingModel, workdir: str, top_k: int) -> RAGSystem:
+    # Bypass __init__, which loads a real embedding model and the on-disk index
+    rag = RAGSystem.__new__(RAGSystem)
+    rag.documents_dir = os.path.join(workdir, "documents")
+    rag.embeddings_dir = workdir
+    rag.embedding_model = model
+    rag.document_processor = DocumentProcessor()
+    rag.top_k = top_k
+    rag.retrieval_mode = "dense"  # synthetic chunk texts carry no lexical signal
+    rag.candidate_pool = 200
+    rag.index_stats = {}
+    rag._write_lock = threading.Lock()
+    n_docs = (len(corpus) + CHUNKS_PER_DOCUMENT - 1) // CHUNKS_PER_DOCUMENT
+    document_metadata = [
+        {"filename": f"doc_{d}.txt", "path": os.path.join(rag.documents_dir, f"doc_{d}.txt"),
+         "doc_index": d, "num_chunks": min(CHUNKS_PER_DOCUMENT, len(corpus) - d * CHUNKS_PER_DOCUMENT)}
+        for d in range(n_docs)
+    ]
+    rag.index = IndexSnapshot(
+        document_metadata=document_metadata,
+        document_chunks=write_documents(len(corpus), rag.documents_dir),
+        chunk_embeddings=corpus,
+        chunk_doc_ids=(np.arange(len(corpus)) // CHUNKS_PER_DOCUMENT).astype(np.int32),
+        chunk_metadata=ChunkMetadata.from_documents(document_metadata)
+    )  # no BM25 or deduplicator: synthetic chunks carry no lexical signal and are all distinct
+    return rag
+
+
+def load_rag_files(workdir: str):
+    """What RAGSystem.load_index reads from the published index version (documents are not re-chunked)."""
+    index_dir = current_index_dir(workdir)
+    manifest = IndexManifest.load(os.path.join(index_dir, MANIFEST_FILE))
+    embeddings = np.load(os.path.join(index_dir, "chunk_embeddings.npy"))
+    return manifest.metadata, manifest.doc_ids, embeddings
+
+
+def make_searchers(targets, corpus, model, rag, top_k):
+    """name -> function(query number) returning the retrieved chunk ids."""
+    searchers = {}
+    if "similarity_search" in targets:
+        def similarity_search(q):
+            hits = model.similarity_search(model.queries[q], corpus, top_k=top_k)
+            return [h["index"] for h in hits]
+        searchers["similarity_search"] = similarity_search
+
+    if "rag_retrieve" in targets:
+        def rag_retrieve(q):
+            return [chunk_id(r["chunk"]) for r in rag.retrieve(f"query-{q}")]
+        searchers["rag_retrieve"] = rag_retrieve
+
+    if "light_rag" in targets:
+        import light_rag
+        light_rag.EMBEDDING_MODEL = model
+        light_rag.INDEX = light_rag.LoadedIndex(None, rag.document_chunks, rag.chunk_doc_ids, corpus)
+
+        def light_rag_search(q):
+            return [chunk_id(r["chunk"]) for r in light_rag.find_similar_chunks(f"query-{q}", top_k)]
+        searchers["light_rag"] = light_rag_search
+    return searchers
+
+
+def run_target(search, n_queries, truth, concurrency_levels):
+    search(0)  # warm-up
+    latencies, found = [], []
+    for q in range(n_queries):
+        start = time.perf_counter()
+        found.append(search(q))
+        latencies.append(time.perf_counter() - start)
+
+    qps = {}
+    for workers in concurrency_levels:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            start = time.perf_counter()
+            list(pool.map(search, range(n_queries)))
+            qps[str(workers)] = round(n_queries / (time.perf_counter() - start), 2)
+
+    return {
+        "latency": latency_summary(latencies),
+        "recall_at_k": recall_at_k(found, truth),
+        "qps": qps,
+    }
+
+
+def run_size(size, args):
+    print(f"[{size} chunks] generating {args.distribution} corpus...", file=sys.stderr)
+    rss_start = rss_bytes()
+    corpus = make_corpus(size, args.dim, args.distribution, args.seed)
+    queries = make_queries(corpus, args.queries, args.seed)
+    model = SyntheticEmbeddingModel(queries)
+
+    workdir = tempfile.mkdtemp(prefix="rag_bench_")
+    try:
+        rss_before_index = rss_bytes()
+        rag = build_rag(corpus, model, workdir, args.top_k)
+        rss_after_index = rss_bytes()
+
+        start = time.perf_counter()
+        rag.save_index()
+        build_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_rag_files(workdir)
+        load_s = time.perf_counter() - start
+
+        index_dir = current_index_dir(workdir)
+        index_bytes = sum(os.path.getsize(os.path.join(index_dir, f)) for f in os.listdir(index_dir))
+
+        print(f"[{size} chunks] computing exact neighbours...", file=sys.stderr)
+        truth = exact_top_k(corpus, queries, args.top_k)
+
+        result = {
+            "chunks": size,
+            "dim": args.dim,
+            "distribution": args.distribution,
+            "build_s": round(build_s, 4),
+            "load_s": round(load_s, 4),
+            "index_bytes_on_disk": index_bytes,
+            "memory": {
+                "embedding_bytes": int(corpus.nbytes),
+                "rss_corpus_bytes": rss_before_index - rss_start,
+                "rss_index_structures_bytes": rss_after_index - rss_before_index,
+                "rss_total_bytes": rss_bytes(),
+            },
+            "targets": {},
+        }
+        for name, search in make_searchers(args.targets, corpus, model, rag, args.top_k).items():
+            print(f"[{size} chunks] {name}...", file=sys.stderr)
+            result["targets"][name] = run_target(search, args.queries, truth, args.concurrency)
+        return result
+    finally:
+        # Searches read chunk text from the index files, so they stay until every target has run
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark RAG retrieval on synthetic corpora")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated corpus sizes in chunks (up to 5000000)")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding dimension (all-MiniLM-L6-v2 uses 384)")
+    parser.add_argument("--distribution", choices=["random", "clustered"], default="random", help="How the synthetic embeddings are spread")
+    parser.add_argument("--queries", type=int, default=200, help="Queries per target")
+    parser.add_argument("--top-k", type=int, default=5, help="Results per query (recall@k uses the same k)")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated thread counts for the QPS runs")
+    parser.add_argument("--targets", default=",".join(TARGETS), help=f"Comma-separated search paths: {', '.join(TARGETS)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+    args.concurrency = parse_list(args.concurrency, int)
+    args.targets = parse_list(args.targets, str)
+    unknown = set(args.targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"unknown targets: {', '.join(sorted(unknown))}")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "machine": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {
+            "dim": args.dim,
+            "distribution": args.distribution,
+            "queries": args.queries,
+            "top_k": args.top_k,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+        },
+        "results": [run_size(size, args) for size in parse_list(args.sizes, int)],
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+build_index.py
+Build a RAG index and publish it as a new version.
+
+Serving processes keep answering queries from the current version and
+switch to the new one once it is published. rag_server.py runs this
+script as the worker process of POST /rag/index jobs; it can also be run
+by hand:
+
+    python build_index.py                          # RAG/documents -> RAG/embeddings
+    python build_index.py --documents-dir /data/docs --embeddings-dir /data/embeddings
+
+With --progress, progress is written to stdout as lines of
+"PROGRESS <json>". SIGTERM cancels the build: the partly written version
+is removed and nothing is published.
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from rag_system import RAGSystem
+
+PROGRESS_PREFIX = "PROGRESS "
+EXIT_FAILED = 1
+EXIT_CANCELLED = 3
+
+
+class BuildCancelled(Exception):
+    pass
+
+
+def main() -> int:
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents-dir", default=os.path.join(here, "documents"))
+    parser.add_argument("--embeddings-dir", default=os.path.join(here, "embeddings"))
+    parser.add_argument("--embedding-model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--chunk-size", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=128)
+    parser.add_argument("--no-dedup", action="store_true", help="keep near-duplicate chunks")
+    parser.add_argument("--dedup-threshold", type=float, default=0.85)
+    parser.add_argument(
+        "--memory-budget-mb", type=float, default=float(os.getenv("RAG_MEMORY_BUDGET_MB", 0)) or None,
+        help="target private memory (RSS without file-backed pages) while embedding; batch sizes adapt to it (default: RAG_MEMORY_BUDGET_MB, else fixed batches)"
+    )
+    parser.add_argument("--progress", action="store_true", help="write machine-readable progress lines to stdout")
+    args = parser.parse_args()
+
+    cancelled = []
+    signal.signal(signal.SIGTERM, lambda signum, frame: cancelled.append(signum))
+
+    def emit(update):
+        if args.progress:
+            print(PROGRESS_PREFIX + json.dumps(update), flush=True)
+
+    def progress(update):
+        # Checked between documents and embedding batches, so a cancel takes effect within one batch
+        if cancelled:
+            raise BuildCancelled()
+        emit(update)
+
+    rag = RAGSystem(
+        documents_dir=args.documents_dir,
+        embeddings_dir=args.embeddings_dir,
+        embedding_model_name=args.embedding_model,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        deduplicate=not args.no_dedup,
+        dedup_threshold=args.dedup_threshold,
+        memory_budget_mb=args.memory_budget_mb,
+        load_existing=False
+    )
+    try:
+        rag.create_index(progress=progress)
+    except BuildCancelled:
+        print("Index build cancelled; nothing was published", flush=True)
+        return EXIT_CANCELLED
+    except Exception as e:
+        print(f"Error creating RAG index: {str(e)}", flush=True)
+        return EXIT_FAILED
+
+    if not rag.index_stats:
+        print(f"No documents found or processed in {args.documents_dir}", flush=True)
+        return EXIT_FAILED
+    emit({"stage": "done", "version": rag.index_stats["version"], "stats": rag.index_stats})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,10 +2,14 @@ import os
 import sys
 import logging
 import traceback
-import numpy as np
 import glob
 from sentence_transformers import SentenceTransformer
 from utils.document_processor import DocumentProcessor
+from utils.index_manifest import IndexManifest, MANIFEST_FILE
+from utils.index_versions import publish_version
+from utils.build_checkpoint import BuildCheckpoint, fingerprint_documents
+from utils.streaming_chunker import ChunkStore, file_signature, document_signature
+from utils.memory_governor import MemoryGovernor, memory_budget_from_env, MB
 
 # Configure logging
 logging.basicConfig(
@@ -23,7 +27,9 @@ def process_documents_safely(
     embeddings_dir="./embeddings",
     chunk_size=512,
     chunk_overlap=128,
-    batch_size=10  # Process in smaller batches
+    batch_size=10,  # First batch size; later ones follow the memory budget
+    memory_budget_mb=None,  # Target private memory; defaults to RAG_MEMORY_BUDGET_MB or 80% of what is available
+    checkpoint_interval=30  # Seconds between embedding checkpoints
 ):
     """Process documents with safer memory usage and detailed error reporting"""
     
@@ -53,44 +59,69 @@ def process_documents_safely(
             
         logger.info(f"Found {len(document_files)} documents")
         
-        # Process documents and collect chunks
-        all_chunks = []
-        document_metadata = []
-        document_index = {}
-        chunk_counter = 0
-        
-        for doc_idx, doc_path in enumerate(document_files):
-            try:
-                logger.info(f"Processing document {doc_idx+1}/{len(document_files)}: {os.path.basename(doc_path)}")
-                
-                # Process document into chunks
-                doc_data = document_processor.process_document(doc_path)
-                
-                # Add document metadata
-                document_metadata.append({
-                    "filename": doc_data["filename"],
-                    "path": doc_data["path"],
-                    "doc_index": doc_idx,
-                    "num_chunks": doc_data["num_chunks"]
-                })
-                
-                # Add chunks and update index
-                for chunk_idx, chunk in enumerate(doc_data["chunks"]):
-                    global_chunk_idx = chunk_counter
-                    all_chunks.append(chunk)
-                    document_index[global_chunk_idx] = {
-                        "doc_idx": doc_idx,
-                        "chunk_idx": chunk_idx
-                    }
-                    chunk_counter += 1
-                
-                logger.info(f"Document {doc_data['filename']} processed into {doc_data['num_chunks']} chunks")
-            except Exception as e:
-                logger.error(f"Error processing document {doc_path}")
-                logger.error(traceback.format_exc())
+        # Resume an interrupted build of the same documents with the same settings
+        checkpoint = BuildCheckpoint(
+            embeddings_dir,
+            {
+                "embedding_model": "all-MiniLM-L6-v2",
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "documents": fingerprint_documents(document_files)
+            },
+            interval=checkpoint_interval
+        )
+        manifest = checkpoint.load_chunks()
+        
+        if manifest is None:
+            # Process documents and collect chunks
+            document_metadata = []
+            document_spans = []
+            
+            for doc_idx, doc_path in enumerate(document_files):
+                try:
+                    logger.info(f"Processing document {doc_idx+1}/{len(document_files)}: {os.path.basename(doc_path)}")
+                    
+                    # Process document into chunk spans; the text is read back batch by batch for embedding
+                    signature = file_signature(doc_path)
+                    spans = document_processor.chunk_file(doc_path)
+                    
+                    # Add document metadata
+                    document_metadata.append({
+                        "filename": os.path.basename(doc_path),
+                        "path": doc_path,
+                        "doc_index": doc_idx,
+                        "num_chunks": len(spans),
+                        **signature
+                    })
+                    document_spans.append(spans)
+                    
+                    logger.info(f"Document {os.path.basename(doc_path)} processed into {len(spans)} chunks")
+                except Exception as e:
+                    logger.error(f"Error processing document {doc_path}")
+                    logger.error(traceback.format_exc())
+            
+            # Chunks are stored document by document, in metadata order
+            all_chunks = ChunkStore.from_documents(
+                [doc["path"] for doc in document_metadata],
+                document_spans,
+                [document_signature(doc) for doc in document_metadata]
+            )
+            manifest = IndexManifest.from_documents(
+                document_metadata,
+                starts=all_chunks.starts,
+                ends=all_chunks.ends,
+                embedding_model="all-MiniLM-L6-v2",
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap
+            )
+            if len(all_chunks):
+                checkpoint.save_chunks(manifest)
+        else:
+            all_chunks = ChunkStore.from_manifest(manifest)
+            logger.info(f"Resuming from checkpoint: {checkpoint.embedded}/{len(all_chunks)} chunks already embedded")
         
         total_chunks = len(all_chunks)
-        logger.info(f"Total chunks to embed: {total_chunks}")
+        logger.info(f"Total chunks to embed: {total_chunks - checkpoint.embedded}")
         
         if total_chunks == 0:
             logger.error("No chunks created from documents")
@@ -110,48 +141,38 @@ def process_documents_safely(
             logger.error(traceback.format_exc())
             return False
         
-        # Process chunks in batches to reduce memory usage
-        embeddings_list = []
-        for i in range(0, total_chunks, batch_size):
-            batch = all_chunks[i:i+batch_size]
-            logger.info(f"Embedding batch {i//batch_size + 1}/{(total_chunks+batch_size-1)//batch_size} ({len(batch)} chunks)")
+        # Process chunks in batches sized to the memory budget; each batch is written to the
+        # checkpoint file, which is committed every checkpoint_interval seconds
+        budget = memory_budget_mb * MB if memory_budget_mb else memory_budget_from_env()
+        governor = MemoryGovernor(budget, initial_batch_size=batch_size)
+        logger.info(f"Memory budget: {budget / MB:.0f} MB")
+        for start, end in governor.batches(total_chunks, start=checkpoint.embedded):
+            batch = all_chunks[start:end]
+            logger.info(f"Embedding chunks {start + 1}-{end}/{total_chunks} ({len(batch)} chunks)")
             try:
                 batch_embeddings = embedding_model.encode(batch, show_progress_bar=True)
-                embeddings_list.append(batch_embeddings)
-                logger.info(f"Batch {i//batch_size + 1} embedded successfully")
+                checkpoint.add(start, batch_embeddings, total_chunks)
+                del batch, batch_embeddings
             except Exception as e:
-                logger.error(f"Error embedding batch {i//batch_size + 1}")
+                checkpoint.commit()
+                logger.error(f"Error embedding chunks {start + 1}-{end}")
                 logger.error(traceback.format_exc())
                 return False
+        logger.info(f"Embedding memory: {governor.stats()}")
+        
+        # Write a new index version; running servers pick it up once it is published
+        with publish_version(embeddings_dir) as (index_dir, version):
+            # Save embeddings
+            embeddings_path = os.path.join(index_dir, "chunk_embeddings.npy")
+            logger.info(f"Saving embeddings to {embeddings_path}")
+            checkpoint.export_embeddings(embeddings_path)
+            
+            # Save index mapping
+            manifest.save(os.path.join(index_dir, MANIFEST_FILE))
         
-        # Combine all batch embeddings
-        logger.info("Combining all embeddings")
-        all_embeddings = np.vstack(embeddings_list)
-        
-        # Save embeddings
-        embeddings_path = os.path.join(embeddings_dir, "chunk_embeddings.npy")
-        logger.info(f"Saving embeddings to {embeddings_path}")
-        np.save(embeddings_path, all_embeddings)
-        
-        # Create index file path
-        index_path = os.path.join(embeddings_dir, "rag_index.json")
-        
-        # Import json here to avoid any issues
-        import json
-        
-        # Save index mapping
-        with open(index_path, 'w') as f:
-            index_data = {
-                "metadata": document_metadata,
-                "document_index": {str(k): v for k, v in document_index.items()},
-                "embedding_model": "all-MiniLM-L6-v2",
-                "chunk_size": chunk_size,
-                "chunk_overlap": chunk_overlap,
-                "num_chunks": total_chunks
-            }
-            json.dump(index_data, f, indent=2)
+        checkpoint.clear()
         
-        logger.info(f"RAG index created successfully with {total_chunks} chunks from {len(document_files)} documents")
+        logger.info(f"RAG index version {version} created successfully with {total_chunks} chunks from {len(manifest.metadata)} documents")
         return True
         
     except Exception as e:
@@ -172,17 +193,13 @@ if __name__ == "__main__":
     process = psutil.Process(os.getpid())
     logger.info(f"Initial memory usage: {process.memory_info().rss / (1024 * 1024):.2f} MB")
     
-    # Set smaller batch size if low memory
+    # Batch sizes adapt at runtime to the memory budget (RAG_MEMORY_BUDGET_MB)
     available_memory = psutil.virtual_memory().available / (1024 * 1024)
     logger.info(f"Available system memory: {available_memory:.2f} MB")
     
-    batch_size = 5 if available_memory < 1000 else 10
-    logger.info(f"Using batch size: {batch_size}")
-    
     success = process_documents_safely(
         documents_dir=documents_dir,
-        embeddings_dir=embeddings_dir,
-        batch_size=batch_size
+        embeddings_dir=embeddings_dir
     )
     
     if success:
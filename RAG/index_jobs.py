@@ -0,0 +1,221 @@
+"""
+Background index build jobs for the RAG server
+
+Each job runs build_index.py in its own process, so a rebuild neither
+blocks request handling nor holds a second embedding model and the new
+embeddings in the server's memory for longer than the build. Jobs run one
+at a time, in submission order. The worker reports progress on stdout
+and publishes a new index version when it is done; the server keeps
+serving the previous version until then.
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter
+
+from build_index import PROGRESS_PREFIX
+
+BUILD_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build_index.py")
+JOB_STATES = ("queued", "running", "succeeded", "failed", "cancelled")
+MAX_FINISHED_JOBS = 50  # Finished jobs kept for GET /rag/jobs
+LOG_TAIL_LINES = 20  # Worker output kept per job, for failures
+
+INDEX_JOBS = Counter("rag_index_jobs_total", "Finished index build jobs", ["status"])
+
+
+class IndexJobManager:
+    """
+    Queue of index builds, each run in a build_index.py worker process
+    """
+    def __init__(self, build_args: List[str], on_published: Optional[Callable[[str], Any]] = None):
+        """
+        Initialize the manager
+
+        Args:
+            build_args (List[str]): Command-line arguments for build_index.py
+            on_published (Optional[Callable[[str], Any]]): Called with the version a job published,
+                e.g. to load it without waiting for the index watcher
+        """
+        self.build_args = build_args
+        self.on_published = on_published
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._queue: deque = deque()
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self) -> Dict[str, Any]:
+        """
+        Queue an index build
+
+        A build that is still queued would index the same documents, so it
+        is returned instead of queueing another one.
+
+        Returns:
+            Dict[str, Any]: The job
+        """
+        with self._lock:
+            if self._queue:
+                return dict(self._jobs[self._queue[-1]])
+            job_id = uuid.uuid4().hex[:12]
+            self._jobs[job_id] = {
+                "id": job_id,
+                "status": "queued",
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "stage": None,
+                "documents_done": 0,
+                "documents_total": None,
+                "chunks": 0,
+                "chunks_embedded": 0,
+                "chunks_total": None,
+                "embeddings_per_second": None,
+                "eta_seconds": None,
+                "version": None,
+                "stats": None,
+                "error": None,
+                "log": []
+            }
+            self._queue.append(job_id)
+            self._prune()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="index-jobs", daemon=True)
+                self._thread.start()
+            self._wakeup.notify()
+            return dict(self._jobs[job_id])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Current state of a job, or None if it is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def active(self) -> bool:
+        """
+        Whether a build is queued or running
+        """
+        with self._lock:
+            return any(job["status"] in ("queued", "running") for job in self._jobs.values())
+
+    def list(self) -> List[Dict[str, Any]]:
+        """
+        All known jobs, newest first
+        """
+        with self._lock:
+            return [dict(job) for job in reversed(self._jobs.values())]
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a queued or running job
+
+        A running worker is sent SIGTERM; it stops at the next document or
+        embedding batch and removes its unpublished version.
+
+        Returns:
+            Optional[Dict[str, Any]]: The job, or None if it is unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job["status"] == "queued":
+                self._queue.remove(job_id)
+                self._finish(job, "cancelled")
+            elif job["status"] == "running" and not job.get("cancel_requested"):
+                job["cancel_requested"] = True
+                if self._process is not None:
+                    self._process.terminate()
+            return dict(job)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                while not self._queue:
+                    self._wakeup.wait()
+                job = self._jobs[self._queue.popleft()]
+                job["status"] = "running"
+                job["started_at"] = time.time()
+            try:
+                self._run_worker(job)
+            except Exception as e:
+                with self._lock:
+                    job["error"] = str(e)
+                    self._finish(job, "failed")
+
+    def _run_worker(self, job: Dict[str, Any]) -> None:
+        process = subprocess.Popen(
+            [sys.executable, BUILD_SCRIPT, *self.build_args, "--progress"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1
+        )
+        with self._lock:
+            self._process = process
+            if job.get("cancel_requested"):
+                process.terminate()
+
+        log = deque(maxlen=LOG_TAIL_LINES)
+        embedding_started = None
+        for line in process.stdout:
+            line = line.rstrip("\n")
+            if not line.startswith(PROGRESS_PREFIX):
+                log.append(line)
+                continue
+            update = json.loads(line[len(PROGRESS_PREFIX):])
+            with self._lock:
+                job.update(update)
+                if update.get("stage") == "embedding":
+                    # Throughput over the embedding stage so far, and the time left at that rate
+                    now = time.time()
+                    if embedding_started is None:
+                        embedding_started = (now, update["chunks_embedded"])
+                    elapsed = now - embedding_started[0]
+                    embedded = update["chunks_embedded"] - embedding_started[1]
+                    if elapsed > 0 and embedded > 0:
+                        rate = embedded / elapsed
+                        job["embeddings_per_second"] = round(rate, 1)
+                        job["eta_seconds"] = round((update["chunks_total"] - update["chunks_embedded"]) / rate, 1)
+                elif update.get("stage") != "chunking":
+                    job["eta_seconds"] = None
+        returncode = process.wait()
+
+        with self._lock:
+            self._process = None
+            job["log"] = list(log)
+            if returncode == 0 and job.get("version"):
+                status = "succeeded"
+            elif job.get("cancel_requested"):
+                status = "cancelled"
+            else:
+                status = "failed"
+                job["error"] = log[-1] if log else f"build_index.py exited with code {returncode}"
+            self._finish(job, status)
+
+        if status == "succeeded" and self.on_published is not None:
+            self.on_published(job["version"])
+
+    def _finish(self, job: Dict[str, Any], status: str) -> None:
+        # Called with the lock held
+        job["status"] = status
+        job["finished_at"] = time.time()
+        job.pop("cancel_requested", None)
+        INDEX_JOBS.labels(status).inc()
+        self._prune()
+
+    def _prune(self) -> None:
+        # Called with the lock held; forget the oldest finished jobs
+        finished = [job_id for job_id, job in self._jobs.items() if job["finished_at"] is not None]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job_id]
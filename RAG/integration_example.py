@@ -3,6 +3,7 @@ import argparse
 import requests
 import json
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -64,7 +65,8 @@ def query_with_rag(query, max_tokens=1000, temperature=0.7, rag_enabled=True):
                 "max_tokens": max_tokens,
                 "temperature": temperature,
                 "top_p": 0.9,
-                "stop": ["Q:"]
+                "stop": ["Q:"],
+                "echo": False
             },
             timeout=60
         )
@@ -88,6 +90,76 @@ def query_with_rag(query, max_tokens=1000, temperature=0.7, rag_enabled=True):
         print(f"Error processing query: {str(e)}")
         return {"error": str(e)}
 
+def query_batch_with_rag(queries, max_tokens=1000, temperature=0.7, rag_enabled=True):
+    """
+    Process many queries with RAG context in a single batched LLaMA API call
+    
+    Args:
+        queries (list): User queries
+        max_tokens (int): Maximum tokens to generate
+        temperature (float): Temperature for generation
+        rag_enabled (bool): Whether to use RAG enhancement
+        
+    Returns:
+        dict: Response containing one result per query
+    """
+    print(f"Processing {len(queries)} queries in one batch")
+    
+    try:
+        # Step 1: Build the augmented prompt for each query
+        prompts = []
+        for query in queries:
+            rag_response = requests.post(
+                f"{RAG_API_URL}/rag/query",
+                json={
+                    "query": query,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "rag_enabled": rag_enabled
+                },
+                timeout=30
+            )
+            
+            if not rag_response.ok:
+                print(f"Error from RAG API: {rag_response.status_code}")
+                print(rag_response.text)
+                return {"error": f"RAG API error: {rag_response.status_code}"}
+            
+            prompts.append(rag_response.json().get("augmented_prompt", query))
+        
+        # Step 2: Send every prompt to the batched completions endpoint at once
+        llm_response = requests.post(
+            f"{LLAMA_API_URL}/v1/completions",
+            json={
+                "prompt": prompts,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "top_p": 0.9,
+                "stop": ["Q:"]
+            },
+            timeout=60 * len(prompts)
+        )
+        
+        if not llm_response.ok:
+            print(f"Error from LLaMA API: {llm_response.status_code}")
+            print(llm_response.text)
+            return {"error": f"LLaMA API error: {llm_response.status_code}"}
+        
+        llm_data = llm_response.json()
+        choices = sorted(llm_data.get("choices", []), key=lambda c: c["index"])
+        
+        return {
+            "results": [
+                {"query": query, "response": choice["text"]}
+                for query, choice in zip(queries, choices)
+            ],
+            "usage": llm_data.get("usage", {})
+        }
+        
+    except Exception as e:
+        print(f"Error processing batch: {str(e)}")
+        return {"error": str(e)}
+
 def add_document(file_path):
     """
     Add a document to the RAG system
@@ -116,12 +188,19 @@ def add_document(file_path):
         print(f"Error adding document: {str(e)}")
         return {"error": str(e)}
 
-def create_index():
+def create_index(wait=True, poll_interval=2.0):
     """
     Create or recreate the RAG index
     
+    The server builds the index in a background job; with wait, the job is
+    polled and its progress printed until it finishes.
+    
+    Args:
+        wait (bool): Wait for the build job to finish
+        poll_interval (float): Seconds between progress checks
+        
     Returns:
-        dict: Response from the RAG system
+        dict: The build job (or the submission response without wait)
     """
     try:
         response = requests.post(
@@ -129,15 +208,86 @@ def create_index():
             timeout=60
         )
         
-        if response.ok:
+        if not response.ok:
+            print(f"Error: {response.status_code}")
+            print(response.text)
+            return {"error": f"API error: {response.status_code}"}
+        if not wait:
             return response.json()
+        
+        job_id = response.json()["job_id"]
+        while True:
+            job = get_job(job_id)
+            if "error" in job and "status" not in job:
+                return job
+            progress = f"{job['status']}: {job['stage'] or 'waiting'}"
+            if job["documents_total"]:
+                progress += f", {job['documents_done']}/{job['documents_total']} documents"
+            if job["chunks_total"]:
+                progress += f", {job['chunks_embedded']}/{job['chunks_total']} chunks embedded"
+            if job["eta_seconds"] is not None:
+                progress += f", {job['embeddings_per_second']} chunks/s, ETA {job['eta_seconds']:.0f}s"
+            print(progress)
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(poll_interval)
+            
+    except Exception as e:
+        print(f"Error creating index: {str(e)}")
+        return {"error": str(e)}
+
+def get_job(job_id):
+    """
+    Get the progress of an index build job
+    
+    Args:
+        job_id (str): Job id returned when the build was started
+        
+    Returns:
+        dict: The job
+    """
+    try:
+        response = requests.get(
+            f"{RAG_API_URL}/rag/jobs/{job_id}",
+            timeout=30
+        )
+        
+        if response.ok:
+            return response.json()["job"]
         else:
             print(f"Error: {response.status_code}")
             print(response.text)
             return {"error": f"API error: {response.status_code}"}
             
     except Exception as e:
-        print(f"Error creating index: {str(e)}")
+        print(f"Error getting job: {str(e)}")
+        return {"error": str(e)}
+
+def cancel_job(job_id):
+    """
+    Cancel an index build job
+    
+    Args:
+        job_id (str): Job id returned when the build was started
+        
+    Returns:
+        dict: The job
+    """
+    try:
+        response = requests.post(
+            f"{RAG_API_URL}/rag/jobs/{job_id}/cancel",
+            timeout=30
+        )
+        
+        if response.ok:
+            return response.json()["job"]
+        else:
+            print(f"Error: {response.status_code}")
+            print(response.text)
+            return {"error": f"API error: {response.status_code}"}
+            
+    except Exception as e:
+        print(f"Error cancelling job: {str(e)}")
         return {"error": str(e)}
 
 def list_documents():
@@ -177,12 +327,24 @@ def main():
     query_parser.add_argument("--max-tokens", type=int, default=1000, help="Maximum tokens to generate")
     query_parser.add_argument("--temperature", type=float, default=0.7, help="Temperature for generation")
     
+    # Batch query command
+    batch_parser = subparsers.add_parser("batch-query", help="Process a file of queries (one per line) in one batch")
+    batch_parser.add_argument("file_path", help="Path to a text file with one query per line")
+    batch_parser.add_argument("--no-rag", action="store_true", help="Disable RAG enhancement")
+    batch_parser.add_argument("--max-tokens", type=int, default=1000, help="Maximum tokens to generate")
+    batch_parser.add_argument("--temperature", type=float, default=0.7, help="Temperature for generation")
+    
     # Add document command
     add_doc_parser = subparsers.add_parser("add-document", help="Add a document to the RAG index")
     add_doc_parser.add_argument("file_path", help="Path to the document file")
     
     # Create index command
-    subparsers.add_parser("create-index", help="Create or recreate the RAG index")
+    index_parser = subparsers.add_parser("create-index", help="Create or recreate the RAG index")
+    index_parser.add_argument("--no-wait", action="store_true", help="Start the build job and return")
+    
+    # Cancel index build command
+    cancel_parser = subparsers.add_parser("cancel-job", help="Cancel an index build job")
+    cancel_parser.add_argument("job_id", help="Job id printed by create-index")
     
     # List documents command
     subparsers.add_parser("list-documents", help="List all documents in the RAG index")
@@ -205,6 +367,25 @@ def main():
         else:
             print(f"Error: {result['error']}")
             
+    elif args.command == "batch-query":
+        with open(args.file_path, 'r', encoding='utf-8') as f:
+            queries = [line.strip() for line in f if line.strip()]
+        
+        result = query_batch_with_rag(
+            queries=queries,
+            max_tokens=args.max_tokens,
+            temperature=args.temperature,
+            rag_enabled=not args.no_rag
+        )
+        
+        if "error" not in result:
+            for item in result["results"]:
+                print(f"\nQ: {item['query']}")
+                print(f"A: {item['response']}")
+            print(f"\nUsage: {result['usage']}")
+        else:
+            print(f"Error: {result['error']}")
+            
     elif args.command == "add-document":
         result = add_document(args.file_path)
         
@@ -214,10 +395,20 @@ def main():
             print(f"Error: {result['error']}")
             
     elif args.command == "create-index":
-        result = create_index()
+        result = create_index(wait=not args.no_wait)
+        
+        if args.no_wait and "error" not in result:
+            print(f"Started index build job {result['job_id']}")
+        elif result.get("status") == "succeeded":
+            print(f"Success: index version {result['version']} published ({result['stats']['chunks_stored']} chunks)")
+        else:
+            print(f"Error: {result.get('error') or result.get('status')}")
+            
+    elif args.command == "cancel-job":
+        result = cancel_job(args.job_id)
         
         if "error" not in result:
-            print(f"Success: {result.get('message', 'Index created')}")
+            print(f"Job {result['id']}: {result['status']}")
         else:
             print(f"Error: {result['error']}")
             
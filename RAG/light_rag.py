@@ -2,18 +2,27 @@
 Lightweight RAG server that uses less memory
 """
 import os
-import json
 import glob
 import logging
 import traceback
+import time
 import numpy as np
 from fastapi import FastAPI, HTTPException, Body
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, NamedTuple, Optional
 import uvicorn
+from prometheus_client import Gauge
 from sentence_transformers import SentenceTransformer
 
+import metrics
+import tracing
+from utils.embeddings import EMBEDDED_TEXTS, EMBEDDING_SECONDS
+from utils.index_manifest import load_manifest
+from utils.index_versions import IndexWatcher, current_version, version_dir
+from utils.streaming_chunker import ChunkStore
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,6 +34,10 @@ logger = logging.getLogger("LightRAG")
 # Initialize FastAPI app
 app = FastAPI(title="Light RAG API")
 
+tracing.configure("light-rag")
+app.add_middleware(tracing.TraceMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Enable CORS
 app.add_middleware(
     CORSMiddleware,
@@ -38,10 +51,23 @@ app.add_middleware(
 current_dir = os.path.dirname(os.path.abspath(__file__))
 DOCUMENTS_DIR = os.path.join(current_dir, "documents")
 EMBEDDINGS_DIR = os.path.join(current_dir, "embeddings")
+RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", 5))
 EMBEDDING_MODEL = None
-DOCUMENT_INDEX = {}
-DOCUMENT_CHUNKS = []
-CHUNK_EMBEDDINGS = None
+
+class LoadedIndex(NamedTuple):
+    """One loaded index version; replaced as a whole when a new version is published"""
+    version: Optional[str] = None
+    chunks: Any = []  # ChunkStore, or chunk texts for indexes without spans
+    doc_ids: np.ndarray = np.zeros(0, dtype=np.int32)  # Document of each chunk
+    embeddings: Optional[np.ndarray] = None
+
+INDEX = LoadedIndex()
+
+# Metrics, exported on /metrics; the embedding ones are shared with utils.embeddings
+Gauge("rag_index_chunks", "Chunks in the RAG index").set_function(lambda: len(INDEX.chunks))
+Gauge("rag_index_embedding_bytes", "Memory held by the chunk embeddings").set_function(
+    lambda: INDEX.embeddings.nbytes if INDEX.embeddings is not None else 0
+)
 
 # Define request/response models
 class QueryRequest(BaseModel):
@@ -67,9 +93,9 @@ def chunk_text(text, chunk_size=512, chunk_overlap=128):
     
     return chunks
 
-def load_embeddings():
-    """Load embeddings and index if they exist"""
-    global DOCUMENT_INDEX, DOCUMENT_CHUNKS, CHUNK_EMBEDDINGS, EMBEDDING_MODEL
+def load_embeddings(version=None):
+    """Load the published index (or the given version) and swap it in"""
+    global INDEX, EMBEDDING_MODEL
     
     try:
         # Create embedding model
@@ -79,31 +105,31 @@ def load_embeddings():
             os.makedirs(cache_dir, exist_ok=True)
             EMBEDDING_MODEL = SentenceTransformer('all-MiniLM-L6-v2', cache_folder=cache_dir)
         
-        # Load index if it exists
-        index_path = os.path.join(EMBEDDINGS_DIR, "rag_index.json")
-        embeddings_path = os.path.join(EMBEDDINGS_DIR, "chunk_embeddings.npy")
+        # Load index if it exists (an unversioned index lives directly in EMBEDDINGS_DIR)
+        if version is None:
+            version = current_version(EMBEDDINGS_DIR)
+        index_dir = version_dir(EMBEDDINGS_DIR, version)
+        manifest = load_manifest(index_dir, migrate=version is None)
+        embeddings_path = os.path.join(index_dir, "chunk_embeddings.npy")
         
-        if os.path.exists(index_path) and os.path.exists(embeddings_path):
-            logger.info("Loading existing RAG index")
-            
-            with open(index_path, 'r') as f:
-                index_data = json.load(f)
-            
-            # Load document chunks
-            DOCUMENT_CHUNKS = []
-            for doc_meta in index_data["metadata"]:
-                with open(doc_meta["path"], 'r', encoding='utf-8') as f:
-                    content = f.read()
-                chunks = chunk_text(content)
-                DOCUMENT_CHUNKS.extend(chunks)
+        if manifest is not None and os.path.exists(embeddings_path):
+            logger.info(f"Loading RAG index version {version}")
             
-            # Load document index
-            DOCUMENT_INDEX = {int(k): v for k, v in index_data["document_index"].items()}
+            # Load document chunks: read lazily from the indexed spans when the index has them
+            if manifest.has_spans:
+                chunks = ChunkStore.from_manifest(manifest)
+            else:
+                chunks = []
+                for doc_meta in manifest.metadata:
+                    with open(doc_meta["path"], 'r', encoding='utf-8') as f:
+                        content = f.read()
+                    chunks.extend(chunk_text(content))
             
-            # Load embeddings
-            CHUNK_EMBEDDINGS = np.load(embeddings_path)
+            # Load embeddings, then swap the whole index in at once
+            index = LoadedIndex(version, chunks, manifest.doc_ids, np.load(embeddings_path))
+            INDEX = index
             
-            logger.info(f"Loaded {len(DOCUMENT_CHUNKS)} chunks and {CHUNK_EMBEDDINGS.shape[0]} embeddings")
+            logger.info(f"Loaded {len(index.chunks)} chunks and {index.embeddings.shape[0]} embeddings")
             return True
         else:
             logger.error("RAG index not found. Please run the diagnose_embedding.py script first.")
@@ -114,29 +140,44 @@ def load_embeddings():
         logger.error(traceback.format_exc())
         return False
 
+def reload_index(version):
+    """IndexWatcher callback: load a newly published version in the background"""
+    if version != INDEX.version:
+        load_embeddings(version)
+
+index_watcher = IndexWatcher(EMBEDDINGS_DIR, reload_index, interval=RELOAD_INTERVAL)
+
 def find_similar_chunks(query, top_k=3):
     """Find chunks similar to the query"""
-    if CHUNK_EMBEDDINGS is None or not DOCUMENT_CHUNKS:
+    index = INDEX  # A reload swaps INDEX; this query keeps the version it started with
+    if index.embeddings is None or not index.chunks:
         return []
     
-    query_embedding = EMBEDDING_MODEL.encode([query])[0]
+    with tracing.span("rag.embed_query"):
+        started = time.perf_counter()
+        query_embedding = EMBEDDING_MODEL.encode([query])[0]
+        EMBEDDING_SECONDS.labels("query").observe(time.perf_counter() - started)
+        EMBEDDED_TEXTS.labels("query").inc()
     
-    # Calculate similarities (dot product)
-    similarities = np.dot(CHUNK_EMBEDDINGS, query_embedding)
-    
-    # Get top k indices
-    top_indices = np.argsort(similarities)[-top_k:][::-1]
+    with tracing.span("rag.search", chunks=len(index.chunks), top_k=top_k):
+        # Calculate similarities (dot product)
+        similarities = np.dot(index.embeddings, query_embedding)
+        
+        # Get top k indices
+        top_indices = np.argsort(similarities)[-top_k:][::-1]
     
     results = []
     for idx in top_indices:
-        if idx < len(DOCUMENT_CHUNKS):
-            chunk_text = DOCUMENT_CHUNKS[idx]
-            doc_info = DOCUMENT_INDEX.get(idx, {"doc_idx": 0})
+        if idx < len(index.chunks):
+            chunk_text = index.chunks[idx]
+            if not chunk_text:
+                continue  # Source file gone or changed since indexing
+            doc_idx = int(index.doc_ids[idx]) if idx < len(index.doc_ids) else 0
             
             results.append({
                 "chunk": chunk_text,
                 "score": float(similarities[idx]),
-                "document": f"Document {doc_info['doc_idx']}"
+                "document": f"Document {doc_idx}"
             })
     
     return results
@@ -157,12 +198,20 @@ def startup_event():
     """Load embeddings on startup"""
     os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
     load_embeddings()
+    index_watcher.version = INDEX.version
+    if RELOAD_INTERVAL > 0:
+        index_watcher.start()
+
+@app.on_event("shutdown")
+def shutdown_event():
+    index_watcher.stop()
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    chunks_loaded = len(DOCUMENT_CHUNKS) > 0
-    embeddings_loaded = CHUNK_EMBEDDINGS is not None
+    index = INDEX
+    chunks_loaded = len(index.chunks) > 0
+    embeddings_loaded = index.embeddings is not None
     model_loaded = EMBEDDING_MODEL is not None
     
     return {
@@ -170,13 +219,27 @@ async def health_check():
         "chunks_loaded": chunks_loaded,
         "embeddings_loaded": embeddings_loaded,
         "model_loaded": model_loaded,
-        "num_chunks": len(DOCUMENT_CHUNKS) if chunks_loaded else 0
+        "num_chunks": len(index.chunks) if chunks_loaded else 0,
+        "index_version": index.version
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    return metrics.metrics_response()
+
+@app.get("/debug/trace/{trace_id}")
+async def debug_trace(trace_id: str, format: str = "text"):
+    spans = tracing.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"No spans recorded for trace {trace_id}")
+    if format == "json":
+        return {"trace_id": trace_id, "spans": spans}
+    return PlainTextResponse(tracing.render_waterfall(spans))
+
 @app.post("/rag/query", response_model=QueryResponse)
 async def query(request: QueryRequest):
     """Process a query with RAG"""
-    if CHUNK_EMBEDDINGS is None or not DOCUMENT_CHUNKS:
+    if INDEX.embeddings is None or not INDEX.chunks:
         if not load_embeddings():
             return {
                 "success": False,
@@ -0,0 +1,58 @@
+"""
+migrate_index.py
+Convert a rag_index.json index to the binary rag_index.bin manifest.
+
+RAGSystem and light_rag convert an old index automatically the first time
+they load it; this script does it ahead of time, e.g. for a large index
+that would otherwise stall the first server start.
+
+    python migrate_index.py                          # RAG/embeddings
+    python migrate_index.py --embeddings-dir /data/embeddings --remove-json
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utils.index_manifest import IndexManifest, MANIFEST_FILE, LEGACY_INDEX_FILE
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embeddings-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "embeddings"))
+    parser.add_argument("--force", action="store_true", help="overwrite an existing rag_index.bin")
+    parser.add_argument("--remove-json", action="store_true", help="delete rag_index.json once the manifest is verified")
+    args = parser.parse_args()
+
+    legacy_path = os.path.join(args.embeddings_dir, LEGACY_INDEX_FILE)
+    manifest_path = os.path.join(args.embeddings_dir, MANIFEST_FILE)
+    if not os.path.exists(legacy_path):
+        print(f"No {LEGACY_INDEX_FILE} in {args.embeddings_dir}")
+        return 1
+    if os.path.exists(manifest_path) and not args.force:
+        print(f"{manifest_path} already exists; use --force to overwrite it")
+        return 1
+
+    start = time.perf_counter()
+    manifest = IndexManifest.from_legacy_json(legacy_path)
+    manifest.save(manifest_path)
+    print(f"Converted {manifest.num_chunks} chunks from {len(manifest.metadata)} documents in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    reloaded = IndexManifest.load(manifest_path)
+    load_s = time.perf_counter() - start
+    if reloaded.num_chunks != manifest.num_chunks or not (reloaded.doc_ids == manifest.doc_ids).all():
+        print("Verification failed: the written manifest does not match the JSON index")
+        return 1
+    print(f"{manifest_path}: {os.path.getsize(manifest_path)} bytes (JSON: {os.path.getsize(legacy_path)} bytes), opens in {load_s * 1000:.1f} ms")
+
+    if args.remove_json:
+        del reloaded  # release the memory map before touching files
+        os.remove(legacy_path)
+        print(f"Removed {legacy_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,19 +1,31 @@
 import os
 import json
+import threading
 from fastapi import FastAPI, HTTPException, Body
 from pydantic import BaseModel
 from typing import List, Dict, Any, Optional
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 
 import sys
 # Add the parent directory to sys.path to find the rag_system module
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from rag_system import RAGSystem
+from index_jobs import IndexJobManager
+from utils.index_versions import IndexWatcher
+import metrics
+import tracing
+from prometheus_client import Counter, Gauge
 
 # Initialize FastAPI app
 app = FastAPI(title="RAG-Enabled LLaMA API")
 
+tracing.configure("rag")
+app.add_middleware(tracing.TraceMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -30,16 +42,100 @@ rag = RAGSystem(
     embedding_model_name="all-MiniLM-L6-v2",
     chunk_size=512,
     chunk_overlap=128,
-    top_k=3
+    top_k=3,
+    retrieval_mode=os.getenv("RAG_RETRIEVAL_MODE", "dense"),
+    candidate_pool=int(os.getenv("RAG_CANDIDATE_POOL", 200)),
+    context_token_budget=int(os.getenv("RAG_CONTEXT_TOKENS", 1024)),
+    tokenizer_path=os.getenv("RAG_TOKENIZER"),
+    deduplicate=os.getenv("RAG_DEDUPLICATE", "1") != "0",
+    dedup_threshold=float(os.getenv("RAG_DEDUP_THRESHOLD", 0.85))
 )
 
+# Pick up index versions published by other processes (diagnose_embedding.py, another server);
+# each is loaded on the watcher thread and swapped in, so queries never wait for it
+RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", 5))
+index_watcher = IndexWatcher(rag.embeddings_dir, rag.load_index, interval=RELOAD_INTERVAL, version=rag.index_version)
+
+@app.on_event("startup")
+def start_index_watcher():
+    if RELOAD_INTERVAL > 0:
+        index_watcher.start()
+
+@app.on_event("shutdown")
+def stop_index_watcher():
+    index_watcher.stop()
+
+# Documents added through /rag/document while a build job was queued or running. A job
+# publishes a version built from documents_dir alone, so these are added again on top of it.
+# The lock keeps an addition and its recording together, so a job cannot be queued or
+# publish in between.
+pending_documents: List[str] = []
+documents_lock = threading.Lock()
+
+def on_build_published(version: str) -> None:
+    with documents_lock:
+        rag.load_index(version)
+        indexed = {os.path.abspath(doc["path"]) for doc in rag.index.document_metadata}
+        missing = [path for path in pending_documents if os.path.abspath(path) not in indexed and os.path.exists(path)]
+        if missing:
+            # One new version for all of them; each addition rewrites the whole index
+            print(f"Re-adding {len(missing)} documents added while the index was being rebuilt")
+            rag.add_documents(missing)
+        if not index_jobs.active():
+            pending_documents.clear()
+
+def add_document_during_builds(path: str) -> bool:
+    with documents_lock:
+        if index_jobs.active():
+            pending_documents.append(path)
+        return rag.add_document(path)
+
+def submit_build() -> Dict[str, Any]:
+    # An addition in progress saw no job and is not recorded as pending; let it publish first
+    with documents_lock:
+        return index_jobs.submit()
+
+# Index builds run as background jobs in a worker process; the result is swapped in when published
+index_jobs = IndexJobManager(
+    [
+        "--documents-dir", rag.documents_dir,
+        "--embeddings-dir", rag.embeddings_dir,
+        "--embedding-model", rag.embedding_model.model_name,
+        "--chunk-size", str(rag.document_processor.chunk_size),
+        "--chunk-overlap", str(rag.document_processor.chunk_overlap),
+        "--dedup-threshold", str(rag.dedup_threshold),
+        *([] if rag.deduplicate else ["--no-dedup"])
+    ],
+    on_published=on_build_published
+)
+
+# Index size, exported on /metrics
+Gauge("rag_index_documents", "Documents in the RAG index").set_function(lambda: len(rag.document_metadata))
+Gauge("rag_index_chunks", "Chunks in the RAG index").set_function(lambda: len(rag.document_chunks))
+Gauge("rag_index_embedding_bytes", "Memory held by the chunk embeddings").set_function(
+    lambda: rag.chunk_embeddings.nbytes if rag.chunk_embeddings is not None else 0
+)
+
+# Context tokens per query, before packing (chunks verbatim) and after
+CONTEXT_TOKENS = Counter("rag_context_tokens_total", "Retrieved context tokens", ["stage"])
+
 # Define request models
+class RAGQueryFilters(BaseModel):
+    documents: Optional[List[str]] = None  # paths or filenames
+    directories: Optional[List[str]] = None  # includes subdirectories
+    extensions: Optional[List[str]] = None  # e.g. ".md" or "md"
+    modified_after: Optional[float] = None  # Unix seconds
+    modified_before: Optional[float] = None
+
 class RAGQueryRequest(BaseModel):
     query: str
     max_tokens: int = 1000
     temperature: float = 0.7
     top_p: float = 0.9
     rag_enabled: bool = True
+    retrieval_mode: Optional[str] = None  # "dense", "hybrid" or "candidates"; None -> server default
+    filters: Optional[RAGQueryFilters] = None
+    context_token_budget: Optional[int] = None  # None -> server default
 
 class DocumentUploadRequest(BaseModel):
     file_path: str
@@ -52,10 +148,12 @@ class RAGResponse(BaseModel):
 # Add simple health check route
 @app.get("/health")
 async def health_check():
+    index = rag.index
     return {
         "status": "ok",
-        "rag_documents": len(rag.document_metadata),
-        "rag_chunks": len(rag.document_chunks)
+        "rag_documents": len(index.document_metadata),
+        "rag_chunks": len(index.document_chunks),
+        "index_version": index.version
     }
 
 @app.post("/rag/query")
@@ -69,8 +167,16 @@ async def rag_query(request: RAGQueryRequest):
     try:
         if request.rag_enabled:
             # Use RAG to get context
-            results = rag.retrieve(request.query)
-            augmented_prompt = rag.generate_prompt(request.query, results)
+            filters = request.filters.dict(exclude_none=True) if request.filters else None
+            index = rag.index  # One snapshot for the whole request, even if a reload swaps it meanwhile
+            results = rag.retrieve(request.query, mode=request.retrieval_mode, filters=filters, index=index)
+            with tracing.span("rag.prompt", results=len(results)) as span:
+                augmented_prompt, context_stats = rag.build_prompt(
+                    request.query, results, token_budget=request.context_token_budget, index=index
+                )
+                span["attributes"]["tokens_saved"] = context_stats["tokens_saved"]
+            CONTEXT_TOKENS.labels("retrieved").inc(context_stats["tokens_before"])
+            CONTEXT_TOKENS.labels("packed").inc(context_stats["tokens_after"])
             
             # Format context documents for the response
             context_docs = []
@@ -78,13 +184,16 @@ async def rag_query(request: RAGQueryRequest):
                 context_docs.append({
                     "document": res["document"],
                     "score": res["score"],
-                    "snippet": res["chunk"][:200] + "..." if len(res["chunk"]) > 200 else res["chunk"]
+                    "snippet": res["chunk"][:200] + "..." if len(res["chunk"]) > 200 else res["chunk"],
+                    "also_in": sorted({dup["document"] for dup in res.get("duplicates", [])})
                 })
             
             return {
                 "success": True,
                 "augmented_prompt": augmented_prompt,
                 "context_documents": context_docs,
+                "context_stats": context_stats,
+                "index_version": index.version,
                 "original_query": request.query
             }
         else:
@@ -95,24 +204,55 @@ async def rag_query(request: RAGQueryRequest):
                 "context_documents": [],
                 "original_query": request.query
             }
+    except ValueError as e:
+        # e.g. an unknown retrieval_mode or filter
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error processing RAG query: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/rag/index")
+@app.post("/rag/index", status_code=202)
 async def create_index():
     """
-    Create or recreate the RAG index
+    Start a background job that creates or recreates the RAG index
+    
+    Poll GET /rag/jobs/{job_id} for progress. Queries are served from the
+    current index until the job publishes the new one.
     """
-    try:
-        rag.create_index()
-        return {
-            "success": True,
-            "message": f"RAG index created with {len(rag.document_chunks)} chunks from {len(rag.document_metadata)} documents"
-        }
-    except Exception as e:
-        print(f"Error creating RAG index: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    job = await run_in_threadpool(submit_build)
+    return {
+        "success": True,
+        "job_id": job["id"],
+        "status": job["status"],
+        "message": f"Index build {job['status']}; poll /rag/jobs/{job['id']} for progress"
+    }
+
+@app.get("/rag/jobs")
+async def list_jobs():
+    """
+    List index build jobs, newest first
+    """
+    return {"success": True, "jobs": index_jobs.list()}
+
+@app.get("/rag/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Progress of an index build job: stage, documents, chunks, embeddings/s and ETA
+    """
+    job = index_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return {"success": True, "job": job}
+
+@app.post("/rag/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    Cancel a queued or running index build job
+    """
+    job = index_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return {"success": True, "job": job}
 
 @app.post("/rag/document")
 async def add_document(request: DocumentUploadRequest):
@@ -127,8 +267,8 @@ async def add_document(request: DocumentUploadRequest):
         if not os.path.exists(request.file_path):
             raise HTTPException(status_code=404, detail=f"File not found: {request.file_path}")
             
-        # Add document to the index
-        success = rag.add_document(request.file_path)
+        # Add document to the index; a build job in progress gets it re-applied when it publishes
+        success = await run_in_threadpool(add_document_during_builds, request.file_path)
         
         if success:
             return {
@@ -137,6 +277,8 @@ async def add_document(request: DocumentUploadRequest):
             }
         else:
             raise HTTPException(status_code=500, detail="Failed to add document to index")
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error adding document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -148,7 +290,7 @@ async def list_documents():
     """
     try:
         documents = []
-        for doc in rag.document_metadata:
+        for doc in rag.index.document_metadata:
             documents.append({
                 "filename": doc["filename"],
                 "path": doc["path"],
@@ -164,6 +306,19 @@ async def list_documents():
         print(f"Error listing documents: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    return metrics.metrics_response()
+
+@app.get("/debug/trace/{trace_id}")
+async def debug_trace(trace_id: str, format: str = "text"):
+    spans = tracing.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"No spans recorded for trace {trace_id}")
+    if format == "json":
+        return {"trace_id": trace_id, "spans": spans}
+    return PlainTextResponse(tracing.render_waterfall(spans))
+
 if __name__ == "__main__":
     print("Starting the RAG-enabled LLaMA API server...")
     port = int(os.getenv("RAG_PORT", 8001))
@@ -1,16 +1,59 @@
 import os
-import json
+import threading
 import numpy as np
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Callable, NamedTuple, Optional, Tuple
 import glob
 from dotenv import load_dotenv
 
 from utils.embeddings import EmbeddingModel
 from utils.document_processor import DocumentProcessor
+from utils.bm25_index import BM25Index, reciprocal_rank_fusion
+from utils.chunk_metadata import ChunkMetadata, FILTER_FIELDS
+from utils.index_manifest import IndexManifest, MANIFEST_FILE, LEGACY_INDEX_FILE, load_manifest
+from utils.streaming_chunker import ChunkStore, file_signature, document_signature
+from utils.context_packer import ContextPacker, passage_header
+from utils.chunk_dedup import ChunkDeduplicator
+from utils.index_versions import current_version, version_dir, publish_version, link_into
+from utils.memory_governor import MemoryGovernor, MB
+import tracing
 
 # Load environment variables
 load_dotenv()
 
+RETRIEVAL_MODES = ("dense", "hybrid", "candidates")
+EMBED_BATCH_SIZE = 256  # Chunk texts materialized at a time while embedding
+# Above this share of the chunks, scoring all of them and masking out the rest is
+# cheaper than gathering the subset's embeddings into a copy first
+SUBSET_SCAN_FRACTION = 0.3
+
+# Files of one index version, next to the manifest
+EMBEDDINGS_FILE = "chunk_embeddings.npy"
+BM25_DIR = "bm25"
+CHUNK_METADATA_FILE = "chunk_metadata.npz"
+DEDUP_FILE = "chunk_dedup.npz"
+
+class IndexSnapshot(NamedTuple):
+    """
+    One loaded index version: everything a query reads
+
+    Snapshots are never modified once in use. Building or reloading an
+    index makes a new one and swaps RAGSystem.index, a single reference
+    assignment, so a query that took the old snapshot finishes on it and
+    never sees a half-updated index.
+    """
+    version: Optional[str] = None  # Published version it was loaded from or saved as
+    document_metadata: List[Dict[str, Any]] = []  # Metadata for each document
+    document_chunks: ChunkStore = ChunkStore.from_documents([], [])  # Chunk texts, read from the source files on demand
+    chunk_embeddings: Optional[np.ndarray] = None
+    chunk_doc_ids: np.ndarray = np.zeros(0, dtype=np.int32)  # Document (metadata position) of each chunk
+    bm25: Optional[BM25Index] = None  # Lexical index over the chunks
+    chunk_metadata: ChunkMetadata = ChunkMetadata()  # Per-chunk document attributes for filtering
+    deduplicator: Optional[ChunkDeduplicator] = None  # MinHash signatures and the sources of collapsed duplicates
+
+def _snapshot_field(name: str) -> property:
+    # Read-only view of a field of the current snapshot
+    return property(lambda self: getattr(self.index, name))
+
 class RAGSystem:
     """
     Retrieval-Augmented Generation system for enhancing LLM responses with relevant document context
@@ -22,7 +65,15 @@ class RAGSystem:
         embedding_model_name: str = "all-MiniLM-L6-v2",
         chunk_size: int = 512,
         chunk_overlap: int = 128,
-        top_k: int = 5
+        top_k: int = 5,
+        retrieval_mode: str = "dense",
+        candidate_pool: int = 200,
+        context_token_budget: int = 1024,
+        tokenizer_path: Optional[str] = None,
+        deduplicate: bool = True,
+        dedup_threshold: float = 0.85,
+        memory_budget_mb: Optional[float] = None,
+        load_existing: bool = True
     ):
         """
         Initialize the RAG system
@@ -34,7 +85,21 @@ class RAGSystem:
             chunk_size (int): Size of each document chunk in characters
             chunk_overlap (int): Overlap between consecutive chunks
             top_k (int): Number of relevant chunks to retrieve
+            retrieval_mode (str): "dense" (vectors only), "hybrid" (BM25 and dense
+                rankings fused) or "candidates" (dense scoring of BM25 candidates only)
+            candidate_pool (int): Results taken from each retriever before fusion,
+                or BM25 candidates scored densely
+            context_token_budget (int): Tokens of retrieved context allowed in a prompt
+            tokenizer_path (Optional[str]): Llama tokenizer used to count context tokens
+                (falls back to RAG_TOKENIZER, then to an estimate)
+            deduplicate (bool): Store near-duplicate chunks once, as extra sources of the first copy
+            dedup_threshold (float): Estimated Jaccard similarity at which chunks are near-duplicates
+            memory_budget_mb (Optional[float]): Target private resident memory while embedding an index; embedding
+                batches are then sized at runtime to fit it, else they hold EMBED_BATCH_SIZE chunks
+            load_existing (bool): Load the published index; off for a process that only builds one
         """
+        if retrieval_mode not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval_mode must be one of {RETRIEVAL_MODES}, got {retrieval_mode!r}")
         # Create directories if they don't exist
         self.documents_dir = documents_dir
         self.embeddings_dir = embeddings_dir
@@ -51,248 +116,561 @@ class RAGSystem:
         
         # Settings
         self.top_k = top_k
+        self.retrieval_mode = retrieval_mode
+        self.candidate_pool = candidate_pool
+        self.context_packer = ContextPacker(token_budget=context_token_budget, tokenizer_path=tokenizer_path)
+        self.deduplicate = deduplicate
+        self.dedup_threshold = dedup_threshold
+        self.memory_budget_mb = memory_budget_mb
         
-        # Storage for document data
-        self.document_chunks = []  # List of all document chunks
-        self.document_metadata = []  # Metadata for each document
-        self.chunk_embeddings = None  # Will be loaded or computed
-        self.document_index = {}  # Maps chunk indices to document indices
+        
+        # The index queries read; replaced as a whole, never modified in place
+        self.index = IndexSnapshot()
+        self.index_stats = {}  # Summary of the last index build
+        self._write_lock = threading.Lock()  # One index build or document add at a time
         
         # Load existing index if available
-        self.index_path = os.path.join(embeddings_dir, "rag_index.json")
-        if os.path.exists(self.index_path):
+        if load_existing:
             self.load_index()
     
-    def create_index(self) -> None:
+    # Fields of the current index snapshot
+    document_metadata = _snapshot_field("document_metadata")
+    document_chunks = _snapshot_field("document_chunks")
+    chunk_embeddings = _snapshot_field("chunk_embeddings")
+    chunk_doc_ids = _snapshot_field("chunk_doc_ids")
+    bm25 = _snapshot_field("bm25")
+    chunk_metadata = _snapshot_field("chunk_metadata")
+    deduplicator = _snapshot_field("deduplicator")
+    
+    @property
+    def index_version(self) -> Optional[str]:
+        return self.index.version
+    
+    def create_index(self, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> None:
         """
         Create an index of all documents in the documents directory
-        """
-        print(f"Creating RAG index from documents in {self.documents_dir}")
-        
-        # Process all documents
-        document_files = glob.glob(os.path.join(self.documents_dir, "**"), recursive=True)
-        document_files = [f for f in document_files if os.path.isfile(f)]
-        
-        self.document_chunks = []
-        self.document_metadata = []
-        self.document_index = {}
-        
-        # Process each document
-        for doc_idx, doc_path in enumerate(document_files):
-            try:
-                # Process document
-                doc_data = self.document_processor.process_document(doc_path)
-                
-                # Add document metadata
-                self.document_metadata.append({
-                    "filename": doc_data["filename"],
-                    "path": doc_data["path"],
-                    "doc_index": doc_idx,
-                    "num_chunks": doc_data["num_chunks"]
-                })
-                
-                # Add chunks and update index
-                for chunk_idx, chunk in enumerate(doc_data["chunks"]):
-                    global_chunk_idx = len(self.document_chunks)
-                    self.document_chunks.append(chunk)
-                    self.document_index[global_chunk_idx] = {
-                        "doc_idx": doc_idx,
-                        "chunk_idx": chunk_idx
-                    }
-                
-                print(f"Processed document: {doc_data['filename']} - {doc_data['num_chunks']} chunks")
-            except Exception as e:
-                print(f"Error processing document {doc_path}: {str(e)}")
+
+        The index is written as a new version and swapped in when complete;
+        queries keep using the previous one until then.
         
-        # Create embeddings for all chunks
-        if self.document_chunks:
-            print(f"Creating embeddings for {len(self.document_chunks)} chunks...")
-            self.chunk_embeddings = self.embedding_model.embed_texts(self.document_chunks)
+        Args:
+            progress (Optional[Callable[[Dict[str, Any]], None]]): Called with a "stage"
+                ("chunking", "embedding", "indexing", "publishing") and counters as the
+                build advances. An exception it raises aborts the build; nothing is published
+        """
+        report = progress or (lambda update: None)
+        with self._write_lock:
+            print(f"Creating RAG index from documents in {self.documents_dir}")
             
-            # Save embeddings
-            embeddings_path = os.path.join(self.embeddings_dir, "chunk_embeddings.npy")
-            self.embedding_model.save_embeddings(self.chunk_embeddings, embeddings_path)
+            # Process all documents
+            document_files = glob.glob(os.path.join(self.documents_dir, "**"), recursive=True)
+            document_files = [f for f in document_files if os.path.isfile(f)]
             
-            # Save index mapping
-            with open(self.index_path, 'w') as f:
-                index_data = {
-                    "metadata": self.document_metadata,
-                    "document_index": self.document_index,
-                    "embedding_model": self.embedding_model.model_name,
-                    "chunk_size": self.document_processor.chunk_size,
-                    "chunk_overlap": self.document_processor.chunk_overlap,
-                    "num_chunks": len(self.document_chunks)
-                }
-                json.dump(index_data, f, indent=2)
+            document_metadata = []
+            deduplicator = ChunkDeduplicator(threshold=self.dedup_threshold) if self.deduplicate else None
+            document_spans = []
+            total_chunks = 0
             
-            print(f"RAG index created successfully with {len(self.document_chunks)} chunks from {len(document_files)} documents")
-        else:
-            print("No documents found or processed")
+            # Process each document
+            for doc_idx, doc_path in enumerate(document_files):
+                try:
+                    # Chunk the document as byte spans; the text stays in the file
+                    signature = file_signature(doc_path)
+                    spans = self.document_processor.chunk_file(doc_path)
+                    total_chunks += len(spans)
+                    spans = self._drop_duplicates(deduplicator, len(document_metadata), doc_path, spans)
+                    
+                    # Add document metadata
+                    document_metadata.append({
+                        "filename": os.path.basename(doc_path),
+                        "path": doc_path,
+                        "doc_index": doc_idx,
+                        "num_chunks": len(spans),
+                        **signature
+                    })
+                    document_spans.append(spans)
+                    
+                    print(f"Processed document: {os.path.basename(doc_path)} - {len(spans)} chunks")
+                except Exception as e:
+                    print(f"Error processing document {doc_path}: {str(e)}")
+                report({"stage": "chunking", "documents_done": doc_idx + 1, "documents_total": len(document_files), "chunks": total_chunks})
+            
+            document_chunks = ChunkStore.from_documents(
+                [doc["path"] for doc in document_metadata],
+                document_spans,
+                [document_signature(doc) for doc in document_metadata]
+            )
+            
+            # Create embeddings for all chunks
+            if document_chunks:
+                print(f"Creating embeddings for {len(document_chunks)} chunks...")
+                chunk_embeddings = self._embed_chunks(document_chunks, report)
+                report({"stage": "indexing", "chunks_total": len(document_chunks)})
+                snapshot = IndexSnapshot(
+                    document_metadata=document_metadata,
+                    document_chunks=document_chunks,
+                    chunk_embeddings=chunk_embeddings,
+                    bm25=BM25Index().build(document_chunks),
+                    chunk_metadata=ChunkMetadata.from_documents(document_metadata),
+                    deduplicator=deduplicator
+                )
+                report({"stage": "publishing", "chunks_total": len(document_chunks)})
+                version = self.save_index(snapshot)
+                
+                duplicates = total_chunks - len(document_chunks)
+                self.index_stats = {
+                    "version": version,
+                    "documents": len(document_metadata),
+                    "chunks_total": total_chunks,
+                    "chunks_stored": len(document_chunks),
+                    "duplicates": duplicates,
+                    "dedup_ratio": round(duplicates / total_chunks, 4) if total_chunks else 0.0
+                }
+                print(f"RAG index version {version} created successfully with {len(document_chunks)} chunks from {len(document_files)} documents")
+                print(f"Deduplication: {duplicates} of {total_chunks} chunks ({self.index_stats['dedup_ratio']:.1%}) were near-duplicates stored once")
+            else:
+                print("No documents found or processed")
     
-    def load_index(self) -> None:
+    def _drop_duplicates(self, deduplicator: Optional[ChunkDeduplicator], doc_id: int, doc_path: str, spans: np.ndarray) -> np.ndarray:
         """
-        Load the existing index from disk
+        Register a new document's chunks with the deduplicator and keep only those not seen before
+        """
+        if deduplicator is None or not len(spans):
+            return spans
+        chunks = ChunkStore.from_documents([doc_path], [spans])
+        keep = np.array([
+            deduplicator.add(text, doc_id, int(start), int(end)) is None
+            for text, (start, end) in zip(chunks, spans)
+        ], dtype=bool)
+        chunks.close()
+        return spans[keep]
+    
+    def _embed_chunks(self, chunks: ChunkStore, progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> np.ndarray:
         """
-        print("Loading existing RAG index...")
+        Embed chunk texts a batch at a time, so only one batch is held as strings
+        """
+        if self.memory_budget_mb:
+            governor = MemoryGovernor(int(self.memory_budget_mb * MB), max_batch_size=EMBED_BATCH_SIZE * 4)
+            ranges = governor.batches(len(chunks))
+        else:
+            ranges = ((start, min(start + EMBED_BATCH_SIZE, len(chunks))) for start in range(0, len(chunks), EMBED_BATCH_SIZE))
+        # Written batch by batch, so the result is never held twice (as batches and stacked)
+        embeddings = np.empty((len(chunks), self.embedding_model.embedding_dim), dtype=np.float32)
+        embedded = 0
+        for start, end in ranges:
+            if progress is not None:
+                progress({"stage": "embedding", "chunks_embedded": embedded, "chunks_total": len(chunks)})
+            embeddings[start:end] = self.embedding_model.embed_texts(chunks[start:end])
+            embedded = end
+        if progress is not None:
+            progress({"stage": "embedding", "chunks_embedded": embedded, "chunks_total": len(chunks)})
+        return embeddings
+    
+    def save_index(self, snapshot: Optional[IndexSnapshot] = None, link_from: Optional[IndexSnapshot] = None) -> str:
+        """
+        Write an index as a new version, publish it and make it the one queries use
         
-        try:
-            # Load index mapping
-            with open(self.index_path, 'r') as f:
-                index_data = json.load(f)
-            
-            self.document_metadata = index_data["metadata"]
-            self.document_index = {int(k): v for k, v in index_data["document_index"].items()}
+        Args:
+            snapshot (Optional[IndexSnapshot]): Index to write; defaults to the current one
+            link_from (Optional[IndexSnapshot]): Published snapshot this one was derived from; the
+                embeddings and lexical index, when they are the very same objects, are hard-linked
+                from its version instead of written again
             
-            # Verify embedding model compatibility
-            if index_data.get("embedding_model") != self.embedding_model.model_name:
-                print(f"Warning: Current embedding model ({self.embedding_model.model_name}) differs from the one used to create the index ({index_data.get('embedding_model')})")
-                
-            # Load embeddings
-            embeddings_path = os.path.join(self.embeddings_dir, "chunk_embeddings.npy")
-            if os.path.exists(embeddings_path):
-                self.chunk_embeddings = self.embedding_model.load_embeddings(embeddings_path)
-                
-                # Verify dimensions
-                if self.chunk_embeddings.shape[0] != index_data.get("num_chunks", 0):
-                    print(f"Warning: Number of embeddings ({self.chunk_embeddings.shape[0]}) doesn't match number of chunks in index ({index_data.get('num_chunks', 0)})")
+        Returns:
+            str: The published version
+        """
+        if snapshot is None:
+            snapshot = self.index
+        source_dir = version_dir(self.embeddings_dir, link_from.version) if link_from is not None and link_from.version else None
+        
+        def unchanged(field: str, file_name: str) -> bool:
+            return (
+                source_dir is not None
+                and getattr(snapshot, field) is getattr(link_from, field)
+                and os.path.exists(os.path.join(source_dir, file_name))
+            )
+        
+        with publish_version(self.embeddings_dir) as (index_dir, version):
+            if unchanged("chunk_embeddings", EMBEDDINGS_FILE):
+                link_into(os.path.join(source_dir, EMBEDDINGS_FILE), os.path.join(index_dir, EMBEDDINGS_FILE))
             else:
-                print(f"Error: Embeddings file not found at {embeddings_path}")
-                self.chunk_embeddings = None
+                self.embedding_model.save_embeddings(snapshot.chunk_embeddings, os.path.join(index_dir, EMBEDDINGS_FILE))
             
-            # Load document chunks
-            self.document_chunks = []
-            for doc_meta in self.document_metadata:
-                try:
-                    doc_data = self.document_processor.process_document(doc_meta["path"])
-                    self.document_chunks.extend(doc_data["chunks"])
-                except Exception as e:
-                    print(f"Error loading document {doc_meta['path']}: {str(e)}")
+            # Chunks are stored document by document, so the mapping follows from the metadata
+            manifest = IndexManifest.from_documents(
+                snapshot.document_metadata,
+                starts=snapshot.document_chunks.starts,
+                ends=snapshot.document_chunks.ends,
+                embedding_model=self.embedding_model.model_name,
+                chunk_size=self.document_processor.chunk_size,
+                chunk_overlap=self.document_processor.chunk_overlap
+            )
+            manifest.save(os.path.join(index_dir, MANIFEST_FILE))
             
-            print(f"RAG index loaded successfully with {len(self.document_chunks)} chunks from {len(self.document_metadata)} documents")
+            if snapshot.bm25 is not None and unchanged("bm25", BM25_DIR):
+                link_into(os.path.join(source_dir, BM25_DIR), os.path.join(index_dir, BM25_DIR))
+            elif snapshot.bm25 is not None:
+                snapshot.bm25.save(os.path.join(index_dir, BM25_DIR))
+            snapshot.chunk_metadata.save(os.path.join(index_dir, CHUNK_METADATA_FILE))
+            if snapshot.deduplicator is not None:
+                snapshot.deduplicator.save(os.path.join(index_dir, DEDUP_FILE))
+        
+        self.index = snapshot._replace(version=version, chunk_doc_ids=manifest.doc_ids)
+        return version
+    
+    def load_index(self, version: Optional[str] = None) -> bool:
+        """
+        Load a published index version and swap it in
+        
+        The new version is read completely before the swap, so this can run
+        on a background thread while queries are served from the current one.
+        If it cannot be loaded, the current index stays in place.
+        
+        Args:
+            version (Optional[str]): Version to load; defaults to the published one
             
+        Returns:
+            bool: True if a new version was swapped in
+        """
+        if version is None:
+            version = current_version(self.embeddings_dir)
+        if version is not None and version == self.index.version:
+            return False
+        index_dir = version_dir(self.embeddings_dir, version)
+        if not (os.path.exists(os.path.join(index_dir, MANIFEST_FILE)) or os.path.exists(os.path.join(index_dir, LEGACY_INDEX_FILE))):
+            return False
+        
+        print(f"Loading RAG index version {version}..." if version else "Loading existing RAG index...")
+        try:
+            snapshot, repaired = self._read_index(index_dir, version)
         except Exception as e:
             print(f"Error loading RAG index: {str(e)}")
-            # Initialize empty
-            self.document_chunks = []
-            self.document_metadata = []
-            self.document_index = {}
-            self.chunk_embeddings = None
+            return False
+        self.index = snapshot
+        print(f"RAG index loaded successfully with {len(snapshot.document_chunks)} chunks from {len(snapshot.document_metadata)} documents")
+        
+        # Derived files were missing or stale (or the index predates versions): publish the repaired index,
+        # unless another version was published in the meantime
+        if repaired and snapshot.chunk_embeddings is not None:
+            with self._write_lock:
+                if self.index is snapshot and current_version(self.embeddings_dir) == version:
+                    print(f"Saving RAG index version {self.save_index(snapshot)} with the rebuilt files")
+        return True
+    
+    def _read_index(self, index_dir: str, version: Optional[str]) -> Tuple[IndexSnapshot, bool]:
+        """
+        Read the files of one index version, rebuilding any derived file that is missing or stale
+        
+        Returns:
+            Tuple[IndexSnapshot, bool]: The index, and whether anything had to be rebuilt
+        """
+        repaired = version is None
+        
+        # Load index mapping (an old rag_index.json is converted when the repaired index is published)
+        manifest = load_manifest(index_dir, migrate=False)
+        document_metadata = manifest.metadata
+        
+        # Verify embedding model compatibility
+        if manifest.embedding_model != self.embedding_model.model_name:
+            print(f"Warning: Current embedding model ({self.embedding_model.model_name}) differs from the one used to create the index ({manifest.embedding_model})")
+            
+        # Load embeddings
+        embeddings_path = os.path.join(index_dir, EMBEDDINGS_FILE)
+        chunk_embeddings = None
+        if os.path.exists(embeddings_path):
+            chunk_embeddings = self.embedding_model.load_embeddings(embeddings_path)
+            
+            # Verify dimensions
+            if chunk_embeddings.shape[0] != manifest.num_chunks:
+                print(f"Warning: Number of embeddings ({chunk_embeddings.shape[0]}) doesn't match number of chunks in index ({manifest.num_chunks})")
+        else:
+            print(f"Error: Embeddings file not found at {embeddings_path}")
+        
+        # Load document chunks: the saved spans, or re-chunk the files for indexes saved without them
+        paths = [doc_meta["path"] for doc_meta in document_metadata]
+        if manifest.has_spans:
+            document_chunks = ChunkStore.from_manifest(manifest)
+        else:
+            document_spans = []
+            for path in paths:
+                try:
+                    document_spans.append(self.document_processor.chunk_file(path))
+                except Exception as e:
+                    print(f"Error loading document {path}: {str(e)}")
+                    document_spans.append(np.zeros((0, 2), dtype=np.int64))
+            document_chunks = ChunkStore.from_documents(paths, document_spans)
+            repaired = True
+        
+        # Lexical index: memory-map the saved one, or build it for indexes created before BM25
+        bm25 = None
+        bm25_dir = os.path.join(index_dir, BM25_DIR)
+        if BM25Index.exists(bm25_dir):
+            bm25 = BM25Index.load(bm25_dir)
+            if bm25.num_docs != len(document_chunks):
+                print(f"Warning: BM25 index covers {bm25.num_docs} chunks, rebuilding for {len(document_chunks)}")
+                bm25 = None
+        if bm25 is None and document_chunks:
+            bm25 = BM25Index().build(document_chunks)
+            repaired = True
+        
+        # Filter columns, built from the document metadata for indexes created before them
+        chunk_metadata = ChunkMetadata()
+        chunk_metadata_path = os.path.join(index_dir, CHUNK_METADATA_FILE)
+        if os.path.exists(chunk_metadata_path):
+            chunk_metadata = ChunkMetadata.load(chunk_metadata_path)
+        if chunk_metadata.num_chunks != len(document_chunks):
+            chunk_metadata = ChunkMetadata.from_documents(document_metadata)
+            repaired = True
+        
+        # Duplicate sources, and signatures to deduplicate documents added later
+        deduplicator = None
+        dedup_path = os.path.join(index_dir, DEDUP_FILE)
+        if self.deduplicate and os.path.exists(dedup_path):
+            deduplicator = ChunkDeduplicator.load(dedup_path)
+            if deduplicator.num_stored != len(document_chunks):
+                print(f"Warning: deduplication data covers {deduplicator.num_stored} chunks, not {len(document_chunks)}; ignoring it")
+                deduplicator = None
+        
+        snapshot = IndexSnapshot(
+            version=version,
+            document_metadata=document_metadata,
+            document_chunks=document_chunks,
+            chunk_embeddings=chunk_embeddings,
+            chunk_doc_ids=manifest.doc_ids,
+            bm25=bm25,
+            chunk_metadata=chunk_metadata,
+            deduplicator=deduplicator
+        )
+        return snapshot, repaired
     
     def add_document(self, doc_path: str) -> bool:
         """
         Add a single document to the index
         
+        A new index version is written with the document added and swapped
+        in; queries keep using the current one until then. Each call writes
+        the whole index again (see add_documents), so add many files with
+        one add_documents call, or rebuild the index.
+        
         Args:
             doc_path (str): Path to the document
             
         Returns:
             bool: True if successful, False otherwise
         """
-        try:
-            # Process document
-            doc_data = self.document_processor.process_document(doc_path)
-            
-            # Get document metadata
-            doc_idx = len(self.document_metadata)
-            doc_metadata = {
-                "filename": doc_data["filename"],
-                "path": doc_data["path"],
-                "doc_index": doc_idx,
-                "num_chunks": doc_data["num_chunks"]
-            }
-            
-            # Create embeddings for the chunks
-            new_chunk_embeddings = self.embedding_model.embed_texts(doc_data["chunks"])
-            
-            # Update storage
-            self.document_metadata.append(doc_metadata)
-            
-            # Update document index
-            start_chunk_idx = len(self.document_chunks)
-            for chunk_idx, chunk in enumerate(doc_data["chunks"]):
-                global_chunk_idx = start_chunk_idx + chunk_idx
-                self.document_chunks.append(chunk)
-                self.document_index[global_chunk_idx] = {
-                    "doc_idx": doc_idx,
-                    "chunk_idx": chunk_idx
-                }
-            
-            # Update embeddings
-            if self.chunk_embeddings is None:
-                self.chunk_embeddings = new_chunk_embeddings
-            else:
-                self.chunk_embeddings = np.vstack([self.chunk_embeddings, new_chunk_embeddings])
-            
-            # Save updated embeddings
-            embeddings_path = os.path.join(self.embeddings_dir, "chunk_embeddings.npy")
-            self.embedding_model.save_embeddings(self.chunk_embeddings, embeddings_path)
+        return len(self.add_documents([doc_path])) == 1
+    
+    def add_documents(self, doc_paths: List[str]) -> List[str]:
+        """
+        Add documents to the index as one new version
+        
+        Only the new documents are chunked and embedded, but the version is
+        a complete copy: the embeddings are appended to a copy of the current
+        ones and the lexical index is rebuilt, so the cost of every call
+        grows with the size of the index. Batching additions pays that once.
+        Files that stay the same (no new chunks survive deduplication) are
+        hard-linked from the current version. A document that cannot be
+        read is skipped.
+        
+        Args:
+            doc_paths (List[str]): Paths of the documents
             
-            # Save updated index
-            with open(self.index_path, 'w') as f:
-                index_data = {
-                    "metadata": self.document_metadata,
-                    "document_index": self.document_index,
-                    "embedding_model": self.embedding_model.model_name,
-                    "chunk_size": self.document_processor.chunk_size,
-                    "chunk_overlap": self.document_processor.chunk_overlap,
-                    "num_chunks": len(self.document_chunks)
-                }
-                json.dump(index_data, f, indent=2)
+        Returns:
+            List[str]: The paths that were added
+        """
+        with self._write_lock:
+            current = self.index
+            deduplicator = current.deduplicator.copy() if current.deduplicator is not None else None
+            added, added_metadata, added_spans, added_signatures = [], [], [], []
+            for doc_path in doc_paths:
+                try:
+                    # Chunk the document as byte spans, leaving out near-duplicates of stored chunks
+                    doc_idx = len(current.document_metadata) + len(added)
+                    signature = file_signature(doc_path)
+                    spans = self._drop_duplicates(deduplicator, doc_idx, doc_path, self.document_processor.chunk_file(doc_path))
+                except Exception as e:
+                    print(f"Error adding document {doc_path}: {str(e)}")
+                    continue
+                added.append(doc_path)
+                added_metadata.append({
+                    "filename": os.path.basename(doc_path),
+                    "path": doc_path,
+                    "doc_index": doc_idx,
+                    "num_chunks": len(spans),
+                    **signature
+                })
+                added_spans.append(spans)
+                added_signatures.append(signature)
+            if not added:
+                return []
             
-            print(f"Added document: {doc_data['filename']} with {doc_data['num_chunks']} chunks")
-            return True
+            try:
+                # Create embeddings for the new chunks only
+                new_chunks = ChunkStore.from_documents(added, added_spans, added_signatures)
+                num_new_chunks = len(new_chunks)
+                new_chunk_embeddings = self._embed_chunks(new_chunks)
+                new_chunks.close()
+                
+                # Extend copies of the current index; save_index() extends the chunk-to-document mapping
+                document_chunks = current.document_chunks.with_document(added[0], added_spans[0], added_signatures[0])
+                for doc_path, spans, signature in zip(added[1:], added_spans[1:], added_signatures[1:]):
+                    document_chunks.add_document(doc_path, spans, signature)
+                chunk_embeddings, bm25 = current.chunk_embeddings, current.bm25
+                if chunk_embeddings is None:
+                    chunk_embeddings = new_chunk_embeddings
+                elif num_new_chunks:
+                    chunk_embeddings = np.concatenate([chunk_embeddings, new_chunk_embeddings])
+                if num_new_chunks or bm25 is None:
+                    # Posting lists are packed per term, so the lexical index is rebuilt rather than appended to
+                    bm25 = BM25Index().build(document_chunks)
+                chunk_metadata = current.chunk_metadata.copy()
+                chunk_metadata.add_documents(added, [len(spans) for spans in added_spans])
+                
+                self.save_index(IndexSnapshot(
+                    document_metadata=current.document_metadata + added_metadata,
+                    document_chunks=document_chunks,
+                    chunk_embeddings=chunk_embeddings,
+                    bm25=bm25,
+                    chunk_metadata=chunk_metadata,
+                    deduplicator=deduplicator
+                ), link_from=current)
+            except Exception as e:
+                print(f"Error adding documents {added}: {str(e)}")
+                return []
             
-        except Exception as e:
-            print(f"Error adding document {doc_path}: {str(e)}")
-            return False
+            for doc_metadata in added_metadata:
+                print(f"Added document: {doc_metadata['filename']} with {doc_metadata['num_chunks']} chunks")
+            return added
     
-    def retrieve(self, query: str) -> List[Dict[str, Any]]:
+    def _dense_search(self, chunk_embeddings: np.ndarray, query_embedding: np.ndarray, top_k: int, subset: Optional[np.ndarray] = None) -> List[Dict[str, Any]]:
+        """
+        Cosine-score all chunks, or only the chunk indices in subset
+        """
+        if subset is None:
+            return self.embedding_model.similarity_search(query_embedding, chunk_embeddings, top_k=top_k)
+        if len(subset) > SUBSET_SCAN_FRACTION * len(chunk_embeddings):
+            mask = np.zeros(len(chunk_embeddings), dtype=bool)
+            mask[subset] = True
+            return self.embedding_model.similarity_search(query_embedding, chunk_embeddings, top_k=top_k, mask=mask)
+        hits = self.embedding_model.similarity_search(query_embedding, chunk_embeddings[subset], top_k=top_k)
+        return [{"index": int(subset[item["index"]]), "score": item["score"]} for item in hits]
+    
+    def retrieve(
+        self,
+        query: str,
+        mode: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None,
+        index: Optional[IndexSnapshot] = None
+    ) -> List[Dict[str, Any]]:
         """
         Retrieve relevant document chunks for a query
         
         Args:
             query (str): User query
+            mode (Optional[str]): Override the retrieval mode for this query
+            filters (Optional[Dict[str, Any]]): Keyword arguments for ChunkMetadata.mask
+                (documents, directories, extensions, modified_after, modified_before)
+            index (Optional[IndexSnapshot]): Snapshot to search; defaults to the current one.
+                Pass the same snapshot to build_prompt so a reload in between cannot mix versions
             
         Returns:
             List[Dict[str, Any]]: List of relevant chunks with metadata
         """
-        if not self.document_chunks or self.chunk_embeddings is None:
+        if index is None:
+            index = self.index
+        if not index.document_chunks or index.chunk_embeddings is None:
             print("No documents indexed. Please create an index first.")
             return []
         
+        mode = mode or self.retrieval_mode
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"retrieval_mode must be one of {RETRIEVAL_MODES}, got {mode!r}")
+        if index.bm25 is None:
+            mode = "dense"
+        
+        # Restrict the search to the chunks that pass the filters, before any scoring
+        mask, allowed = None, None
+        if filters:
+            with tracing.span("rag.filter", filters=sorted(filters)) as span:
+                unknown = set(filters) - set(FILTER_FIELDS)
+                if unknown:
+                    raise ValueError(f"Unknown filters {sorted(unknown)}; expected some of {FILTER_FIELDS}")
+                mask = index.chunk_metadata.mask(**filters)
+                if index.deduplicator is not None and index.deduplicator.num_duplicates:
+                    # A stored chunk also passes when one of its collapsed duplicates came from a passing document
+                    doc_mask = index.chunk_metadata.document_mask(**filters)
+                    mask[index.deduplicator.stored_for_documents(doc_mask)] = True
+                allowed = np.flatnonzero(mask[:len(index.chunk_embeddings)])
+                span["attributes"]["allowed"] = len(allowed)
+            if not len(allowed):
+                return []
+        
         # Embed the query
-        query_embedding = self.embedding_model.embed_query(query)
+        with tracing.span("rag.embed_query"):
+            query_embedding = self.embedding_model.embed_query(query)
+        
+        # Lexical candidates for the hybrid modes
+        lexical_ids = np.zeros(0, dtype=np.int64)
+        if mode != "dense":
+            with tracing.span("rag.bm25", pool=self.candidate_pool) as span:
+                lexical_ids, _ = index.bm25.search(query, top_k=self.candidate_pool, mask=mask)
+                span["attributes"]["matched"] = len(lexical_ids)
         
         # Find similar chunks
-        similar_chunks = self.embedding_model.similarity_search(
-            query_embedding, 
-            self.chunk_embeddings, 
-            top_k=self.top_k
-        )
+        searched = len(allowed) if allowed is not None else len(index.document_chunks)
+        with tracing.span("rag.search", chunks=searched, top_k=self.top_k, mode=mode):
+            if mode == "candidates" and len(lexical_ids):
+                # Dense-score only the chunks that share a term with the query
+                similar_chunks = self._dense_search(index.chunk_embeddings, query_embedding, self.top_k, subset=lexical_ids)
+            elif mode == "hybrid" and len(lexical_ids):
+                dense = self._dense_search(index.chunk_embeddings, query_embedding, self.candidate_pool, subset=allowed)
+                fused = reciprocal_rank_fusion([lexical_ids, [item["index"] for item in dense]])
+                similar_chunks = [{"index": idx, "score": score} for idx, score in fused[:self.top_k]]
+            else:
+                # Dense mode, or no query term is in the lexical index
+                similar_chunks = self._dense_search(index.chunk_embeddings, query_embedding, self.top_k, subset=allowed)
         
         # Fetch the chunk text and metadata
         results = []
         for item in similar_chunks:
             chunk_idx = item["index"]
             
-            if chunk_idx < len(self.document_chunks):
-                chunk_text = self.document_chunks[chunk_idx]
+            if chunk_idx < len(index.document_chunks):
+                chunk_text = index.document_chunks[chunk_idx]
+                if index.document_chunks.is_stale(int(index.document_chunks.doc_ids[chunk_idx])):
+                    continue  # The file changed after indexing; the span no longer points at this chunk
                 
                 # Get document metadata
-                if chunk_idx in self.document_index:
-                    doc_idx = self.document_index[chunk_idx]["doc_idx"]
-                    if doc_idx < len(self.document_metadata):
-                        doc_metadata = self.document_metadata[doc_idx]
+                if chunk_idx < len(index.chunk_doc_ids):
+                    doc_idx = int(index.chunk_doc_ids[chunk_idx])
+                    if doc_idx < len(index.document_metadata):
+                        doc_metadata = index.document_metadata[doc_idx]
                         
                         results.append({
                             "chunk": chunk_text,
                             "score": item["score"],
                             "document": doc_metadata["filename"],
-                            "path": doc_metadata["path"]
+                            "path": doc_metadata["path"],
+                            "doc_id": doc_idx,
+                            "start": int(index.document_chunks.starts[chunk_idx]),
+                            "end": int(index.document_chunks.ends[chunk_idx]),
+                            "duplicates": self._duplicate_sources(index, chunk_idx)
                         })
         
         return results
     
+    def _duplicate_sources(self, index: IndexSnapshot, chunk_idx: int) -> List[Dict[str, Any]]:
+        """
+        Documents holding collapsed near-duplicates of a stored chunk
+        """
+        if index.deduplicator is None:
+            return []
+        return [
+            {"document": index.document_metadata[doc_id]["filename"], "path": index.document_metadata[doc_id]["path"], "start": start, "end": end}
+            for doc_id, start, end in index.deduplicator.sources(chunk_idx)
+            if doc_id < len(index.document_metadata)
+        ]
+    
     def generate_prompt(self, query: str, results: List[Dict[str, Any]]) -> str:
         """
         Generate a prompt with retrieved context for the LLM
@@ -304,18 +682,44 @@ class RAGSystem:
         Returns:
             str: Prompt with context for the LLM
         """
+        prompt, _ = self.build_prompt(query, results)
+        return prompt
+    
+    def build_prompt(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        token_budget: Optional[int] = None,
+        index: Optional[IndexSnapshot] = None
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Generate a prompt with retrieved context, packed under a token budget
+        
+        Overlapping chunks of the same document are merged, near-duplicate
+        passages dropped, and the rest packed best-first (see ContextPacker).
+        
+        Args:
+            query (str): User query
+            results (List[Dict[str, Any]]): Retrieved chunks
+            token_budget (Optional[int]): Context token budget; defaults to context_token_budget
+            index (Optional[IndexSnapshot]): Snapshot the results were retrieved from; defaults to the current one
+            
+        Returns:
+            Tuple[str, Dict[str, int]]: Prompt with context for the LLM, and its token accounting
+        """
         prompt = "You are an AI assistant for AutoConfig company. Answer questions based only on the following information:\n\n"
         
         # Add retrieved context
-        if results:
-            for i, result in enumerate(results):
-                prompt += f"Document: {result['document']}\n{result['chunk']}\n\n"
+        chunk_store = (index or self.index).document_chunks
+        passages, stats = self.context_packer.pack(results, chunk_store, token_budget)
+        for passage in passages:
+            prompt += f"{passage_header(passage['document'])}{passage['text']}\n\n"
         
         # Add the user's question in a clear, simple format
         prompt += f"Question: {query}\n\n"
         prompt += "Answer:"
         
-        return prompt
+        return prompt, stats
     
     def augment_query(self, query: str) -> str:
         """
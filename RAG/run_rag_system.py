@@ -8,6 +8,9 @@ import argparse
 import time
 import psutil
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utils.index_versions import current_index_dir
+
 def check_memory():
     """Check available memory and log it"""
     mem = psutil.virtual_memory()
@@ -58,8 +61,9 @@ def create_index():
     
     # Check if the index was created successfully
     embeddings_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "embeddings")
-    index_path = os.path.join(embeddings_dir, "rag_index.json")
-    embeddings_path = os.path.join(embeddings_dir, "chunk_embeddings.npy")
+    index_dir = current_index_dir(embeddings_dir)
+    index_path = os.path.join(index_dir, "rag_index.bin")
+    embeddings_path = os.path.join(index_dir, "chunk_embeddings.npy")
     
     if os.path.exists(index_path) and os.path.exists(embeddings_path):
         print("✅ RAG index created successfully!")
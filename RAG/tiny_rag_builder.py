@@ -4,13 +4,16 @@ Processes one document at a time and uses line-by-line processing
 """
 import os
 import sys
-import json
 import logging
-import numpy as np
 import glob
 import gc  # Garbage collection
 from sentence_transformers import SentenceTransformer
 from utils.tiny_document_processor import TinyDocumentProcessor
+from utils.index_manifest import IndexManifest, MANIFEST_FILE
+from utils.index_versions import publish_version
+from utils.build_checkpoint import BuildCheckpoint, fingerprint_documents
+from utils.streaming_chunker import ChunkStore, file_signature
+from utils.memory_governor import MemoryGovernor, memory_budget_from_env, MB
 
 # Setup logging
 logging.basicConfig(
@@ -29,13 +32,17 @@ class TinyRAGBuilder:
                 embeddings_dir="./embeddings",
                 chunk_size=256,  # Smaller chunks
                 chunk_overlap=64,  # Less overlap
-                batch_size=3):    # Tiny batch size
+                batch_size=3,     # First batch size; later ones follow the memory budget
+                memory_budget_mb=None,  # Target private memory; defaults to RAG_MEMORY_BUDGET_MB or 80% of what is available
+                checkpoint_interval=30):  # Seconds between embedding checkpoints
         
         self.documents_dir = documents_dir
         self.embeddings_dir = embeddings_dir
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
         self.batch_size = batch_size
+        self.memory_budget_mb = memory_budget_mb
+        self.checkpoint_interval = checkpoint_interval
         
         # Create directories if they don't exist
         if not os.path.exists(self.embeddings_dir):
@@ -49,11 +56,8 @@ class TinyRAGBuilder:
         
         # Initialize placeholders
         self.embedding_model = None
-        self.document_chunks = []
+        self.document_chunks = ChunkStore.from_documents([], [])  # Byte spans, read back per batch
         self.document_metadata = []
-        self.document_index = {}
-        self.index_path = os.path.join(self.embeddings_dir, "rag_index.json")
-        self.embeddings_path = os.path.join(self.embeddings_dir, "chunk_embeddings.npy")
     
     def load_embedding_model(self):
         """Load the embedding model with explicit cache location"""
@@ -75,48 +79,46 @@ class TinyRAGBuilder:
         try:
             logger.info(f"Processing document {os.path.basename(doc_path)}")
             
-            # Process document to chunks
-            doc_data = self.document_processor.process_document(doc_path)
+            # Process document to chunk spans
+            signature = file_signature(doc_path)
+            spans = self.document_processor.chunker.chunk_file(doc_path)
             
             # Add metadata
             self.document_metadata.append({
-                "filename": doc_data["filename"],
-                "path": doc_data["path"],
+                "filename": os.path.basename(doc_path),
+                "path": doc_path,
                 "doc_index": doc_idx,
-                "num_chunks": doc_data["num_chunks"]
+                "num_chunks": len(spans),
+                **signature
             })
             
-            # Add chunks and update index
-            start_idx = len(self.document_chunks)
-            for chunk_idx, chunk in enumerate(doc_data["chunks"]):
-                global_chunk_idx = start_idx + chunk_idx
-                self.document_chunks.append(chunk)
-                self.document_index[global_chunk_idx] = {
-                    "doc_idx": doc_idx,
-                    "chunk_idx": chunk_idx
-                }
+            # Add chunks; they are stored document by document, in metadata order
+            self.document_chunks.add_document(doc_path, spans, signature)
             
-            logger.info(f"Document processed: {len(doc_data['chunks'])} chunks created")
+            logger.info(f"Document processed: {len(spans)} chunks created")
             return True
         except Exception as e:
             logger.error(f"Error processing document {doc_path}: {str(e)}")
             return False
     
-    def save_index_data(self):
+    def build_manifest(self):
+        """Index mapping of the processed documents; chunks are stored document by document"""
+        return IndexManifest.from_documents(
+            self.document_metadata,
+            starts=self.document_chunks.starts,
+            ends=self.document_chunks.ends,
+            embedding_model="all-MiniLM-L6-v2",
+            chunk_size=self.chunk_size,
+            chunk_overlap=self.chunk_overlap
+        )
+    
+    def save_index_data(self, index_dir):
         """Save the document metadata and index mapping"""
         try:
-            with open(self.index_path, 'w') as f:
-                index_data = {
-                    "metadata": self.document_metadata,
-                    "document_index": {str(k): v for k, v in self.document_index.items()},
-                    "embedding_model": "all-MiniLM-L6-v2",
-                    "chunk_size": self.chunk_size,
-                    "chunk_overlap": self.chunk_overlap,
-                    "num_chunks": len(self.document_chunks)
-                }
-                json.dump(index_data, f, indent=2)
+            index_path = os.path.join(index_dir, MANIFEST_FILE)
+            self.build_manifest().save(index_path)
             
-            logger.info(f"Index data saved to {self.index_path}")
+            logger.info(f"Index data saved to {index_path}")
             return True
         except Exception as e:
             logger.error(f"Error saving index data: {str(e)}")
@@ -139,55 +141,79 @@ class TinyRAGBuilder:
         
         logger.info(f"Found {len(document_files)} documents")
         
-        # Process documents one by one
-        for doc_idx, doc_path in enumerate(document_files):
-            success = self.process_single_document(doc_path, doc_idx)
-            if not success:
-                logger.warning(f"Skipping document {doc_path} due to processing error")
-                continue
+        # Resume an interrupted build of the same documents with the same settings
+        checkpoint = BuildCheckpoint(
+            self.embeddings_dir,
+            {
+                "embedding_model": "all-MiniLM-L6-v2",
+                "chunk_size": self.chunk_size,
+                "chunk_overlap": self.chunk_overlap,
+                "documents": fingerprint_documents(document_files)
+            },
+            interval=self.checkpoint_interval
+        )
+        manifest = checkpoint.load_chunks()
+        if manifest is not None:
+            self.document_metadata = manifest.metadata
+            self.document_chunks = ChunkStore.from_manifest(manifest)
+            logger.info(f"Resuming from checkpoint: {checkpoint.embedded}/{len(self.document_chunks)} chunks already embedded")
+        else:
+            # Process documents one by one
+            for doc_idx, doc_path in enumerate(document_files):
+                success = self.process_single_document(doc_path, doc_idx)
+                if not success:
+                    logger.warning(f"Skipping document {doc_path} due to processing error")
+                    continue
+                
+                # Force garbage collection
+                gc.collect()
             
-            # Force garbage collection
-            gc.collect()
+            if not self.document_chunks:
+                logger.error("No chunks created from documents")
+                return False
+            checkpoint.save_chunks(self.build_manifest())
         
         # Load embedding model if not already loaded
         if self.embedding_model is None:
             if not self.load_embedding_model():
                 return False
         
-        # Process chunks in tiny batches to minimize memory usage
-        logger.info(f"Creating embeddings for {len(self.document_chunks)} chunks in batches of {self.batch_size}")
+        # Embed chunks in batches sized to the memory budget; each batch goes straight
+        # to the checkpoint file, so only one batch of text and embeddings is held in memory
+        total_chunks = len(self.document_chunks)
+        budget = self.memory_budget_mb * MB if self.memory_budget_mb else memory_budget_from_env()
+        governor = MemoryGovernor(budget, initial_batch_size=self.batch_size)
+        logger.info(f"Creating embeddings for {total_chunks - checkpoint.embedded} chunks within a {budget / MB:.0f} MB memory budget")
         
-        all_embeddings = []
-        for i in range(0, len(self.document_chunks), self.batch_size):
-            batch = self.document_chunks[i:i+self.batch_size]
-            logger.info(f"Processing batch {i//self.batch_size + 1}/{(len(self.document_chunks)+self.batch_size-1)//self.batch_size}")
+        for start, end in governor.batches(total_chunks, start=checkpoint.embedded):
+            batch = self.document_chunks[start:end]
+            logger.info(f"Processing chunks {start + 1}-{end}/{total_chunks} ({len(batch)} chunks)")
             
             try:
                 # Create embeddings for this batch
                 batch_embeddings = self.embedding_model.encode(batch, show_progress_bar=False)
-                all_embeddings.append(batch_embeddings)
-                logger.info(f"Batch {i//self.batch_size + 1} processed")
-                
-                # Force garbage collection after each batch
-                gc.collect()
+                checkpoint.add(start, batch_embeddings, total_chunks)
+                del batch, batch_embeddings
             except Exception as e:
-                logger.error(f"Error creating embeddings for batch {i//self.batch_size + 1}: {str(e)}")
+                checkpoint.commit()
+                logger.error(f"Error creating embeddings for chunks {start + 1}-{end}: {str(e)}")
                 return False
+        logger.info(f"Embedding memory: {governor.stats()}")
         
-        # Combine all embeddings
         try:
-            logger.info("Combining all embeddings")
-            combined_embeddings = np.vstack(all_embeddings)
-            
-            # Save embeddings
-            logger.info(f"Saving embeddings to {self.embeddings_path}")
-            np.save(self.embeddings_path, combined_embeddings)
-            
-            # Save index data
-            if not self.save_index_data():
-                return False
+            # Write a new index version; running servers pick it up once it is published
+            with publish_version(self.embeddings_dir) as (index_dir, version):
+                # Save embeddings
+                embeddings_path = os.path.join(index_dir, "chunk_embeddings.npy")
+                logger.info(f"Saving embeddings to {embeddings_path}")
+                checkpoint.export_embeddings(embeddings_path)
+                
+                # Save index data
+                if not self.save_index_data(index_dir):
+                    raise RuntimeError("index data could not be saved")
             
-            logger.info(f"RAG index created successfully with {len(self.document_chunks)} chunks from {len(document_files)} documents")
+            checkpoint.clear()
+            logger.info(f"RAG index version {version} created successfully with {total_chunks} chunks from {len(self.document_metadata)} documents")
             return True
             
         except Exception as e:
@@ -208,23 +234,20 @@ def main():
         mem = psutil.virtual_memory()
         logger.info(f"Available memory: {mem.available / (1024 * 1024):.2f} MB")
         
-        # Set even smaller chunk size if very low memory
+        # Set even smaller chunk size if very low memory; batch sizes adapt to the memory budget
         chunk_size = 128 if mem.available < 500 * 1024 * 1024 else 256
-        batch_size = 2 if mem.available < 500 * 1024 * 1024 else 3
         
-        logger.info(f"Using chunk_size={chunk_size} and batch_size={batch_size}")
+        logger.info(f"Using chunk_size={chunk_size}")
     except ImportError:
         logger.warning("psutil not available, using default settings")
         chunk_size = 256
-        batch_size = 3
     
     # Build the index
     builder = TinyRAGBuilder(
         documents_dir=documents_dir,
         embeddings_dir=embeddings_dir,
         chunk_size=chunk_size,
-        chunk_overlap=32,  # Very small overlap
-        batch_size=batch_size
+        chunk_overlap=32  # Very small overlap
     )
     
     success = builder.build_index()
@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import numpy as np
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Identifiers keep their separators (LOG_LEVEL, api.timeout, ERR-503) so an
+# exact setting name or error code is a single term; their parts are indexed too
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[_.\-/:][a-z0-9]+)*")
+SEPARATORS = re.compile(r"[_.\-/:]")
+
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i if in into is it its of on or
+that the their then there these this to was what when where which who why will with you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lower-cased lexical terms for BM25
+
+    Args:
+        text (str): Text to tokenize
+
+    Returns:
+        List[str]: Terms, with compound identifiers followed by their parts
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        terms.append(token)
+        if SEPARATORS.search(token):
+            terms.extend(part for part in SEPARATORS.split(token) if part and part not in STOPWORDS)
+    return terms
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Iterable[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Fuse several ranked lists of chunk indices into one (Reciprocal Rank Fusion)
+
+    Args:
+        rankings: Ranked chunk indices, best first, one list per retriever
+        k (int): Damping constant; 60 is the usual choice
+
+    Returns:
+        List[Tuple[int, float]]: (chunk index, fused score), best first
+    """
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking):
+            fused[int(idx)] = fused.get(int(idx), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class BM25Index:
+    """
+    Inverted index over chunk terms with BM25 scoring
+
+    Posting lists are stored CSR-style in flat NumPy arrays: the postings of
+    term t are doc_ids[offsets[t]:offsets[t + 1]] with matching term
+    frequencies in tfs. The arrays are saved as .npy files and can be
+    memory-mapped on load, so a large index costs little resident memory.
+    """
+    FILES = ("offsets", "doc_ids", "tfs", "doc_lengths", "idf")
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Initialize an empty index
+
+        Args:
+            k1 (float): Term frequency saturation
+            b (float): Document length normalization
+        """
+        self.k1 = k1
+        self.b = b
+        self.vocabulary: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.tfs = np.zeros(0, dtype=np.uint16)
+        self.doc_lengths = np.zeros(0, dtype=np.int32)
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.avg_doc_length = 0.0
+
+    @property
+    def num_docs(self) -> int:
+        return len(self.doc_lengths)
+
+    def build(self, chunks: List[str]) -> "BM25Index":
+        """
+        Index a list of chunks; chunk i gets document id i
+
+        Args:
+            chunks (List[str]): Chunk texts, in index order
+
+        Returns:
+            BM25Index: self
+        """
+        vocabulary: Dict[str, int] = {}
+        # Compact typed buffers instead of Python lists of ints
+        terms, docs, tfs = array("i"), array("i"), array("H")
+        doc_lengths = np.zeros(len(chunks), dtype=np.int32)
+
+        for doc_id, text in enumerate(chunks):
+            counts = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                terms.append(vocabulary.setdefault(term, len(vocabulary)))
+                docs.append(doc_id)
+                tfs.append(min(tf, 65535))
+
+        term_array = np.frombuffer(terms, dtype=np.int32)
+        # Stable sort keeps each posting list in ascending document order
+        order = np.argsort(term_array, kind="stable")
+        df = np.bincount(term_array, minlength=len(vocabulary))
+
+        self.vocabulary = vocabulary
+        self.offsets = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        self.doc_ids = np.frombuffer(docs, dtype=np.int32)[order]
+        self.tfs = np.frombuffer(tfs, dtype=np.uint16)[order]
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = float(doc_lengths.mean()) if len(doc_lengths) else 0.0
+        n = len(chunks)
+        self.idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return self
+
+    def search(self, query: str, top_k: int = 100, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Score chunks against a query with BM25
+
+        Args:
+            query (str): Query text
+            top_k (int): Number of results to return
+            mask (Optional[np.ndarray]): Boolean mask over chunks; only chunks where it is True are returned
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Chunk indices and scores, best first
+                (empty if no query term is in the index)
+        """
+        term_ids = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not term_ids or self.avg_doc_length == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        matched_docs, partial_scores = [], []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = np.asarray(self.doc_ids[start:end])
+            tf = self.tfs[start:end].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / self.avg_doc_length)
+            matched_docs.append(docs)
+            partial_scores.append(self.idf[term_id] * tf * (self.k1 + 1) / (tf + norm))
+
+        # Sum the per-term scores of each matched chunk; only matched chunks are touched
+        docs, inverse = np.unique(np.concatenate(matched_docs), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(partial_scores))
+        if mask is not None:
+            keep = mask[docs]
+            docs, scores = docs[keep], scores[keep]
+
+        if len(docs) > top_k:
+            keep = np.argpartition(-scores, top_k - 1)[:top_k]
+            docs, scores = docs[keep], scores[keep]
+        order = np.argsort(-scores, kind="stable")
+        return docs[order].astype(np.int64), scores[order].astype(np.float32)
+
+    def save(self, index_dir: str) -> None:
+        """
+        Save the index as .npy arrays plus a JSON file with the vocabulary
+
+        Args:
+            index_dir (str): Directory to write to (created if missing)
+        """
+        os.makedirs(index_dir, exist_ok=True)
+        for name in self.FILES:
+            np.save(os.path.join(index_dir, f"{name}.npy"), getattr(self, name))
+        with open(os.path.join(index_dir, "bm25.json"), 'w') as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "avg_doc_length": self.avg_doc_length,
+                "num_docs": self.num_docs,
+                "vocabulary": self.vocabulary
+            }, f)
+
+    @classmethod
+    def load(cls, index_dir: str, mmap: bool = True) -> "BM25Index":
+        """
+        Load an index written by save()
+
+        Args:
+            index_dir (str): Directory the index was saved to
+            mmap (bool): Memory-map the posting arrays instead of reading them into RAM
+
+        Returns:
+            BM25Index: The loaded index
+        """
+        with open(os.path.join(index_dir, "bm25.json"), 'r') as f:
+            meta = json.load(f)
+        index = cls(k1=meta["k1"], b=meta["b"])
+        index.vocabulary = meta["vocabulary"]
+        index.avg_doc_length = meta["avg_doc_length"]
+        for name in cls.FILES:
+            setattr(index, name, np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r" if mmap else None))
+        return index
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, "bm25.json"))
@@ -0,0 +1,188 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+from utils.index_manifest import IndexManifest
+
+CHECKPOINT_DIR = "build_checkpoint"
+STATE_FILE = "state.json"
+CHUNKS_FILE = "chunks.bin"
+EMBEDDINGS_FILE = "chunk_embeddings.npy"
+
+
+def fingerprint_documents(paths: List[str]) -> str:
+    """
+    Hash of the document set: paths, sizes and modification times
+
+    Chunk spans are byte offsets into the files, so a checkpoint is only
+    valid for exactly the documents it was made from.
+
+    Args:
+        paths (List[str]): Document paths, in any order
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha1()
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+            digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+        except OSError:
+            digest.update(f"{path}\0missing\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BuildCheckpoint:
+    """
+    On-disk progress of an index build, so a killed build resumes where it stopped
+
+    Holds the chunk manifest, written once chunking is done, and the chunk
+    embeddings: a .npy file preallocated for every chunk and filled batch by
+    batch through a memory map. The state file records how many leading
+    chunks have embeddings on disk. It is replaced atomically, and only
+    after the embeddings are flushed, so it never claims more than was
+    written. Commits happen at most every interval seconds, which bounds
+    both the checkpoint overhead and the work lost to a crash.
+
+    A checkpoint is resumed only if the settings it was made with (embedding
+    model, chunker settings, document fingerprint) equal the current ones;
+    otherwise it is discarded.
+    """
+    def __init__(self, embeddings_dir: str, settings: Dict[str, Any], interval: float = 30.0):
+        """
+        Open the checkpoint of an embeddings directory
+
+        Args:
+            embeddings_dir (str): Directory the index is built for
+            settings (Dict[str, Any]): JSON-serializable settings the build depends on
+            interval (float): Minimum seconds between commits
+        """
+        self.path = os.path.join(embeddings_dir, CHECKPOINT_DIR)
+        self.settings = settings
+        self.interval = interval
+        self.embedded = 0  # Chunks with committed embeddings
+        self._written = 0  # Chunks with embeddings written, committed or not
+        self._embeddings: Optional[np.ndarray] = None
+        self._last_commit = time.monotonic()
+
+        state = self._read_state()
+        if state is None:
+            return
+        if state.get("settings") != settings:
+            print(f"Discarding build checkpoint in {self.path}: it was made with different settings or documents")
+            self.clear()
+            return
+        self.embedded = self._written = int(state.get("embedded", 0))
+
+    @property
+    def chunks_path(self) -> str:
+        return os.path.join(self.path, CHUNKS_FILE)
+
+    @property
+    def embeddings_path(self) -> str:
+        return os.path.join(self.path, EMBEDDINGS_FILE)
+
+    def load_chunks(self) -> Optional[IndexManifest]:
+        """
+        Chunk manifest of the build being resumed
+
+        Returns:
+            Optional[IndexManifest]: The manifest, or None if chunking has to be (re)done
+        """
+        if not os.path.exists(self.chunks_path):
+            return None
+        manifest = IndexManifest.load(self.chunks_path, mmap=False)
+        if self.embedded > manifest.num_chunks or (self.embedded and not os.path.exists(self.embeddings_path)):
+            print(f"Discarding build checkpoint in {self.path}: its embeddings do not match its chunks")
+            self.clear()
+            return None
+        return manifest
+
+    def save_chunks(self, manifest: IndexManifest) -> None:
+        """
+        Record the chunking result; embedding starts from scratch
+
+        Args:
+            manifest (IndexManifest): Documents and chunk spans of the build
+        """
+        self.clear()
+        os.makedirs(self.path)
+        manifest.save(self.chunks_path)
+        self._write_state()
+
+    def add(self, start: int, embeddings: np.ndarray, total: int) -> None:
+        """
+        Store the embeddings of chunks start .. start + len(embeddings), committing if the interval has passed
+
+        Args:
+            start (int): Index of the first chunk in the batch
+            embeddings (np.ndarray): Batch embeddings
+            total (int): Chunks in the build, to size the embeddings file
+        """
+        if self._embeddings is None:
+            if os.path.exists(self.embeddings_path):
+                self._embeddings = np.lib.format.open_memmap(self.embeddings_path, mode="r+")
+            else:
+                self._embeddings = np.lib.format.open_memmap(
+                    self.embeddings_path, mode="w+", dtype=embeddings.dtype, shape=(total, embeddings.shape[1])
+                )
+        self._embeddings[start:start + len(embeddings)] = embeddings
+        self._written = max(self._written, start + len(embeddings))
+        if time.monotonic() - self._last_commit >= self.interval:
+            self.commit()
+
+    def commit(self) -> None:
+        """
+        Flush written embeddings to disk, then record them in the state file
+        """
+        if self._embeddings is not None:
+            self._embeddings.flush()
+        self.embedded = self._written
+        self._write_state()
+        self._last_commit = time.monotonic()
+
+    def export_embeddings(self, path: str) -> None:
+        """
+        Place the completed embeddings file at path (a hard link where possible, else a copy)
+
+        The checkpoint keeps its own copy until clear(), so the build can
+        still resume if publishing fails.
+
+        Args:
+            path (str): Destination, e.g. chunk_embeddings.npy in a staging index directory
+        """
+        self.commit()
+        self._embeddings = None  # Release the memory map
+        try:
+            os.link(self.embeddings_path, path)
+        except OSError:
+            shutil.copyfile(self.embeddings_path, path)
+
+    def clear(self) -> None:
+        """
+        Delete the checkpoint, e.g. once its index is published
+        """
+        self._embeddings = None
+        self.embedded = self._written = 0
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.path, STATE_FILE), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_state(self) -> None:
+        state_path = os.path.join(self.path, STATE_FILE)
+        tmp_path = f"{state_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"settings": self.settings, "embedded": self.embedded, "updated_at": time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, state_path)
@@ -0,0 +1,242 @@
+import re
+import zlib
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+
+WORD_PATTERN = re.compile(r"\w+")
+MERSENNE_PRIME = (1 << 61) - 1
+HASH_MASK = (1 << 32) - 1
+
+
+class ChunkDeduplicator:
+    """
+    Index-time near-duplicate detection for chunks with MinHash and LSH
+
+    Each chunk is reduced to a MinHash signature over its word shingles.
+    Signatures are split into bands; chunks sharing any band land in the
+    same LSH bucket and are compared by signature agreement, an estimate of
+    their Jaccard similarity. A chunk at or above the threshold against a
+    stored chunk is not stored itself: it is recorded as another source
+    (document and byte span) of that chunk.
+
+    Hashes are stable across processes (CRC32 shingles, seeded
+    permutations), so a saved deduplicator keeps working for documents
+    added later.
+    """
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        """
+        Initialize an empty deduplicator
+
+        Args:
+            threshold (float): Estimated Jaccard similarity at which chunks count as duplicates
+            num_perm (int): MinHash signature length
+            bands (int): LSH bands; num_perm must be divisible by it
+            shingle_size (int): Words per shingle
+            seed (int): Seed for the hash permutations
+        """
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be divisible by bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.shingle_size = shingle_size
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        # Universal hashing (a * x + b) mod p; a, b < 2^29 keep a * x below 2^61 for 32-bit x
+        self._a = rng.randint(1, 1 << 29, size=num_perm).astype(np.uint64)
+        self._b = rng.randint(0, 1 << 29, size=num_perm).astype(np.uint64)
+
+        self.signatures = np.zeros((0, num_perm), dtype=np.uint32)  # One per stored chunk
+        self._pending: List[np.ndarray] = []
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        # Duplicate sources: stored chunk index, document, byte span
+        self.dup_chunks: List[int] = []
+        self.dup_doc_ids: List[int] = []
+        self.dup_starts: List[int] = []
+        self.dup_ends: List[int] = []
+        self._sources: Optional[Dict[int, List[int]]] = None
+
+    @property
+    def num_stored(self) -> int:
+        return len(self.signatures) + len(self._pending)
+
+    @property
+    def num_duplicates(self) -> int:
+        return len(self.dup_chunks)
+
+    def copy(self) -> "ChunkDeduplicator":
+        """
+        Copy that chunks can be added to while this one keeps serving queries
+        """
+        dedup = ChunkDeduplicator(self.threshold, self.num_perm, self.bands, self.shingle_size, self.seed)
+        dedup.signatures = self.signatures
+        dedup._pending = list(self._pending)
+        dedup._buckets = {key: list(ids) for key, ids in self._buckets.items()}
+        dedup.dup_chunks = list(self.dup_chunks)
+        dedup.dup_doc_ids = list(self.dup_doc_ids)
+        dedup.dup_starts = list(self.dup_starts)
+        dedup.dup_ends = list(self.dup_ends)
+        return dedup
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        MinHash signature of a text's word shingles
+
+        Args:
+            text (str): Chunk text
+
+        Returns:
+            np.ndarray: num_perm uint32 values
+        """
+        words = WORD_PATTERN.findall(text.lower())
+        n = max(len(words) - self.shingle_size + 1, 1)
+        hashes = np.fromiter(
+            (zlib.crc32(" ".join(words[i:i + self.shingle_size]).encode("utf-8")) for i in range(n)),
+            dtype=np.uint64, count=n
+        )
+        permuted = (hashes[:, None] * self._a + self._b) % MERSENNE_PRIME
+        return (permuted.min(axis=0) & HASH_MASK).astype(np.uint32)
+
+    def add(self, text: str, doc_id: int, start: int, end: int) -> Optional[int]:
+        """
+        Check a chunk against the stored ones and register it
+
+        Args:
+            text (str): Chunk text
+            doc_id (int): Document the chunk comes from
+            start (int): Start byte offset of the chunk
+            end (int): End byte offset of the chunk
+
+        Returns:
+            Optional[int]: Index of the stored chunk it duplicates (the chunk is then
+                recorded as one of its sources), or None if it is new and should be stored
+                (it gets the next stored-chunk index)
+        """
+        signature = self.signature(text)
+        keys = [(band, row.tobytes()) for band, row in enumerate(signature.reshape(self.bands, -1))]
+
+        candidates = {idx for key in keys for idx in self._buckets.get(key, ())}
+        best, best_similarity = None, self.threshold
+        for idx in sorted(candidates):
+            similarity = float(np.mean(self._signature_at(idx) == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = idx, similarity
+        if best is not None:
+            self.dup_chunks.append(best)
+            self.dup_doc_ids.append(doc_id)
+            self.dup_starts.append(start)
+            self.dup_ends.append(end)
+            self._sources = None
+            return best
+
+        idx = self.num_stored
+        self._pending.append(signature)
+        for key in keys:
+            self._buckets.setdefault(key, []).append(idx)
+        return None
+
+    def _signature_at(self, idx: int) -> np.ndarray:
+        if idx < len(self.signatures):
+            return self.signatures[idx]
+        return self._pending[idx - len(self.signatures)]
+
+    def _flush(self) -> None:
+        if self._pending:
+            self.signatures = np.vstack([self.signatures, np.array(self._pending, dtype=np.uint32)])
+            self._pending = []
+
+    def sources(self, chunk_idx: int) -> List[Tuple[int, int, int]]:
+        """
+        Other places a stored chunk's text appeared
+
+        Args:
+            chunk_idx (int): Stored chunk index
+
+        Returns:
+            List[Tuple[int, int, int]]: (document, start, end) of each collapsed duplicate
+        """
+        if self._sources is None:
+            # Built aside and then published, so concurrent readers never see it half-filled
+            by_chunk: Dict[int, List[int]] = {}
+            for i, chunk in enumerate(self.dup_chunks):
+                by_chunk.setdefault(chunk, []).append(i)
+            self._sources = by_chunk
+        return [
+            (self.dup_doc_ids[i], self.dup_starts[i], self.dup_ends[i])
+            for i in self._sources.get(chunk_idx, ())
+        ]
+
+    def stored_for_documents(self, doc_mask: np.ndarray) -> np.ndarray:
+        """
+        Stored chunks that stand in for collapsed duplicates from the given documents
+
+        A filter on documents should also match these chunks: their text
+        appeared in a selected document but is stored only once, elsewhere.
+
+        Args:
+            doc_mask (np.ndarray): Boolean mask with one entry per document
+
+        Returns:
+            np.ndarray: Stored chunk indices
+        """
+        if not self.dup_chunks:
+            return np.zeros(0, dtype=np.int64)
+        doc_ids = np.asarray(self.dup_doc_ids, dtype=np.int64)
+        selected = doc_ids < len(doc_mask)
+        selected[selected] = doc_mask[doc_ids[selected]]
+        return np.unique(np.asarray(self.dup_chunks, dtype=np.int64)[selected])
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Deduplication summary for the build report
+        """
+        total = self.num_stored + self.num_duplicates
+        return {
+            "chunks_total": total,
+            "chunks_stored": self.num_stored,
+            "duplicates": self.num_duplicates,
+            "dedup_ratio": round(self.num_duplicates / total, 4) if total else 0.0
+        }
+
+    def save(self, path: str) -> None:
+        """
+        Save signatures and duplicate sources to a .npz file
+
+        Args:
+            path (str): File to write
+        """
+        self._flush()
+        np.savez(
+            path,
+            settings=np.array([self.num_perm, self.bands, self.shingle_size, self.seed], dtype=np.int64),
+            threshold=np.array(self.threshold),
+            signatures=self.signatures,
+            dup_chunks=np.array(self.dup_chunks, dtype=np.int32),
+            dup_doc_ids=np.array(self.dup_doc_ids, dtype=np.int32),
+            dup_starts=np.array(self.dup_starts, dtype=np.int64),
+            dup_ends=np.array(self.dup_ends, dtype=np.int64)
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkDeduplicator":
+        """
+        Load a deduplicator written by save(); LSH buckets are rebuilt from the signatures
+
+        Args:
+            path (str): File written by save()
+
+        Returns:
+            ChunkDeduplicator: The deduplicator
+        """
+        with np.load(path) as data:
+            num_perm, bands, shingle_size, seed = (int(v) for v in data["settings"])
+            dedup = cls(float(data["threshold"]), num_perm, bands, shingle_size, seed)
+            dedup.signatures = data["signatures"]
+            dedup.dup_chunks = data["dup_chunks"].tolist()
+            dedup.dup_doc_ids = data["dup_doc_ids"].tolist()
+            dedup.dup_starts = data["dup_starts"].tolist()
+            dedup.dup_ends = data["dup_ends"].tolist()
+        for idx, signature in enumerate(dedup.signatures):
+            for band, row in enumerate(signature.reshape(bands, -1)):
+                dedup._buckets.setdefault((band, row.tobytes()), []).append(idx)
+        return dedup
@@ -0,0 +1,288 @@
+import os
+import numpy as np
+from typing import Any, Dict, List, Optional, Tuple
+
+FILTER_FIELDS = ("documents", "directories", "extensions", "modified_after", "modified_before")
+
+
+def normalize_extension(ext: str) -> str:
+    ext = ext.lower()
+    return ext if not ext or ext.startswith(".") else f".{ext}"
+
+
+class ChunkMetadata:
+    """
+    Columnar per-chunk document attributes with bitmap indexes for filtering
+
+    Each chunk has a row in four parallel arrays: the document it came from
+    (position in RAGSystem.document_metadata), the id of its directory, the
+    id of its file extension and the file's modification time. Directories
+    and extensions are low-cardinality, so each distinct value gets a packed
+    bitmap over the chunks; a filter ORs the bitmaps of the values it asks
+    for and ANDs the result with the other filters, all in packed form.
+
+    The same attributes are also kept once per document, so filters can be
+    applied to documents that have no chunk rows of their own, e.g. when
+    all their chunks were collapsed into another document's duplicates.
+    """
+    def __init__(self):
+        self.paths: List[str] = []  # One per document
+        self.directories: List[str] = []
+        self.extensions: List[str] = []
+        self.doc_ids = np.zeros(0, dtype=np.int32)
+        self.dir_ids = np.zeros(0, dtype=np.int32)
+        self.ext_ids = np.zeros(0, dtype=np.int32)
+        self.mtimes = np.zeros(0, dtype=np.float64)
+        # The same attributes, one row per document
+        self.doc_dir_ids = np.zeros(0, dtype=np.int32)
+        self.doc_ext_ids = np.zeros(0, dtype=np.int32)
+        self.doc_mtimes = np.zeros(0, dtype=np.float64)
+        self._bitmaps: Dict[tuple, np.ndarray] = {}
+        self._value_ids: Dict[str, Dict[str, int]] = {}  # "directories"/"extensions" -> value -> id
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_documents(cls, document_metadata: List[Dict[str, Any]]) -> "ChunkMetadata":
+        """
+        Build the columns from RAGSystem.document_metadata
+
+        Args:
+            document_metadata (List[Dict[str, Any]]): Documents in index order, with "path" and "num_chunks"
+
+        Returns:
+            ChunkMetadata: The columns, one row per chunk
+        """
+        metadata = cls()
+        metadata.add_documents([doc["path"] for doc in document_metadata], [doc["num_chunks"] for doc in document_metadata])
+        return metadata
+
+    def copy(self) -> "ChunkMetadata":
+        """
+        Copy that documents can be added to while this one keeps serving queries
+        """
+        metadata = ChunkMetadata()
+        metadata.paths = list(self.paths)
+        metadata.directories = list(self.directories)
+        metadata.extensions = list(self.extensions)
+        metadata.doc_ids = self.doc_ids
+        metadata.dir_ids = self.dir_ids
+        metadata.ext_ids = self.ext_ids
+        metadata.mtimes = self.mtimes  # add_documents replaces the arrays rather than growing them
+        metadata.doc_dir_ids = self.doc_dir_ids
+        metadata.doc_ext_ids = self.doc_ext_ids
+        metadata.doc_mtimes = self.doc_mtimes
+        return metadata
+
+    def add_documents(self, paths: List[str], num_chunks: List[int]) -> None:
+        """
+        Append the rows for the chunks of one or more documents
+
+        Args:
+            paths (List[str]): Document paths, in index order
+            num_chunks (List[int]): Number of chunks each document was split into
+        """
+        dir_ids, ext_ids, mtimes = [], [], []
+        for path in paths:
+            dir_ids.append(self._intern("directories", os.path.dirname(os.path.abspath(path))))
+            ext_ids.append(self._intern("extensions", normalize_extension(os.path.splitext(path)[1])))
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                mtimes.append(0.0)
+
+        counts = np.asarray(num_chunks, dtype=np.int64)
+        first_doc = len(self.paths)
+        self.paths.extend(paths)
+        self.doc_ids = np.concatenate([self.doc_ids, np.repeat(np.arange(first_doc, len(self.paths), dtype=np.int32), counts)])
+        self.dir_ids = np.concatenate([self.dir_ids, np.repeat(np.asarray(dir_ids, dtype=np.int32), counts)])
+        self.ext_ids = np.concatenate([self.ext_ids, np.repeat(np.asarray(ext_ids, dtype=np.int32), counts)])
+        self.mtimes = np.concatenate([self.mtimes, np.repeat(np.asarray(mtimes, dtype=np.float64), counts)])
+        self.doc_dir_ids = np.concatenate([self.doc_dir_ids, np.asarray(dir_ids, dtype=np.int32)])
+        self.doc_ext_ids = np.concatenate([self.doc_ext_ids, np.asarray(ext_ids, dtype=np.int32)])
+        self.doc_mtimes = np.concatenate([self.doc_mtimes, np.asarray(mtimes, dtype=np.float64)])
+        # Bitmaps cover a fixed number of chunks, so they are rebuilt on demand
+        self._bitmaps = {}
+
+    def _intern(self, column: str, value: str) -> int:
+        values = getattr(self, column)
+        ids = self._value_ids.get(column)
+        if ids is None or len(ids) != len(values):
+            # Built on first use, since load() and copy() set the value lists directly
+            ids = self._value_ids[column] = {v: i for i, v in enumerate(values)}
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    def _bitmap(self, column: str, value_id: int) -> np.ndarray:
+        key = (column, value_id)
+        if key not in self._bitmaps:
+            self._bitmaps[key] = np.packbits(getattr(self, column) == value_id)
+        return self._bitmaps[key]
+
+    def _any_of(self, column: str, value_ids: List[int]) -> np.ndarray:
+        packed = np.zeros((self.num_chunks + 7) // 8, dtype=np.uint8)
+        for value_id in value_ids:
+            packed |= self._bitmap(column, value_id)
+        return packed
+
+    def mask(
+        self,
+        documents: Optional[List[str]] = None,
+        directories: Optional[List[str]] = None,
+        extensions: Optional[List[str]] = None,
+        modified_after: Optional[float] = None,
+        modified_before: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Compute which chunks pass a set of filters; unset filters match everything
+
+        Args:
+            documents (Optional[List[str]]): Document paths or filenames
+            directories (Optional[List[str]]): Directories, matched together with their subdirectories
+            extensions (Optional[List[str]]): File extensions, with or without the leading dot
+            modified_after (Optional[float]): Earliest modification time (Unix seconds)
+            modified_before (Optional[float]): Latest modification time (Unix seconds)
+
+        Returns:
+            np.ndarray: Boolean mask with one entry per chunk
+        """
+        packed = np.full((self.num_chunks + 7) // 8, 0xFF, dtype=np.uint8)
+        doc_ids, dir_ids, ext_ids = self._matching_ids(documents, directories, extensions)
+
+        if doc_ids is not None:
+            packed &= np.packbits(np.isin(self.doc_ids, doc_ids))
+        if dir_ids is not None:
+            packed &= self._any_of("dir_ids", dir_ids)
+        if ext_ids is not None:
+            packed &= self._any_of("ext_ids", ext_ids)
+
+        if modified_after is not None:
+            packed &= np.packbits(self.mtimes >= modified_after)
+        if modified_before is not None:
+            packed &= np.packbits(self.mtimes <= modified_before)
+
+        return np.unpackbits(packed, count=self.num_chunks).astype(bool)
+
+    def document_mask(
+        self,
+        documents: Optional[List[str]] = None,
+        directories: Optional[List[str]] = None,
+        extensions: Optional[List[str]] = None,
+        modified_after: Optional[float] = None,
+        modified_before: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Compute which documents pass a set of filters; same filters as mask()
+
+        Returns:
+            np.ndarray: Boolean mask with one entry per document
+        """
+        passing = np.ones(len(self.paths), dtype=bool)
+        doc_ids, dir_ids, ext_ids = self._matching_ids(documents, directories, extensions)
+        if doc_ids is not None:
+            passing &= np.isin(np.arange(len(self.paths)), doc_ids)
+        if dir_ids is not None:
+            passing &= np.isin(self.doc_dir_ids, dir_ids)
+        if ext_ids is not None:
+            passing &= np.isin(self.doc_ext_ids, ext_ids)
+        if modified_after is not None:
+            passing &= self.doc_mtimes >= modified_after
+        if modified_before is not None:
+            passing &= self.doc_mtimes <= modified_before
+        return passing
+
+    def _matching_ids(
+        self,
+        documents: Optional[List[str]],
+        directories: Optional[List[str]],
+        extensions: Optional[List[str]]
+    ) -> Tuple[Optional[List[int]], Optional[List[int]], Optional[List[int]]]:
+        # Document, directory and extension ids each filter selects; None where it is unset
+        doc_ids = dir_ids = ext_ids = None
+        if documents is not None:
+            wanted = set(documents)
+            doc_ids = [i for i, path in enumerate(self.paths) if path in wanted or os.path.basename(path) in wanted]
+        if directories is not None:
+            prefixes = [os.path.abspath(d) for d in directories]
+            dir_ids = [
+                i for i, directory in enumerate(self.directories)
+                if any(directory == p or directory.startswith(p.rstrip(os.sep) + os.sep) for p in prefixes)
+            ]
+        if extensions is not None:
+            wanted = {normalize_extension(ext) for ext in extensions}
+            ext_ids = [i for i, ext in enumerate(self.extensions) if ext in wanted]
+        return doc_ids, dir_ids, ext_ids
+
+    def save(self, path: str) -> None:
+        """
+        Save the columns to a .npz file
+
+        Args:
+            path (str): File to write
+        """
+        np.savez(
+            path,
+            paths=np.array(self.paths, dtype=str),
+            directories=np.array(self.directories, dtype=str),
+            extensions=np.array(self.extensions, dtype=str),
+            doc_ids=self.doc_ids,
+            dir_ids=self.dir_ids,
+            ext_ids=self.ext_ids,
+            mtimes=self.mtimes,
+            doc_dir_ids=self.doc_dir_ids,
+            doc_ext_ids=self.doc_ext_ids,
+            doc_mtimes=self.doc_mtimes
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkMetadata":
+        """
+        Load columns written by save()
+
+        Args:
+            path (str): File written by save()
+
+        Returns:
+            ChunkMetadata: The loaded columns
+        """
+        metadata = cls()
+        with np.load(path) as data:
+            metadata.paths = data["paths"].tolist()
+            metadata.directories = data["directories"].tolist()
+            metadata.extensions = data["extensions"].tolist()
+            metadata.doc_ids = data["doc_ids"]
+            metadata.dir_ids = data["dir_ids"]
+            metadata.ext_ids = data["ext_ids"]
+            metadata.mtimes = data["mtimes"]
+            if "doc_mtimes" in data:
+                metadata.doc_dir_ids = data["doc_dir_ids"]
+                metadata.doc_ext_ids = data["doc_ext_ids"]
+                metadata.doc_mtimes = data["doc_mtimes"]
+            else:
+                metadata._derive_document_columns()
+        return metadata
+
+    def _derive_document_columns(self) -> None:
+        # Files saved before the per-document columns: take each document's first chunk row,
+        # or its path for documents without chunks
+        dir_ids, ext_ids, mtimes = [], [], []
+        first_rows = np.searchsorted(self.doc_ids, np.arange(len(self.paths)))
+        for doc_id, (path, row) in enumerate(zip(self.paths, first_rows)):
+            if row < self.num_chunks and self.doc_ids[row] == doc_id:
+                dir_ids.append(int(self.dir_ids[row]))
+                ext_ids.append(int(self.ext_ids[row]))
+                mtimes.append(float(self.mtimes[row]))
+                continue
+            dir_ids.append(self._intern("directories", os.path.dirname(os.path.abspath(path))))
+            ext_ids.append(self._intern("extensions", normalize_extension(os.path.splitext(path)[1])))
+            try:
+                mtimes.append(os.path.getmtime(path))
+            except OSError:
+                mtimes.append(0.0)
+        self.doc_dir_ids = np.asarray(dir_ids, dtype=np.int32)
+        self.doc_ext_ids = np.asarray(ext_ids, dtype=np.int32)
+        self.doc_mtimes = np.asarray(mtimes, dtype=np.float64)
@@ -0,0 +1,182 @@
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+CHARS_PER_TOKEN = 4  # Fallback estimate when no tokenizer is configured
+MIN_PASSAGE_TOKENS = 32  # Don't truncate a passage to less than this
+SHINGLE_SIZE = 3
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def passage_header(document: str) -> str:
+    return f"Document: {document}\n"
+
+
+class ContextPacker:
+    """
+    Assembles retrieved chunks into a prompt context under a token budget
+
+    Chunks from the same document whose byte spans overlap or touch are
+    merged into one passage, read back from the source file, so the chunk
+    overlap is sent once. Passages whose word shingles are mostly contained
+    in a higher-ranked passage are dropped. The rest are packed best-first
+    until the budget is used; the first passage that does not fit is
+    truncated if enough budget is left.
+
+    Tokens are counted with the Llama tokenizer at tokenizer_path (or the
+    RAG_TOKENIZER environment variable) when transformers can load it, and
+    estimated at CHARS_PER_TOKEN characters per token otherwise.
+    """
+    def __init__(
+        self,
+        token_budget: int = 1024,
+        tokenizer_path: Optional[str] = None,
+        merge_gap: int = 0,
+        duplicate_threshold: float = 0.8
+    ):
+        """
+        Initialize the packer
+
+        Args:
+            token_budget (int): Maximum context tokens, passage headers included
+            tokenizer_path (Optional[str]): Directory of a Hugging Face tokenizer, e.g. the Llama model dir
+            merge_gap (int): Merge same-document spans separated by at most this many bytes
+            duplicate_threshold (float): Fraction of a passage's shingles found in a kept passage that makes it a duplicate
+        """
+        self.token_budget = token_budget
+        self.merge_gap = merge_gap
+        self.duplicate_threshold = duplicate_threshold
+        self.tokenizer = None
+        tokenizer_path = tokenizer_path or os.getenv("RAG_TOKENIZER")
+        if tokenizer_path:
+            try:
+                from transformers import AutoTokenizer
+                self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_path, local_files_only=True)
+            except Exception as e:
+                print(f"Warning: could not load tokenizer from {tokenizer_path} ({e}); estimating token counts")
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count the tokens in a piece of text
+
+        Args:
+            text (str): Text to count
+
+        Returns:
+            int: Token count (estimated if no tokenizer is loaded)
+        """
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False))
+        return -(-len(text) // CHARS_PER_TOKEN)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cut text down to at most max_tokens tokens, at a word boundary where possible
+        """
+        if self.tokenizer is not None:
+            ids = self.tokenizer.encode(text, add_special_tokens=False)[:max_tokens]
+            cut = self.tokenizer.decode(ids)
+        else:
+            cut = text[:max_tokens * CHARS_PER_TOKEN]
+        if len(cut) < len(text) and " " in cut:
+            cut = cut[:cut.rfind(" ")]
+        return cut
+
+    def pack(self, results: List[Dict[str, Any]], chunk_store=None, token_budget: Optional[int] = None) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+        """
+        Turn retrieved chunks into deduplicated passages that fit the budget
+
+        Args:
+            results (List[Dict[str, Any]]): RAGSystem.retrieve results, best first
+            chunk_store: ChunkStore to read merged spans from; without it chunks are not merged
+            token_budget (Optional[int]): Override the packer's budget for this call
+
+        Returns:
+            Tuple[List[Dict[str, Any]], Dict[str, int]]: Passages (document, text, score) best first,
+                and token accounting for the request
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        tokens_before = sum(self.count_tokens(passage_header(r["document"]) + r["chunk"] + "\n\n") for r in results)
+
+        passages = self._merge(results, chunk_store)
+        merged = len(results) - len(passages)
+        passages.sort(key=lambda p: p["score"], reverse=True)
+        passages, duplicates = self._drop_duplicates(passages)
+
+        packed, used, truncated = [], 0, 0
+        for passage in passages:
+            header_tokens = self.count_tokens(passage_header(passage["document"]))
+            text_tokens = self.count_tokens(passage["text"] + "\n\n")
+            if used + header_tokens + text_tokens <= budget:
+                packed.append(passage)
+                used += header_tokens + text_tokens
+                continue
+            remaining = budget - used - header_tokens
+            if remaining >= MIN_PASSAGE_TOKENS:
+                text = self.truncate(passage["text"], remaining - 1)
+                packed.append(dict(passage, text=text))
+                used += header_tokens + self.count_tokens(text + "\n\n")
+                truncated += 1
+            break
+
+        stats = {
+            "chunks": len(results),
+            "passages": len(packed),
+            "merged_chunks": merged,
+            "duplicates_dropped": duplicates,
+            "passages_dropped": len(passages) - len(packed),
+            "truncated": truncated,
+            "token_budget": budget,
+            "tokens_before": tokens_before,
+            "tokens_after": used,
+            "tokens_saved": max(tokens_before - used, 0)
+        }
+        return packed, stats
+
+    def _merge(self, results: List[Dict[str, Any]], chunk_store) -> List[Dict[str, Any]]:
+        # Passages without spans (or without a store to read merged text from) pass through
+        passages, by_doc = [], {}
+        for result in results:
+            passage = {
+                "document": result["document"],
+                "path": result.get("path"),
+                "score": result["score"],
+                "text": result["chunk"],
+                "doc_id": result.get("doc_id"),
+                "start": result.get("start"),
+                "end": result.get("end")
+            }
+            if chunk_store is None or passage["start"] is None or passage["doc_id"] is None:
+                passages.append(passage)
+            else:
+                by_doc.setdefault(passage["doc_id"], []).append(passage)
+
+        for doc_id, doc_passages in by_doc.items():
+            doc_passages.sort(key=lambda p: p["start"])
+            current = doc_passages[0]
+            for passage in doc_passages[1:]:
+                if passage["start"] <= current["end"] + self.merge_gap:
+                    current["end"] = max(current["end"], passage["end"])
+                    current["score"] = max(current["score"], passage["score"])
+                    current["text"] = None  # Re-read below
+                else:
+                    passages.append(current)
+                    current = passage
+            passages.append(current)
+
+        for passage in passages:
+            if passage["text"] is None:
+                passage["text"] = chunk_store.read_span(passage["doc_id"], passage["start"], passage["end"])
+        # A document that changed on disk since indexing reads back empty
+        return [passage for passage in passages if passage["text"]]
+
+    def _drop_duplicates(self, passages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        kept, kept_shingles = [], []
+        for passage in passages:
+            words = WORD_PATTERN.findall(passage["text"].lower())
+            shingles = {tuple(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))}
+            if any(len(shingles & other) >= self.duplicate_threshold * len(shingles) for other in kept_shingles):
+                continue
+            kept.append(passage)
+            kept_shingles.append(shingles)
+        return kept, len(passages) - len(kept)
@@ -1,9 +1,10 @@
 import os
 import re
-import json
 from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 
+from utils.streaming_chunker import StreamingChunker, ChunkStore
+
 class DocumentProcessor:
     """
     Processes documents for the RAG system
@@ -13,11 +14,12 @@ class DocumentProcessor:
         Initialize the document processor
         
         Args:
-            chunk_size (int): Size of each document chunk in characters
-            chunk_overlap (int): Overlap between consecutive chunks in characters
+            chunk_size (int): Size of each document chunk in bytes (characters, for ASCII text)
+            chunk_overlap (int): Overlap between consecutive chunks in bytes
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.chunker = StreamingChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     
     def split_text(self, text: str) -> List[str]:
         """
@@ -29,38 +31,22 @@ class DocumentProcessor:
         Returns:
             List[str]: List of text chunks
         """
-        # Simple chunk-based splitting
-        chunks = []
+        return self.chunker.chunk_text(text)
+    
+    def chunk_file(self, file_path: str) -> np.ndarray:
+        """
+        Split a document on disk into chunks without reading it into memory
         
-        if len(text) <= self.chunk_size:
-            chunks.append(text)
-        else:
-            start = 0
-            while start < len(text):
-                end = min(start + self.chunk_size, len(text))
-                
-                # If we're not at the end and not at the beginning,
-                # try to find a natural breakpoint like a newline or period
-                if end < len(text) and start > 0:
-                    # Look for paragraph break
-                    paragraph_break = text.rfind('\n\n', start, end)
-                    if paragraph_break != -1 and paragraph_break > start + self.chunk_size // 2:
-                        end = paragraph_break + 2
-                    else:
-                        # Look for sentence break
-                        sentence_break = text.rfind('. ', start, end)
-                        if sentence_break != -1 and sentence_break > start + self.chunk_size // 2:
-                            end = sentence_break + 2
-                        else:
-                            # Look for word break
-                            word_break = text.rfind(' ', start, end)
-                            if word_break != -1:
-                                end = word_break + 1
-                
-                chunks.append(text[start:end].strip())
-                start = end - self.chunk_overlap
-                
-        return chunks
+        Args:
+            file_path (str): Path to the document
+            
+        Returns:
+            np.ndarray: (num_chunks, 2) array of byte spans into the file
+
+        Raises:
+            UnicodeDecodeError: If the file is not UTF-8 text, e.g. a binary file
+        """
+        return self.chunker.chunk_file(file_path)
     
     def process_document(self, file_path: str) -> Dict[str, Any]:
         """
@@ -70,36 +56,19 @@ class DocumentProcessor:
             file_path (str): Path to the document
             
         Returns:
-            Dict[str, Any]: Dictionary containing document metadata and chunks
+            Dict[str, Any]: Dictionary containing document metadata, chunks and their byte spans
         """
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        file_name = os.path.basename(file_path)
-        file_ext = os.path.splitext(file_name)[1].lower()
-        
-        # Handle different file types (simplified)
-        # In a real application, you might want to use specialized parsers for different file types
-        if file_ext in ['.md', '.txt', '.py', '.js', '.html']:
-            text = content
-        elif file_ext == '.json':
-            # Try to stringify the JSON content
-            try:
-                data = json.loads(content)
-                text = json.dumps(data, indent=2)
-            except:
-                text = content
-        else:
-            # Default to using the content as is
-            text = content
-            
-        # Split the document into chunks
-        chunks = self.split_text(text)
+        # Chunks are spans of the raw file; files that are not UTF-8 text raise here
+        spans = self.chunk_file(file_path)
+        store = ChunkStore.from_documents([file_path], [spans])
+        chunks = list(store)
+        store.close()
         
         return {
-            "filename": file_name,
+            "filename": os.path.basename(file_path),
             "path": file_path,
             "chunks": chunks,
+            "spans": spans,
             "num_chunks": len(chunks)
         }
     
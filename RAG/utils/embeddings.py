@@ -1,9 +1,21 @@
 import os
+import time
 import numpy as np
 import torch
 from typing import List, Dict, Any, Optional
+from prometheus_client import Counter, Histogram
 from sentence_transformers import SentenceTransformer
 
+import metrics
+
+# Embedding throughput, exported on /metrics: texts embedded and time spent,
+# for index builds ("documents") and queries ("query") separately
+EMBEDDED_TEXTS = Counter("rag_embedded_texts_total", "Texts embedded", ["kind"])
+EMBEDDING_SECONDS = Histogram(
+    "rag_embedding_seconds", "Time spent in one embedding call", ["kind"],
+    buckets=metrics.LATENCY_BUCKETS,
+)
+
 class EmbeddingModel:
     """
     Handles text embeddings for the RAG system using Sentence Transformers
@@ -29,7 +41,11 @@ class EmbeddingModel:
         Returns:
             np.ndarray: Numpy array of embeddings
         """
-        return self.model.encode(texts, convert_to_numpy=True)
+        started = time.perf_counter()
+        embeddings = self.model.encode(texts, convert_to_numpy=True)
+        EMBEDDING_SECONDS.labels("documents").observe(time.perf_counter() - started)
+        EMBEDDED_TEXTS.labels("documents").inc(len(texts))
+        return embeddings
     
     def embed_query(self, query: str) -> np.ndarray:
         """
@@ -41,9 +57,19 @@ class EmbeddingModel:
         Returns:
             np.ndarray: Numpy array containing the query embedding
         """
-        return self.model.encode(query, convert_to_numpy=True)
+        started = time.perf_counter()
+        embedding = self.model.encode(query, convert_to_numpy=True)
+        EMBEDDING_SECONDS.labels("query").observe(time.perf_counter() - started)
+        EMBEDDED_TEXTS.labels("query").inc()
+        return embedding
     
-    def similarity_search(self, query_embedding: np.ndarray, document_embeddings: np.ndarray, top_k: int = 5) -> List[Dict[str, Any]]:
+    def similarity_search(
+        self,
+        query_embedding: np.ndarray,
+        document_embeddings: np.ndarray,
+        top_k: int = 5,
+        mask: Optional[np.ndarray] = None
+    ) -> List[Dict[str, Any]]:
         """
         Find the most similar documents to a query using cosine similarity
         
@@ -51,6 +77,7 @@ class EmbeddingModel:
             query_embedding (np.ndarray): Query embedding
             document_embeddings (np.ndarray): Document embeddings
             top_k (int): Number of results to return
+            mask (Optional[np.ndarray]): Boolean mask over the documents; only those set are returned
             
         Returns:
             List[Dict[str, Any]]: List of dictionaries containing index and score
@@ -59,6 +86,9 @@ class EmbeddingModel:
         scores = np.dot(document_embeddings, query_embedding) / (
             np.linalg.norm(document_embeddings, axis=1) * np.linalg.norm(query_embedding)
         )
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            top_k = min(top_k, int(np.count_nonzero(mask)))
         
         # Get top-k results
         top_indices = np.argsort(scores)[::-1][:top_k]
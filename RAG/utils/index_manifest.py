@@ -0,0 +1,227 @@
+import os
+import json
+import struct
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+MANIFEST_FILE = "rag_index.bin"
+LEGACY_INDEX_FILE = "rag_index.json"
+
+FORMAT_VERSION = 2  # 2 adds the chunk byte spans
+MAGIC = b"RAGINDEX"
+# Magic, format version, header length; the JSON header follows, then the arrays
+PREAMBLE = struct.Struct("<8sII")
+ALIGNMENT = 8
+
+
+class IndexManifest:
+    """
+    Chunk-to-document mapping of a RAG index, stored in a compact binary file
+
+    Layout: a fixed preamble (magic, format version, header length), a JSON
+    header with the index settings and the per-document metadata, then two
+    int32 arrays with one entry per chunk: the document it belongs to
+    (position in the metadata list) and its position within that document.
+    When the header says so, two int64 arrays with each chunk's start and
+    end byte offset in its document follow, 8-byte aligned. The arrays are
+    memory-mapped on load, so opening a manifest costs the same for a
+    thousand chunks as for a million.
+    """
+    def __init__(
+        self,
+        metadata: List[Dict[str, Any]],
+        doc_ids: np.ndarray,
+        chunk_ids: np.ndarray,
+        starts: Optional[np.ndarray] = None,
+        ends: Optional[np.ndarray] = None,
+        embedding_model: Optional[str] = None,
+        chunk_size: Optional[int] = None,
+        chunk_overlap: Optional[int] = None
+    ):
+        """
+        Initialize a manifest
+
+        Args:
+            metadata (List[Dict[str, Any]]): Per-document metadata, in index order
+            doc_ids (np.ndarray): Document of each chunk
+            chunk_ids (np.ndarray): Position of each chunk within its document
+            starts (Optional[np.ndarray]): Start byte offset of each chunk in its document
+            ends (Optional[np.ndarray]): End byte offset of each chunk in its document
+            embedding_model (Optional[str]): Model the chunk embeddings were made with
+            chunk_size (Optional[int]): Chunker setting the index was built with
+            chunk_overlap (Optional[int]): Chunker setting the index was built with
+        """
+        self.metadata = metadata
+        self.doc_ids = doc_ids
+        self.chunk_ids = chunk_ids
+        self.starts = starts
+        self.ends = ends
+        self.embedding_model = embedding_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+
+    @property
+    def num_chunks(self) -> int:
+        return len(self.doc_ids)
+
+    @property
+    def has_spans(self) -> bool:
+        return self.starts is not None and self.ends is not None
+
+    @classmethod
+    def from_documents(
+        cls,
+        metadata: List[Dict[str, Any]],
+        starts: Optional[np.ndarray] = None,
+        ends: Optional[np.ndarray] = None,
+        **settings
+    ) -> "IndexManifest":
+        """
+        Build the mapping for documents whose chunks are stored consecutively, in metadata order
+
+        Args:
+            metadata (List[Dict[str, Any]]): Per-document metadata with "num_chunks"
+            starts (Optional[np.ndarray]): Start byte offset of each chunk
+            ends (Optional[np.ndarray]): End byte offset of each chunk
+            **settings: embedding_model, chunk_size and chunk_overlap
+
+        Returns:
+            IndexManifest: The manifest
+        """
+        counts = np.array([doc["num_chunks"] for doc in metadata], dtype=np.int64)
+        first_chunk = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(np.int64) if len(counts) else counts
+        doc_ids = np.repeat(np.arange(len(counts), dtype=np.int32), counts)
+        chunk_ids = (np.arange(len(doc_ids), dtype=np.int64) - np.repeat(first_chunk, counts)).astype(np.int32)
+        return cls(metadata, doc_ids, chunk_ids, starts=starts, ends=ends, **settings)
+
+    @classmethod
+    def from_legacy_json(cls, path: str) -> "IndexManifest":
+        """
+        Read an index written in the old rag_index.json format
+
+        Args:
+            path (str): Path of the rag_index.json file
+
+        Returns:
+            IndexManifest: The same index as a manifest
+        """
+        with open(path, 'r') as f:
+            index_data = json.load(f)
+        num_chunks = index_data.get("num_chunks", len(index_data["document_index"]))
+        doc_ids = np.zeros(num_chunks, dtype=np.int32)
+        chunk_ids = np.zeros(num_chunks, dtype=np.int32)
+        for key, entry in index_data["document_index"].items():
+            idx = int(key)
+            if idx < num_chunks:
+                doc_ids[idx] = entry["doc_idx"]
+                chunk_ids[idx] = entry["chunk_idx"]
+        return cls(
+            index_data["metadata"],
+            doc_ids,
+            chunk_ids,
+            embedding_model=index_data.get("embedding_model"),
+            chunk_size=index_data.get("chunk_size"),
+            chunk_overlap=index_data.get("chunk_overlap")
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Write the manifest; the file is replaced atomically
+
+        Args:
+            path (str): File to write
+        """
+        doc_ids = np.ascontiguousarray(self.doc_ids, dtype="<i4")
+        chunk_ids = np.ascontiguousarray(self.chunk_ids, dtype="<i4")
+        header = {
+            "embedding_model": self.embedding_model,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "num_chunks": len(doc_ids),
+            "spans": self.has_spans,
+            "metadata": self.metadata
+        }
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = PREAMBLE.size + len(header_bytes)
+        padding = -data_start % ALIGNMENT
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes) + padding))
+            f.write(header_bytes + b" " * padding)
+            f.write(doc_ids.tobytes())
+            f.write(chunk_ids.tobytes())
+            if self.has_spans:
+                f.write(b"\0" * (-(2 * 4 * len(doc_ids)) % ALIGNMENT))
+                f.write(np.ascontiguousarray(self.starts, dtype="<i8").tobytes())
+                f.write(np.ascontiguousarray(self.ends, dtype="<i8").tobytes())
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "IndexManifest":
+        """
+        Open a manifest written by save()
+
+        Args:
+            path (str): File written by save()
+            mmap (bool): Memory-map the arrays instead of reading them into RAM
+
+        Returns:
+            IndexManifest: The manifest
+        """
+        with open(path, 'rb') as f:
+            magic, version, header_length = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a RAG index manifest")
+            if version > FORMAT_VERSION:
+                raise ValueError(f"{path} has format version {version}; this code reads up to {FORMAT_VERSION}")
+            header = json.loads(f.read(header_length))
+
+        num_chunks = header["num_chunks"]
+        offset = PREAMBLE.size + header_length
+        ids = cls._read_arrays(path, "<i4", offset, num_chunks, mmap)
+        spans = [None, None]
+        if header.get("spans"):
+            offset += 2 * 4 * num_chunks
+            offset += -offset % ALIGNMENT
+            spans = cls._read_arrays(path, "<i8", offset, num_chunks, mmap)
+        return cls(
+            header["metadata"],
+            ids[0],
+            ids[1],
+            starts=spans[0],
+            ends=spans[1],
+            embedding_model=header.get("embedding_model"),
+            chunk_size=header.get("chunk_size"),
+            chunk_overlap=header.get("chunk_overlap")
+        )
+
+    @staticmethod
+    def _read_arrays(path: str, dtype: str, offset: int, num_chunks: int, mmap: bool) -> np.ndarray:
+        # Two arrays of num_chunks entries each, back to back
+        if mmap and num_chunks:
+            return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(2, num_chunks))
+        return np.fromfile(path, dtype=dtype, count=2 * num_chunks, offset=offset).reshape(2, num_chunks)
+
+
+def load_manifest(embeddings_dir: str, migrate: bool = True) -> Optional[IndexManifest]:
+    """
+    Open the index in an embeddings directory, converting an old rag_index.json if needed
+
+    Args:
+        embeddings_dir (str): Directory holding the index files
+        migrate (bool): Write the binary manifest when only the JSON index exists
+
+    Returns:
+        Optional[IndexManifest]: The manifest, or None if there is no index
+    """
+    manifest_path = os.path.join(embeddings_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        return IndexManifest.load(manifest_path)
+    legacy_path = os.path.join(embeddings_dir, LEGACY_INDEX_FILE)
+    if not os.path.exists(legacy_path):
+        return None
+    manifest = IndexManifest.from_legacy_json(legacy_path)
+    if migrate:
+        manifest.save(manifest_path)
+    return manifest
@@ -0,0 +1,208 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+STAGING_PREFIX = ".staging-"
+KEEP_VERSIONS = 3  # Published versions kept on disk, the current one included
+
+
+def current_version(embeddings_dir: str) -> Optional[str]:
+    """
+    Name of the published index version, from the CURRENT pointer file
+
+    Args:
+        embeddings_dir (str): Directory holding the index versions
+
+    Returns:
+        Optional[str]: The version, or None if nothing was ever published
+    """
+    try:
+        with open(os.path.join(embeddings_dir, CURRENT_FILE), 'r') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def version_dir(embeddings_dir: str, version: Optional[str]) -> str:
+    """
+    Directory holding the files of an index version
+
+    Args:
+        embeddings_dir (str): Directory holding the index versions
+        version (Optional[str]): Version name; None is the flat layout used before versioning
+
+    Returns:
+        str: The directory
+    """
+    if version is None:
+        return embeddings_dir
+    return os.path.join(embeddings_dir, VERSIONS_DIR, version)
+
+
+def current_index_dir(embeddings_dir: str) -> str:
+    """
+    Directory of the published index (embeddings_dir itself for an unversioned index)
+    """
+    return version_dir(embeddings_dir, current_version(embeddings_dir))
+
+
+def list_versions(embeddings_dir: str) -> List[str]:
+    """
+    Published versions on disk, oldest first
+    """
+    root = os.path.join(embeddings_dir, VERSIONS_DIR)
+    if not os.path.isdir(root):
+        return []
+    return sorted(name for name in os.listdir(root) if not name.startswith(STAGING_PREFIX))
+
+
+@contextmanager
+def publish_version(embeddings_dir: str, keep: int = KEEP_VERSIONS) -> Iterator[Tuple[str, str]]:
+    """
+    Write a new index version and publish it atomically
+
+    The caller writes the index files into the staging directory it is
+    given. When the block exits normally the directory is renamed to its
+    version name and the CURRENT pointer is replaced (write, then rename),
+    so a reader sees either the old version or the complete new one. On an
+    error the staging directory is removed and nothing is published.
+
+        with publish_version(embeddings_dir) as (index_dir, version):
+            manifest.save(os.path.join(index_dir, MANIFEST_FILE))
+
+    Args:
+        embeddings_dir (str): Directory holding the index versions
+        keep (int): Published versions to keep; older ones are deleted
+
+    Yields:
+        Tuple[str, str]: Staging directory to write into, and the version name
+    """
+    # Millisecond timestamps sort in publish order; the suffix separates concurrent writers
+    version = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+    root = os.path.join(embeddings_dir, VERSIONS_DIR)
+    staging_dir = os.path.join(root, STAGING_PREFIX + version)
+    os.makedirs(staging_dir)
+    try:
+        yield staging_dir, version
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    os.rename(staging_dir, os.path.join(root, version))
+    pointer_tmp = os.path.join(embeddings_dir, f"{CURRENT_FILE}.{version}.tmp")
+    with open(pointer_tmp, 'w') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(embeddings_dir, CURRENT_FILE))
+    prune_versions(embeddings_dir, keep)
+
+
+def link_into(source: str, target: str) -> None:
+    """
+    Hard-link a file, or every file under a directory, of a published version into a new one
+
+    Published versions are never modified, so a file that did not change
+    can be shared instead of written again. Where hard links are not
+    supported the file is copied.
+
+    Args:
+        source (str): File or directory in a published version
+        target (str): Same path in the staging directory
+    """
+    if os.path.isdir(source):
+        os.makedirs(target, exist_ok=True)
+        for name in os.listdir(source):
+            link_into(os.path.join(source, name), os.path.join(target, name))
+        return
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def prune_versions(embeddings_dir: str, keep: int = KEEP_VERSIONS) -> None:
+    """
+    Delete all but the newest published versions, never the current one
+
+    Servers still holding an older version keep working: their embeddings
+    and memory-mapped index files stay readable until they let go of them.
+    """
+    current = current_version(embeddings_dir)
+    for version in list_versions(embeddings_dir)[:-keep] if keep > 0 else []:
+        if version != current:
+            shutil.rmtree(version_dir(embeddings_dir, version), ignore_errors=True)
+
+
+class IndexWatcher:
+    """
+    Background thread that notices newly published index versions
+
+    Every interval seconds it reads the CURRENT pointer; when the version
+    differs from the one last seen it calls on_change(version) on its own
+    thread, so the caller can load the new version while queries keep
+    using the old one, then swap a single reference. A version whose load
+    fails is not retried until another version is published.
+    """
+    def __init__(
+        self,
+        embeddings_dir: str,
+        on_change: Callable[[str], None],
+        interval: float = 5.0,
+        version: Optional[str] = None
+    ):
+        """
+        Initialize the watcher
+
+        Args:
+            embeddings_dir (str): Directory holding the index versions
+            on_change (Callable[[str], None]): Loads and swaps in the given version
+            interval (float): Seconds between checks
+            version (Optional[str]): Version already loaded
+        """
+        self.embeddings_dir = embeddings_dir
+        self.on_change = on_change
+        self.interval = interval
+        self.version = version
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def check(self) -> bool:
+        """
+        Load the published version if it is new
+
+        Returns:
+            bool: True if a new version was loaded
+        """
+        version = current_version(self.embeddings_dir)
+        if version is None or version == self.version:
+            return False
+        self.version = version  # Set first, so a failing version is not reloaded every interval
+        try:
+            self.on_change(version)
+        except Exception as e:
+            print(f"Error loading index version {version}: {str(e)}")
+            return False
+        return True
+
+    def start(self) -> "IndexWatcher":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="index-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
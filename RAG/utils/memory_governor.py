@@ -0,0 +1,199 @@
+import gc
+import os
+import sys
+import time
+from typing import Iterator, Optional, Tuple
+
+try:
+    import psutil
+except ImportError:  # Fall back to /proc or getrusage
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+LOG_INTERVAL = 10.0  # Seconds between over-budget messages (and forced collections)
+
+
+def resident_memory() -> Tuple[int, int]:
+    """
+    Resident memory of this process in bytes, as (private, file-backed)
+
+    File-backed pages, e.g. of a memory-mapped checkpoint being filled,
+    count towards RSS but the kernel can drop them at any time, so only
+    the private (anonymous) part is held against a budget.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            fields = f.read().split()
+        page_size = os.sysconf("SC_PAGE_SIZE")
+        resident, shared = int(fields[1]) * page_size, int(fields[2]) * page_size
+        return resident - shared, shared
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if psutil is not None:
+        info = psutil.Process(os.getpid()).memory_info()
+        shared = getattr(info, "shared", 0)
+        return info.rss - shared, shared
+    return peak_rss() or 0, 0
+
+
+def current_rss() -> int:
+    """
+    Private resident memory of this process in bytes (see resident_memory)
+    """
+    return resident_memory()[0]
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Highest resident set size this process has reached, in bytes (None where unsupported)
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # kilobytes on Linux
+
+
+def memory_budget_from_env(fraction: float = 0.8) -> int:
+    """
+    Memory budget for a build: RAG_MEMORY_BUDGET_MB, or a fraction of what this process could grow to
+
+    Args:
+        fraction (float): Share of (current private memory + available system memory) used when the variable is unset
+
+    Returns:
+        int: Budget in bytes
+    """
+    if os.getenv("RAG_MEMORY_BUDGET_MB"):
+        return int(float(os.environ["RAG_MEMORY_BUDGET_MB"]) * MB)
+    if psutil is not None:
+        return int((current_rss() + psutil.virtual_memory().available) * fraction)
+    return 1024 * MB
+
+
+class MemoryGovernor:
+    """
+    Sizes embedding batches so the process stays within a memory budget
+
+    Around every batch it measures how much private resident memory grew,
+    current and peak, and keeps an estimate of the memory one chunk costs:
+    its text and tokens, activations while embedding, and its share of the
+    result. File-backed pages, such as a memory-mapped checkpoint, are not
+    counted. The next batch is as large as the remaining budget allows at
+    that cost (with headroom), growing at most twofold per batch. Batches
+    that barely grow memory lower the estimate, so the size recovers after
+    a spike. If a batch ends over budget, the batch size is halved; the
+    message and a forced garbage collection happen at most once every
+    LOG_INTERVAL seconds.
+    """
+    def __init__(
+        self,
+        budget_bytes: int,
+        initial_batch_size: int = 8,
+        min_batch_size: int = 1,
+        max_batch_size: int = 512,
+        headroom: float = 0.85
+    ):
+        """
+        Initialize the governor
+
+        Args:
+            budget_bytes (int): Target maximum private resident memory of the process
+            initial_batch_size (int): Size of the first batch
+            min_batch_size (int): Never go below this
+            max_batch_size (int): Never go above this
+            headroom (float): Fraction of the budget batches are planned to fill
+        """
+        self.budget_bytes = budget_bytes
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.headroom = headroom
+        self.batch_size = max(min_batch_size, min(initial_batch_size, max_batch_size))
+        self.item_bytes: Optional[float] = None  # Estimated memory cost of one chunk
+        self.peak_bytes = 0
+        self.batches_over_budget = 0
+        self._last_warning = 0.0
+        self._unreported = 0  # Batches over budget since the last message
+
+    def batches(self, total: int, start: int = 0) -> Iterator[Tuple[int, int]]:
+        """
+        Yield (start, end) ranges covering start .. total, sized as the budget allows
+
+        The memory the caller uses while handling a range, between this
+        generator's yields, is what gets measured; handle one batch per
+        iteration and do not hold earlier batches.
+
+        Args:
+            total (int): End of the range
+            start (int): First item, e.g. where a resumed build continues
+
+        Yields:
+            Tuple[int, int]: The next batch
+        """
+        while start < total:
+            end = min(start + self.batch_size, total)
+            rss_before, peak_before = current_rss(), peak_rss()
+            yield start, end
+            self.observe(end - start, rss_before, peak_before)
+            start = end
+
+    def observe(self, batch_size: int, rss_before: int, peak_before: Optional[int] = None) -> None:
+        """
+        Update the cost estimate from one finished batch and choose the next batch size
+
+        Args:
+            batch_size (int): Items in the batch
+            rss_before (int): Private resident memory when the batch started
+            peak_before (Optional[int]): Peak RSS when the batch started
+        """
+        rss_after, shared_after = resident_memory()
+        peak_after = peak_rss()
+        # A new process peak was set during this batch: that is its true high point. The peak
+        # includes file-backed pages, which only grow while a checkpoint is filled
+        high = rss_after
+        if peak_after is not None and peak_before is not None and peak_after > peak_before:
+            high = max(high, peak_after - shared_after)
+        self.peak_bytes = max(self.peak_bytes, high)
+
+        # Follow increases at once, decreases gradually; a batch that barely grew memory
+        # (its activations fit in memory freed earlier) lowers the estimate
+        sample = max(high - rss_before, 0) / batch_size
+        self.item_bytes = sample if self.item_bytes is None else max(sample, 0.7 * self.item_bytes + 0.3 * sample)
+
+        if high > self.budget_bytes:
+            self.batches_over_budget += 1
+            self._unreported += 1
+            self.batch_size = max(self.min_batch_size, batch_size // 2)
+            now = time.monotonic()
+            if now - self._last_warning >= LOG_INTERVAL:
+                self._last_warning = now
+                gc.collect()
+                repeated = f" ({self._unreported} batches over budget since the last message)" if self._unreported > 1 else ""
+                print(f"Memory: {high / MB:.0f} MB is over the {self.budget_bytes / MB:.0f} MB budget; batch size now {self.batch_size}{repeated}")
+                self._unreported = 0
+            return
+
+        room = self.budget_bytes * self.headroom - rss_after
+        if room <= 0:
+            target = self.min_batch_size
+        elif self.item_bytes:
+            target = min(int(room / self.item_bytes), batch_size * 2)
+        else:
+            target = batch_size * 2
+        self.batch_size = max(self.min_batch_size, min(target, self.max_batch_size))
+
+    def stats(self) -> dict:
+        """
+        Summary for the build log
+        """
+        return {
+            "budget_mb": round(self.budget_bytes / MB, 1),
+            "peak_mb": round(self.peak_bytes / MB, 1),
+            "batch_size": self.batch_size,
+            "item_kb": round(self.item_bytes / 1024, 1) if self.item_bytes else None,
+            "batches_over_budget": self.batches_over_budget
+        }
@@ -0,0 +1,414 @@
+import codecs
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+
+class StreamingChunker:
+    """
+    Splits a file into overlapping chunks in one pass, as byte spans
+
+    The file is read in fixed-size buffers and only the window around the
+    current chunk is kept in memory. Chunk boundaries follow the same
+    heuristics as before: prefer a paragraph break, then a sentence break,
+    in the second half of the window, else the last word break. Chunks are
+    emitted as (start, end) byte offsets with surrounding whitespace
+    trimmed; the text itself is only read when needed (see ChunkStore).
+
+    Sizes are in bytes, not characters: a chunk of non-ASCII text holds
+    fewer characters than chunk_size. Every buffer is checked to be UTF-8
+    as it is read, and a file that is not raises UnicodeDecodeError, so
+    binary files are skipped just as when documents were read as text.
+    """
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 128, buffer_size: int = 1 << 16):
+        """
+        Initialize the chunker
+
+        Args:
+            chunk_size (int): Maximum chunk size in bytes (characters, for ASCII text)
+            chunk_overlap (int): Overlap between consecutive chunks in bytes
+            buffer_size (int): Bytes read from the file at a time
+        """
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.buffer_size = max(buffer_size, chunk_size)
+
+    def iter_spans(self, stream: BinaryIO) -> Iterator[Tuple[int, int]]:
+        """
+        Yield the (start, end) byte spans of the chunks of a binary stream
+
+        Args:
+            stream (BinaryIO): Stream positioned at the start of the document
+
+        Yields:
+            Tuple[int, int]: Byte offsets of each non-empty chunk
+
+        Raises:
+            UnicodeDecodeError: If the stream is not UTF-8 text
+        """
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        buf = bytearray()
+        base = 0  # Stream offset of buf[0]
+        start = 0
+        eof = False
+
+        while True:
+            # Fill the window, plus one byte to tell whether the stream ends inside it
+            while not eof and base + len(buf) <= start + self.chunk_size:
+                block = stream.read(self.buffer_size)
+                # Only validates; raises on the first byte that is not UTF-8
+                decoder.decode(block, final=not block)
+                if block:
+                    buf += block
+                else:
+                    eof = True
+
+            limit = base + len(buf)
+            if start >= limit:
+                return
+            end = min(start + self.chunk_size, limit)
+            last = eof and end == limit
+            if not last:
+                end = base + self._break_point(buf, start - base, end - base)
+                end = base + self._char_boundary(buf, start - base, end - base)
+
+            span = self._trim(buf, start - base, end - base)
+            if span is not None:
+                yield base + span[0], base + span[1]
+            if last:
+                return
+
+            # Step back by the overlap, always moving forward, and never into a UTF-8 sequence
+            start = max(end - self.chunk_overlap, start + 1)
+            while start < limit and (buf[start - base] & 0xC0) == 0x80:
+                start += 1
+
+            # Drop bytes no chunk can reach any more; amortized, each byte is moved once
+            if start - base >= self.buffer_size:
+                del buf[:start - base]
+                base = start
+
+    def chunk_file(self, file_path: str) -> np.ndarray:
+        """
+        Chunk a file
+
+        Args:
+            file_path (str): Path to the document
+
+        Returns:
+            np.ndarray: (num_chunks, 2) int64 array of byte spans
+
+        Raises:
+            UnicodeDecodeError: If the file is not UTF-8 text
+        """
+        with open(file_path, 'rb') as f:
+            return self._to_array(self.iter_spans(f))
+
+    def chunk_text(self, text: str) -> List[str]:
+        """
+        Chunk an in-memory string
+
+        Args:
+            text (str): Text to split
+
+        Returns:
+            List[str]: The chunk texts
+        """
+        data = text.encode("utf-8")
+        return [
+            data[start:end].decode("utf-8", errors="replace")
+            for start, end in self.iter_spans(io.BytesIO(data))
+        ]
+
+    @staticmethod
+    def _to_array(spans: Iterator[Tuple[int, int]]) -> np.ndarray:
+        flat = np.fromiter((offset for span in spans for offset in span), dtype=np.int64)
+        return flat.reshape(-1, 2)
+
+    def _break_point(self, buf: bytearray, start: int, end: int) -> int:
+        # Same preference order as DocumentProcessor.split_text always used
+        half = start + self.chunk_size // 2
+        paragraph_break = buf.rfind(b"\n\n", start, end)
+        if paragraph_break != -1 and paragraph_break > half:
+            return paragraph_break + 2
+        sentence_break = buf.rfind(b". ", start, end)
+        if sentence_break != -1 and sentence_break > half:
+            return sentence_break + 2
+        word_break = buf.rfind(b" ", start, end)
+        if word_break != -1:
+            return word_break + 1
+        return end
+
+    @staticmethod
+    def _char_boundary(buf: bytearray, start: int, end: int) -> int:
+        # Move end back off UTF-8 continuation bytes so no character is split
+        boundary = end
+        while boundary > start and boundary < len(buf) and (buf[boundary] & 0xC0) == 0x80:
+            boundary -= 1
+        return boundary if boundary > start else end
+
+    @staticmethod
+    def _trim(buf: bytearray, start: int, end: int) -> Optional[Tuple[int, int]]:
+        while start < end and buf[start] in WHITESPACE:
+            start += 1
+        while end > start and buf[end - 1] in WHITESPACE:
+            end -= 1
+        return (start, end) if end > start else None
+
+
+def file_signature(path: str) -> Dict[str, int]:
+    """
+    Size and modification time of a file, stored with its document metadata
+
+    ChunkStore compares them with the file when it reads chunk text, so a
+    document edited after indexing is noticed instead of read at stale offsets.
+
+    Args:
+        path (str): Document path
+
+    Returns:
+        Dict[str, int]: {"size": bytes, "mtime_ns": modification time}
+    """
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class ChunkStore:
+    """
+    List-like view of chunk texts stored as byte spans into the source files
+
+    Indexing a store reads the span from the file with a positional read,
+    so holding millions of chunks costs three integers each instead of a
+    string. The most recently used files stay open, up to max_open_files.
+
+    Each read first checks the open file against the size and modification
+    time recorded when the document was chunked (only that spans end within
+    the file, for indexes without them). A document that changed since is
+    not read: its chunks come back empty and a warning asks for a reindex,
+    rather than returning text from the wrong offsets.
+    """
+    def __init__(
+        self,
+        paths: List[str],
+        doc_ids: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        max_open_files: int = 64,
+        signatures: Optional[Sequence[Optional[Dict[str, int]]]] = None
+    ):
+        """
+        Initialize a store
+
+        Args:
+            paths (List[str]): Source file of each document
+            doc_ids (np.ndarray): Document of each chunk
+            starts (np.ndarray): Start byte offset of each chunk
+            ends (np.ndarray): End byte offset of each chunk
+            max_open_files (int): Files kept open at once
+            signatures (Optional[Sequence[Optional[Dict[str, int]]]]): file_signature() of each
+                document when it was chunked; None where unknown
+        """
+        self.paths = list(paths)
+        self.doc_ids = doc_ids
+        self.starts = starts
+        self.ends = ends
+        self.max_open_files = max_open_files
+        self.signatures = list(signatures) if signatures is not None else [None] * len(self.paths)
+        self.stale: set = set()  # Documents found changed since they were chunked
+        self._files: "OrderedDict[int, Optional[int]]" = OrderedDict()  # Document -> file descriptor
+        self._lock = threading.Lock()  # Retrieval runs on several threads; eviction closes files
+
+    @classmethod
+    def from_documents(
+        cls,
+        paths: List[str],
+        spans: Sequence[np.ndarray],
+        signatures: Optional[Sequence[Optional[Dict[str, int]]]] = None
+    ) -> "ChunkStore":
+        """
+        Build a store from per-document span arrays
+
+        Args:
+            paths (List[str]): Source file of each document
+            spans (Sequence[np.ndarray]): (num_chunks, 2) spans of each document, same order as paths
+            signatures (Optional[Sequence[Optional[Dict[str, int]]]]): file_signature() of each document
+
+        Returns:
+            ChunkStore: The store
+        """
+        counts = [len(s) for s in spans]
+        stacked = np.concatenate(list(spans)) if spans else np.zeros((0, 2), dtype=np.int64)
+        doc_ids = np.repeat(np.arange(len(paths), dtype=np.int32), counts)
+        return cls(paths, doc_ids, stacked[:, 0].copy(), stacked[:, 1].copy(), signatures=signatures)
+
+    @classmethod
+    def from_manifest(cls, manifest: Any) -> "ChunkStore":
+        """
+        Store for the chunk spans of an IndexManifest
+
+        Args:
+            manifest (IndexManifest): Manifest with spans
+
+        Returns:
+            ChunkStore: The store
+        """
+        return cls(
+            [doc["path"] for doc in manifest.metadata],
+            manifest.doc_ids,
+            manifest.starts,
+            manifest.ends,
+            signatures=[document_signature(doc) for doc in manifest.metadata]
+        )
+
+    def add_document(self, path: str, spans: np.ndarray, signature: Optional[Dict[str, int]] = None) -> None:
+        """
+        Append the chunks of one document
+
+        Args:
+            path (str): Source file
+            spans (np.ndarray): (num_chunks, 2) byte spans
+            signature (Optional[Dict[str, int]]): file_signature() of the file when it was chunked
+        """
+        self.doc_ids = np.concatenate([self.doc_ids, np.full(len(spans), len(self.paths), dtype=np.int32)])
+        self.starts = np.concatenate([self.starts, spans[:, 0]])
+        self.ends = np.concatenate([self.ends, spans[:, 1]])
+        self.paths.append(path)
+        self.signatures.append(signature)
+
+    def with_document(self, path: str, spans: np.ndarray, signature: Optional[Dict[str, int]] = None) -> "ChunkStore":
+        """
+        New store with one more document's chunks; this one is left unchanged
+
+        Args:
+            path (str): Source file
+            spans (np.ndarray): (num_chunks, 2) byte spans
+            signature (Optional[Dict[str, int]]): file_signature() of the file when it was chunked
+
+        Returns:
+            ChunkStore: The extended store
+        """
+        store = ChunkStore(self.paths, self.doc_ids, self.starts, self.ends, self.max_open_files, self.signatures)
+        store.add_document(path, spans, signature)
+        return store
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self.text(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("chunk index out of range")
+        return self.text(index)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.text(i)
+
+    def text(self, index: int) -> str:
+        """
+        Read one chunk's text from its source file
+
+        Args:
+            index (int): Chunk index
+
+        Returns:
+            str: The chunk text ("" if the file is gone, empty or changed since indexing)
+        """
+        return self.read_span(int(self.doc_ids[index]), int(self.starts[index]), int(self.ends[index]))
+
+    def read_span(self, doc_id: int, start: int, end: int) -> str:
+        """
+        Read any byte span of a document, e.g. several merged chunks
+
+        Args:
+            doc_id (int): Document index
+            start (int): Start byte offset
+            end (int): End byte offset
+
+        Returns:
+            str: The text ("" if the file is gone, empty or changed since indexing)
+        """
+        with self._lock:
+            fd = self._open(doc_id)
+            if fd is None or not self._unchanged(doc_id, fd, end):
+                return ""
+            if hasattr(os, "pread"):
+                data = os.pread(fd, end - start, start)
+            else:  # Windows; the lock keeps the seek and read together
+                os.lseek(fd, start, os.SEEK_SET)
+                data = os.read(fd, end - start)
+        return data.decode("utf-8", errors="replace")
+
+    def is_stale(self, doc_id: int) -> bool:
+        """
+        Whether a document was found changed since it was chunked
+        """
+        return doc_id in self.stale
+
+    def batches(self, batch_size: int) -> Iterator[List[str]]:
+        """
+        Materialize the chunk texts a batch at a time, e.g. for embedding
+
+        Args:
+            batch_size (int): Chunks per batch
+
+        Yields:
+            List[str]: Consecutive chunk texts
+        """
+        for start in range(0, len(self), batch_size):
+            yield self[start:start + batch_size]
+
+    def _open(self, doc_id: int) -> Optional[int]:
+        if doc_id in self._files:
+            self._files.move_to_end(doc_id)
+            return self._files[doc_id]
+        try:
+            fd = os.open(self.paths[doc_id], os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        except OSError:
+            fd = None
+        self._files[doc_id] = fd
+        if len(self._files) > self.max_open_files:
+            _, evicted = self._files.popitem(last=False)
+            if evicted is not None:
+                os.close(evicted)
+        return fd
+
+    def _unchanged(self, doc_id: int, fd: int, end: int) -> bool:
+        # Checked on every read: a file rewritten in place would otherwise be read at stale offsets
+        if doc_id in self.stale:
+            return False
+        stat = os.fstat(fd)
+        signature = self.signatures[doc_id] if doc_id < len(self.signatures) else None
+        if signature is not None:
+            unchanged = stat.st_size == signature["size"] and stat.st_mtime_ns == signature["mtime_ns"]
+        else:
+            unchanged = end <= stat.st_size
+        if not unchanged:
+            self.stale.add(doc_id)
+            print(f"Warning: {self.paths[doc_id]} changed after it was indexed; its chunks are skipped until it is reindexed")
+        return unchanged
+
+    def close(self) -> None:
+        with self._lock:
+            for fd in self._files.values():
+                if fd is not None:
+                    os.close(fd)
+            self._files.clear()
+
+
+def document_signature(doc_meta: Dict[str, Any]) -> Optional[Dict[str, int]]:
+    """
+    The file_signature() stored in a document's metadata, or None for indexes built without it
+    """
+    if "size" in doc_meta and "mtime_ns" in doc_meta:
+        return {"size": int(doc_meta["size"]), "mtime_ns": int(doc_meta["mtime_ns"])}
+    return None
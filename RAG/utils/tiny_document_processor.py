@@ -1,9 +1,11 @@
 """
-Super memory-efficient document processor that handles files line by line
+Super memory-efficient document processor that streams files in fixed-size buffers
 """
 import os
 import logging
 
+from utils.streaming_chunker import StreamingChunker, ChunkStore
+
 logger = logging.getLogger(__name__)
 
 class TinyDocumentProcessor:
@@ -14,11 +16,12 @@ class TinyDocumentProcessor:
         Initialize the document processor
         
         Args:
-            chunk_size (int): Maximum size of each chunk in characters
-            chunk_overlap (int): Overlap between consecutive chunks in characters
+            chunk_size (int): Maximum size of each chunk in bytes (characters, for ASCII text)
+            chunk_overlap (int): Overlap between consecutive chunks in bytes
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.chunker = StreamingChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
     
     def process_document(self, file_path):
         """
@@ -36,34 +39,12 @@ class TinyDocumentProcessor:
         filename = os.path.basename(file_path)
         logger.info(f"Processing document: {filename}")
         
-        # Process the file line by line to avoid loading the entire file into memory
-        chunks = []
-        current_chunk = ""
-        
         try:
-            # Read the file line by line
-            with open(file_path, 'r', encoding='utf-8') as f:
-                for line in f:
-                    # Add the line to the current chunk
-                    if len(current_chunk) + len(line) <= self.chunk_size:
-                        current_chunk += line
-                    else:
-                        # If adding the line would exceed chunk_size, save the current chunk
-                        if current_chunk:
-                            chunks.append(current_chunk.strip())
-                        
-                        # Start a new chunk with overlap
-                        if len(current_chunk) > self.chunk_overlap:
-                            # Get the last part of the current chunk for overlap
-                            overlap_text = current_chunk[-self.chunk_overlap:]
-                            current_chunk = overlap_text + line
-                        else:
-                            # If the current chunk is smaller than the overlap, just use it all
-                            current_chunk = current_chunk + line
-            
-            # Add the last chunk if not empty
-            if current_chunk:
-                chunks.append(current_chunk.strip())
+            # Stream the file in fixed-size buffers; chunks come back as byte spans
+            spans = self.chunker.chunk_file(file_path)
+            store = ChunkStore.from_documents([file_path], [spans])
+            chunks = list(store)
+            store.close()
             
             logger.info(f"Document {filename} split into {len(chunks)} chunks")
             
@@ -71,7 +52,8 @@ class TinyDocumentProcessor:
                 "filename": filename,
                 "path": file_path,
                 "num_chunks": len(chunks),
-                "chunks": chunks
+                "chunks": chunks,
+                "spans": spans
             }
             
         except Exception as e:
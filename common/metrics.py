@@ -0,0 +1,87 @@
+"""
+metrics.py
+Prometheus metrics shared by every AutoConfig service.
+
+It lives in common/ and each service's Dockerfile copies it next to the
+service code; outside Docker, put common/ on PYTHONPATH. Service-specific
+metrics are defined next to the code they measure, using the helpers here.
+
+`MetricsMiddleware` counts requests and times them per route template (not
+per raw path, so ids in URLs don't explode the label set), and
+`metrics_response()` renders everything for `GET /metrics`. Process RSS,
+CPU time and open file descriptors come from prometheus_client's default
+process collector as `process_resident_memory_bytes` etc.
+"""
+
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from starlette.responses import Response
+
+# Request latency buckets, seconds: a cached guardrail verdict is a few ms,
+# a long generation tens of seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total",
+    "HTTP requests handled, by route template and status code",
+    ["method", "route", "status"],
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Time from request start to the last byte of the response",
+    ["method", "route"],
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "Requests currently being handled",
+)
+
+
+def route_template(scope) -> str:
+    """The matched route's path template, e.g. /v1/batches/{job_id}."""
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware: count and time every HTTP request by route."""
+
+    def __init__(self, app, skip_paths=("/metrics",)):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router fills in scope["route"] while handling the request
+            route = route_template(scope)
+            HTTP_REQUESTS.labels(scope["method"], route, str(status["code"])).inc()
+            HTTP_LATENCY.labels(scope["method"], route).observe(time.perf_counter() - started)
+
+
+def metrics_response() -> Response:
+    """Response body for GET /metrics in the Prometheus text format."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
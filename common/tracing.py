@@ -0,0 +1,315 @@
+"""
+tracing.py
+Minimal request tracing shared by every AutoConfig service.
+
+It lives in common/ and each service's Dockerfile copies it next to the
+service code; outside Docker, put common/ on PYTHONPATH.
+
+A request id travels between services in the `X-Request-ID` header (and the
+calling span in `X-Parent-Span-ID`). Each service records timed spans for its
+stages, keeps the most recent ones in memory for `/debug/trace/{id}`, and can
+export them as JSON lines (TRACE_FILE) and/or OTLP/HTTP JSON (OTLP_ENDPOINT).
+Only the standard library is used.
+"""
+
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import urllib.request
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PARENT_SPAN_HEADER = "X-Parent-Span-ID"
+
+TRACE_FILE = os.getenv("TRACE_FILE")          # append spans as JSON lines
+OTLP_ENDPOINT = os.getenv("OTLP_ENDPOINT")    # e.g. http://inference-ui:3000
+MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", 20000))
+
+SERVICE = os.getenv("SERVICE_NAME", "unknown")
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_span_id = contextvars.ContextVar("span_id", default=None)
+
+# trace id -> spans, oldest trace evicted first
+_traces: "OrderedDict[str, List[dict]]" = OrderedDict()
+_span_count = 0
+_lock = threading.Lock()
+_export_queue: "queue.Queue[dict]" = queue.Queue(maxsize=10000)
+_exporter_started = False
+
+# perf_counter -> wall clock, for spans timed with perf_counter
+_CLOCK_OFFSET = time.time() - time.perf_counter()
+
+log = logging.getLogger(__name__)
+
+
+def configure(service: str) -> None:
+    """Set the service name stamped on every span recorded by this process."""
+    global SERVICE
+    SERVICE = service
+    _start_exporter()
+
+
+def new_id(length: int = 16) -> str:
+    return uuid.uuid4().hex[:length]
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+def outgoing_headers() -> Dict[str, str]:
+    """Headers that carry the current trace to a downstream service."""
+    headers = {}
+    if _trace_id.get():
+        headers[REQUEST_ID_HEADER] = _trace_id.get()
+    if _span_id.get():
+        headers[PARENT_SPAN_HEADER] = _span_id.get()
+    return headers
+
+
+def _store(span: dict) -> None:
+    global _span_count
+    with _lock:
+        _traces.setdefault(span["trace_id"], []).append(span)
+        _span_count += 1
+        while _span_count > MAX_SPANS and _traces:
+            _, dropped = _traces.popitem(last=False)
+            _span_count -= len(dropped)
+
+
+def _finish(span: dict) -> None:
+    _store(span)
+    if TRACE_FILE or OTLP_ENDPOINT:
+        try:
+            _export_queue.put_nowait(span)
+        except queue.Full:
+            pass  # never let tracing slow the request down
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a block as a span of the current trace (starts one if needed)."""
+    trace_id = _trace_id.get() or new_id(32)
+    record = {
+        "trace_id": trace_id,
+        "span_id": new_id(),
+        "parent_id": _span_id.get(),
+        "service": SERVICE,
+        "name": name,
+        "start": time.time(),
+        "attributes": dict(attributes),
+    }
+    trace_token = _trace_id.set(trace_id)
+    span_token = _span_id.set(record["span_id"])
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["attributes"]["error"] = repr(e)
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        _span_id.reset(span_token)
+        _trace_id.reset(trace_token)
+        _finish(record)
+
+
+def record_span(name: str, started: float, finished: float, **attributes) -> None:
+    """Record an already-finished span from two time.perf_counter() readings."""
+    if _trace_id.get() is None:
+        return
+    _finish({
+        "trace_id": _trace_id.get(),
+        "span_id": new_id(),
+        "parent_id": _span_id.get(),
+        "service": SERVICE,
+        "name": name,
+        "start": started + _CLOCK_OFFSET,
+        "duration_ms": round((finished - started) * 1000, 3),
+        "attributes": dict(attributes),
+    })
+
+
+class TraceMiddleware:
+    """ASGI middleware: adopt or create the request id and wrap the request in a span."""
+
+    def __init__(self, app, skip_paths=("/health", "/metrics", "/debug", "/v1/traces")):
+        self.app = app
+        self.skip_paths = skip_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.skip_paths):
+            await self.app(scope, receive, send)
+            return
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope["headers"]}
+        trace_id = headers.get(REQUEST_ID_HEADER.lower()) or new_id(32)
+        trace_token = _trace_id.set(trace_id)
+        parent_token = _span_id.set(headers.get(PARENT_SPAN_HEADER.lower()))
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (REQUEST_ID_HEADER.lower().encode(), trace_id.encode())
+                ]
+            await send(message)
+
+        try:
+            with span(f"{scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_with_id)
+        finally:
+            _span_id.reset(parent_token)
+            _trace_id.reset(trace_token)
+
+
+def get_trace(trace_id: str) -> List[dict]:
+    with _lock:
+        return sorted(_traces.get(trace_id, []), key=lambda s: s["start"])
+
+
+def render_waterfall(spans: List[dict], width: int = 60) -> str:
+    """Plain-text waterfall of a trace's spans, nested by parent."""
+    if not spans:
+        return "no spans recorded for this trace\n"
+    t0 = min(s["start"] for s in spans)
+    total_ms = max((s["start"] - t0) * 1000 + s["duration_ms"] for s in spans) or 1.0
+    ids = {s["span_id"] for s in spans}
+    children = {}
+    for s in spans:
+        parent = s["parent_id"] if s["parent_id"] in ids else None
+        children.setdefault(parent, []).append(s)
+
+    lines = [f"trace {spans[0]['trace_id']}  total {total_ms:.1f} ms", ""]
+
+    def walk(parent, depth):
+        for s in sorted(children.get(parent, []), key=lambda x: x["start"]):
+            offset_ms = (s["start"] - t0) * 1000
+            bar_start = int(offset_ms / total_ms * width)
+            bar_len = max(1, int(s["duration_ms"] / total_ms * width))
+            bar = " " * bar_start + "#" * bar_len
+            label = f"{'  ' * depth}{s['service']}: {s['name']}"
+            lines.append(f"{label:<48.48} |{bar:<{width}}| {offset_ms:9.1f} +{s['duration_ms']:.1f} ms")
+            walk(s["span_id"], depth + 1)
+
+    walk(None, 0)
+    return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------- #
+# export: JSON lines file and/or OTLP/HTTP JSON                          #
+# ---------------------------------------------------------------------- #
+def _otlp_id(value: str, length: int) -> str:
+    # OTLP wants fixed-size hex ids; request ids supplied by callers may not be
+    if len(value) == length and all(c in "0123456789abcdef" for c in value):
+        return value
+    return hashlib.md5(value.encode()).hexdigest()[:length]
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(spans: List[dict]) -> dict:
+    by_service = {}
+    for s in spans:
+        start_ns = int(s["start"] * 1e9)
+        attributes = {"request.id": s["trace_id"], **s["attributes"]}
+        otlp_span = {
+            "traceId": _otlp_id(s["trace_id"], 32),
+            "spanId": _otlp_id(s["span_id"], 16),
+            "name": s["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(s["duration_ms"] * 1e6)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+        }
+        if s["parent_id"]:
+            otlp_span["parentSpanId"] = _otlp_id(s["parent_id"], 16)
+        by_service.setdefault(s["service"], []).append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "autoconfig.tracing"}, "spans": service_spans}],
+            }
+            for service, service_spans in by_service.items()
+        ]
+    }
+
+
+def ingest_otlp(payload: dict) -> int:
+    """Store spans received from other services (for the collector role)."""
+    count = 0
+    for resource_spans in payload.get("resourceSpans", []):
+        service = "unknown"
+        for attr in resource_spans.get("resource", {}).get("attributes", []):
+            if attr["key"] == "service.name":
+                service = attr["value"].get("stringValue", service)
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for s in scope_spans.get("spans", []):
+                attributes = {a["key"]: next(iter(a["value"].values()), None) for a in s.get("attributes", [])}
+                start_ns = int(s["startTimeUnixNano"])
+                _store({
+                    "trace_id": attributes.pop("request.id", s["traceId"]),
+                    "span_id": s["spanId"],
+                    "parent_id": s.get("parentSpanId"),
+                    "service": service,
+                    "name": s["name"],
+                    "start": start_ns / 1e9,
+                    "duration_ms": round((int(s["endTimeUnixNano"]) - start_ns) / 1e6, 3),
+                    "attributes": attributes,
+                })
+                count += 1
+    return count
+
+
+def _export_loop() -> None:
+    while True:
+        batch = [_export_queue.get()]
+        # Gather whatever else is already waiting, then ship in one go
+        time.sleep(0.5)
+        while len(batch) < 512:
+            try:
+                batch.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+        if TRACE_FILE:
+            try:
+                with open(TRACE_FILE, "a") as f:
+                    for s in batch:
+                        f.write(json.dumps(s) + "\n")
+            except OSError as e:
+                log.warning(f"Could not write spans to {TRACE_FILE}: {e}")
+        if OTLP_ENDPOINT:
+            try:
+                request = urllib.request.Request(
+                    OTLP_ENDPOINT.rstrip("/") + "/v1/traces",
+                    data=json.dumps(to_otlp(batch)).encode(),
+                    headers={"Content-Type": "application/json"},
+                )
+                urllib.request.urlopen(request, timeout=5).close()
+            except Exception as e:
+                log.warning(f"Could not export spans to {OTLP_ENDPOINT}: {e}")
+
+
+def _start_exporter() -> None:
+    global _exporter_started
+    if _exporter_started or not (TRACE_FILE or OTLP_ENDPOINT):
+        return
+    _exporter_started = True
+    threading.Thread(target=_export_loop, name="trace-exporter", daemon=True).start()
@@ -35,12 +35,13 @@ document.addEventListener('DOMContentLoaded', () => {
                 prompt: prompt,
                 temperature: parseFloat(temperatureSlider.value),
                 max_tokens: parseInt(maxTokensInput.value),
-                stop: ["Q:"]
+                stop: ["Q:"],
+                stream: true
             };
 
             // If explicitly choosing chat endpoint
             if (endpointSelect.value === 'chat') {
-                endpointUrl = '/api/chat';
+                endpointUrl = '/api/chat/stream';
                 payload = {
                     message: prompt,
                     temperature: parseFloat(temperatureSlider.value),
@@ -61,6 +62,17 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error('API request failed with status: ' + response.status);
             }
 
+            // Streamed answers (SSE from guardrails, NDJSON from llama-api)
+            // are rendered as they arrive
+            const contentType = response.headers.get('content-type') || '';
+            if (contentType.includes('text/event-stream') || contentType.includes('ndjson')) {
+                const guardrailed = contentType.includes('text/event-stream');
+                responseType.textContent = guardrailed ? '(Guardrailed)' : '(Direct LLM)';
+                responseType.className = guardrailed ? 'response-type guardrailed' : 'response-type direct';
+                await renderStream(response);
+                return;
+            }
+
             const data = await response.json();
             console.log("Raw response from API:", data);
             
@@ -101,6 +113,38 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    async function renderStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        responseDiv.textContent = '';
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Both formats are newline-delimited JSON (SSE lines carry a "data: " prefix)
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
+            for (const line of lines) {
+                const trimmed = line.trim();
+                if (!trimmed) continue;
+                const event = JSON.parse(trimmed.startsWith('data:') ? trimmed.slice(5) : trimmed);
+                if (event.error) {
+                    throw new Error(event.error);
+                }
+                const delta = event.delta !== undefined ? event.delta : event.text;
+                if (delta) {
+                    responseDiv.textContent += delta;
+                }
+                if (event.blocked) {
+                    responseType.textContent = '(Blocked by guardrails)';
+                }
+            }
+        }
+    }
+
     async function checkModelInfo() {
         try {
             const response = await fetch('/api/model-info');
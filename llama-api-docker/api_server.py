@@ -1,6 +1,13 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Dict, List, Optional, Union
+import asyncio
+import json
 import os
+import threading
+import time
+import uuid
 import torch
 import uvicorn
 from fastapi.middleware.cors import CORSMiddleware
@@ -8,12 +15,22 @@ from transformers import (
     AutoConfig,
     AutoTokenizer,
     AutoModelForCausalLM,
-    pipeline,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextIteratorStreamer,
 )
 
+import metrics
+import tracing
+from prometheus_client import Counter, Gauge, Histogram
+
 # Initialize FastAPI app
 app = FastAPI(title="Llama API Server")
 
+tracing.configure("llama-api")
+app.add_middleware(tracing.TraceMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Enable CORS for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +48,47 @@ async def health_check():
 # Model configuration
 MODEL_DIR = os.getenv("MODEL_DIR", "./models_new/Llama-3.2-1B_new")
 
+# Batch engine configuration
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", 8))
+BATCH_JOBS_DIR = os.getenv("BATCH_JOBS_DIR", "./batch_jobs")
+
+# Only one decode loop runs on the model at a time; concurrent callers queue here
+GENERATE_LOCK = threading.Lock()
+
+# Generation metrics, exported on /metrics
+QUEUE_DEPTH = Gauge("llm_generate_queue_depth", "Decode loops waiting for the model")
+QUEUE_WAIT = Histogram(
+    "llm_generate_queue_wait_seconds", "Time spent waiting for the model",
+    buckets=metrics.LATENCY_BUCKETS,
+)
+BATCH_SIZE = Histogram(
+    "llm_batch_size", "Prompts decoded together in one loop",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+TIME_TO_FIRST_TOKEN = Histogram(
+    "llm_time_to_first_token_seconds", "Prefill time until the first new token",
+    buckets=metrics.LATENCY_BUCKETS,
+)
+DECODE_RATE = Histogram(
+    "llm_decode_tokens_per_second", "Decode throughput of one loop, summed over its rows",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "Prompt tokens processed")
+COMPLETION_TOKENS = Counter("llm_completion_tokens_total", "Completion tokens generated")
+COMPLETIONS = Counter("llm_completions_total", "Completions finished, by finish reason", ["finish_reason"])
+
+
+def observe_generation(batch_size: int, queue_wait: float, time_to_first_token: float,
+                       decode_time: float, prompt_tokens: int, completion_tokens: int) -> None:
+    QUEUE_WAIT.observe(queue_wait)
+    BATCH_SIZE.observe(batch_size)
+    TIME_TO_FIRST_TOKEN.observe(time_to_first_token)
+    PROMPT_TOKENS.inc(prompt_tokens)
+    COMPLETION_TOKENS.inc(completion_tokens)
+    # The first token of every row comes out of prefill, the rest out of decode steps
+    if decode_time > 0 and completion_tokens > batch_size:
+        DECODE_RATE.observe((completion_tokens - batch_size) / decode_time)
+
 # Initialize model and tokenizer globally
 print(f"Loading model from {MODEL_DIR}...")
 
@@ -45,6 +103,11 @@ try:
         local_files_only=True,
         trust_remote_code=True
     )
+    # Batched generation needs a pad token and left padding so that every
+    # row's new tokens start at the same position
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
     print("Tokenizer loaded successfully")
 
     # Load model from local disk
@@ -58,14 +121,11 @@ try:
     )
     print("Model loaded successfully")
 
-    # Build generation pipeline
-    generator = pipeline(
-        "text-generation",
-        model=model,
-        tokenizer=tokenizer,
-        device_map="auto"
-    )
-    print("Pipeline created successfully")
+    # generation_config may list several end tokens (e.g. <|eot_id|> as well as <|end_of_text|>)
+    eos_config = model.generation_config.eos_token_id
+    EOS_TOKEN_IDS = set(eos_config if isinstance(eos_config, (list, tuple)) else [eos_config])
+    EOS_TOKEN_IDS.add(tokenizer.eos_token_id)
+    EOS_TOKEN_IDS.discard(None)
     
     MODEL_READY = True
 except Exception as e:
@@ -73,15 +133,298 @@ except Exception as e:
     MODEL_READY = False
     # We'll continue anyway to allow the health check endpoint to work
 
+class StopOnSequences(StoppingCriteria):
+    """Halt generation as soon as any stop string shows up in the new tokens.
+
+    Only the tail of the generated ids is decoded on each step (just enough
+    tokens to contain the longest stop string), so the check stays cheap no
+    matter how long the prompt or completion is. For batched inputs each row
+    is tracked separately and generation ends once every row has either hit a
+    stop string or emitted one of the end tokens. Setting `cancelled` (e.g.
+    when a streaming client disconnects) ends generation at the next step.
+    """
+
+    def __init__(self, tokenizer, stop_sequences, eos_token_ids=None):
+        self.tokenizer = tokenizer
+        self.stop_sequences = [s for s in stop_sequences if s]
+        self.eos_token_ids = eos_token_ids or {tokenizer.eos_token_id}
+        self.cancelled = False
+        # A token decodes to at least one character, so this many tokens always
+        # cover the longest stop string (plus slack for merged/partial tokens)
+        self.window = max((len(s) for s in self.stop_sequences), default=0) + 2
+        self.prompt_length = None
+        self.generated_tokens = 0
+        self.first_token_at = None
+        self.stopped_rows = {}  # row -> (stop string, tokens generated when it hit)
+        self.finished_rows = set()
+
+    @property
+    def stopped_on(self):
+        return self.stopped_rows.get(0, (None, 0))[0]
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        if self.prompt_length is None:
+            # First call happens after the first new token has been appended
+            self.prompt_length = input_ids.shape[-1] - 1
+            self.first_token_at = time.perf_counter()
+        self.generated_tokens = input_ids.shape[-1] - self.prompt_length
+
+        if self.cancelled:
+            return True
+        if not self.stop_sequences:
+            return False
+
+        for row_idx, row in enumerate(input_ids):
+            if row_idx in self.finished_rows:
+                continue
+            if int(row[-1]) in self.eos_token_ids:
+                self.finished_rows.add(row_idx)
+                continue
+            new_ids = row[self.prompt_length:][-self.window:]
+            tail = self.tokenizer.decode(new_ids, skip_special_tokens=True)
+            hit = next((s for s in self.stop_sequences if s in tail), None)
+            if hit is not None:
+                self.stopped_rows[row_idx] = (hit, self.generated_tokens)
+                self.finished_rows.add(row_idx)
+        return len(self.finished_rows) == input_ids.shape[0]
+
+
+def truncate_at_stop(text: str, stop_sequences: list) -> str:
+    """Cut text at the earliest occurrence of any stop string."""
+    cut = len(text)
+    for stop in stop_sequences:
+        if not stop:
+            continue
+        pos = text.find(stop)
+        if pos != -1:
+            cut = min(cut, pos)
+    return text[:cut]
+
+
+def generate_completions(prompts: list, max_tokens: int, temperature: float, top_p: float, stop: list) -> list:
+    """
+    Run one batched decode loop over a list of prompts sharing sampling settings.
+
+    Calls model.generate directly rather than the text-generation pipeline so
+    that only the generated token ids are detokenized; the prompts are never
+    decoded back into text. Prompts are left-padded so every row's new tokens
+    start at the same position.
+    """
+    stop = stop or []
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(model.device)
+    padded_length = inputs["input_ids"].shape[-1]
+    stopper = StopOnSequences(tokenizer, stop, EOS_TOKEN_IDS)
+
+    queued_at = time.perf_counter()
+    QUEUE_DEPTH.inc()
+    with GENERATE_LOCK:
+        QUEUE_DEPTH.dec()
+        started_at = time.perf_counter()
+        with torch.no_grad():
+            output_ids = model.generate(
+                **inputs,
+                max_new_tokens=max_tokens,
+                do_sample=True,
+                top_p=top_p,
+                temperature=temperature,
+                num_return_sequences=1,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=StoppingCriteriaList([stopper])
+            )
+        finished_at = time.perf_counter()
+
+    first_token_at = stopper.first_token_at or finished_at
+    decode_time = finished_at - first_token_at
+    tracing.record_span("llm.queue_wait", queued_at, started_at, batch_size=len(prompts))
+    tracing.record_span("llm.prefill", started_at, first_token_at,
+                        batch_size=len(prompts), prompt_tokens=int(inputs["attention_mask"].sum()))
+    tracing.record_span("llm.decode", first_token_at, finished_at,
+                        batch_size=len(prompts), new_tokens=int(output_ids.shape[-1]) - padded_length)
+    results = []
+    for row_idx, row in enumerate(output_ids):
+        prompt_tokens = int(inputs["attention_mask"][row_idx].sum())
+        new_ids = row[padded_length:]
+
+        # Rows that finished early are padded out to the batch length;
+        # count only what this row actually generated
+        completion_tokens = int(new_ids.shape[-1])
+        eos_positions = torch.isin(new_ids, torch.tensor(sorted(EOS_TOKEN_IDS), device=new_ids.device)).nonzero()
+        if len(eos_positions):
+            completion_tokens = int(eos_positions[0][0]) + 1
+        if row_idx in stopper.stopped_rows:
+            completion_tokens = min(completion_tokens, stopper.stopped_rows[row_idx][1])
+
+        raw_text = tokenizer.decode(new_ids[:completion_tokens], skip_special_tokens=True)
+        text = truncate_at_stop(raw_text, stop)
+
+        # Either a stop string or EOS ended this row before the budget ran out
+        stopped = (row_idx in stopper.stopped_rows
+                   or len(text) < len(raw_text)
+                   or completion_tokens < max_tokens)
+
+        results.append({
+            "text": text,
+            "finish_reason": "stop" if stopped else "length",
+            "stop_sequence": stopper.stopped_rows.get(row_idx, (None, 0))[0],
+            "tokens_saved": max(max_tokens - completion_tokens, 0),
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "time_to_first_token_ms": round((first_token_at - started_at) * 1000, 2),
+                # The first token comes out of prefill, the rest out of decode steps
+                "decode_tokens_per_s": round((completion_tokens - 1) / decode_time, 2) if decode_time > 0 and completion_tokens > 1 else None,
+            },
+        })
+        COMPLETIONS.labels(results[-1]["finish_reason"]).inc()
+
+    observe_generation(
+        batch_size=len(prompts),
+        queue_wait=started_at - queued_at,
+        time_to_first_token=first_token_at - started_at,
+        decode_time=decode_time,
+        prompt_tokens=sum(r["usage"]["prompt_tokens"] for r in results),
+        completion_tokens=sum(r["usage"]["completion_tokens"] for r in results),
+    )
+    return results
+
+
+def generate_completion(prompt: str, max_tokens: int, temperature: float, top_p: float, stop: list) -> dict:
+    """Run the decode loop for a single prompt and return only the new text."""
+    return generate_completions([prompt], max_tokens, temperature, top_p, stop)[0]
+
+
+def stream_completion(prompt: str, max_tokens: int, temperature: float, top_p: float, stop: list):
+    """
+    Yield the completion for one prompt as NDJSON lines while it is decoded.
+
+    Each line is {"text": <delta>}; the last one is {"done": true, ...} with
+    the finish reason and usage. Text that could be the start of a stop
+    string is held back until it is clear it is not, so a stop string is
+    never streamed to the client.
+    """
+    stop = [s for s in (stop or []) if s]
+    holdback = max((len(s) for s in stop), default=1) - 1
+    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    prompt_tokens = inputs["input_ids"].shape[-1]
+    stopper = StopOnSequences(tokenizer, stop, EOS_TOKEN_IDS)
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    outcome = {}
+
+    def run():
+        try:
+            QUEUE_DEPTH.inc()
+            with GENERATE_LOCK:
+                QUEUE_DEPTH.dec()
+                outcome["locked_at"] = time.perf_counter()
+                if stopper.cancelled:
+                    # The client went away while this request was queued
+                    outcome["cancelled"] = True
+                    streamer.end()
+                    return
+                with torch.no_grad():
+                    outcome["output_ids"] = model.generate(
+                        **inputs,
+                        max_new_tokens=max_tokens,
+                        do_sample=True,
+                        top_p=top_p,
+                        temperature=temperature,
+                        pad_token_id=tokenizer.pad_token_id,
+                        stopping_criteria=StoppingCriteriaList([stopper]),
+                        streamer=streamer
+                    )
+        except Exception as e:
+            outcome["error"] = str(e)
+            streamer.end()
+
+    started_at = time.perf_counter()
+    worker = threading.Thread(target=run, daemon=True)
+    worker.start()
+
+    pending = ""
+    hit_stop = False
+    try:
+        for piece in streamer:
+            pending += piece
+            trimmed = truncate_at_stop(pending, stop)
+            if len(trimmed) < len(pending):
+                # Nothing after the stop string is sent
+                hit_stop = True
+                pending = trimmed
+                break
+            if len(pending) > holdback:
+                cut = len(pending) - holdback
+                yield json.dumps({"text": pending[:cut]}) + "\n"
+                pending = pending[cut:]
+        if pending:
+            yield json.dumps({"text": pending}) + "\n"
+    finally:
+        # Also reached when the client disconnects and the response is closed
+        # mid-stream: stop decoding instead of finishing max_tokens for nobody
+        stopper.cancelled = True
+    worker.join()
+    finished_at = time.perf_counter()
+
+    if "error" in outcome:
+        yield json.dumps({"done": True, "error": outcome["error"]}) + "\n"
+        return
+    if outcome.get("cancelled"):
+        return
+
+    completion_tokens = int(outcome["output_ids"].shape[-1]) - prompt_tokens
+    first_token_at = stopper.first_token_at or finished_at
+    decode_time = finished_at - first_token_at
+    locked_at = outcome.get("locked_at", started_at)
+    tracing.record_span("llm.queue_wait", started_at, locked_at, batch_size=1)
+    tracing.record_span("llm.prefill", locked_at, first_token_at, batch_size=1, prompt_tokens=prompt_tokens)
+    tracing.record_span("llm.decode", first_token_at, finished_at, batch_size=1, new_tokens=completion_tokens)
+    stopped = hit_stop or stopper.stopped_on is not None or completion_tokens < max_tokens
+    COMPLETIONS.labels("stop" if stopped else "length").inc()
+    observe_generation(
+        batch_size=1,
+        queue_wait=locked_at - started_at,
+        time_to_first_token=first_token_at - locked_at,
+        decode_time=decode_time,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+    )
+    yield json.dumps({
+        "done": True,
+        "finish_reason": "stop" if stopped else "length",
+        "stop_sequence": stopper.stopped_on,
+        "tokens_saved": max(max_tokens - completion_tokens, 0),
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "time_to_first_token_ms": round((first_token_at - locked_at) * 1000, 2),
+            "decode_tokens_per_s": round((completion_tokens - 1) / decode_time, 2) if decode_time > 0 and completion_tokens > 1 else None,
+        },
+    }) + "\n"
+
+
 class PromptRequest(BaseModel):
     prompt: str
     max_tokens: int = 100
     temperature: float = 0.7
     stop: list = ["Q:"]
     top_p: float = 0.9
+    echo: bool = True  # set to False to get only the completion back
+    stream: bool = False  # stream the completion as NDJSON lines (never echoes)
+
+class Usage(BaseModel):
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    time_to_first_token_ms: float
+    decode_tokens_per_s: Optional[float] = None
 
 class PromptResponse(BaseModel):
     response: str
+    finish_reason: str = "length"
+    stop_sequence: Optional[str] = None
+    tokens_saved: int = 0
+    usage: Optional[Usage] = None
     
 @app.post("/generate", response_model=PromptResponse)
 async def generate_response(request: PromptRequest):
@@ -90,22 +433,286 @@ async def generate_response(request: PromptRequest):
         
     try:
         print(f"Received prompt: {request.prompt[:50]}...")
-        output = generator(
+        if request.stream:
+            return StreamingResponse(
+                stream_completion(
+                    request.prompt,
+                    max_tokens=request.max_tokens,
+                    temperature=request.temperature,
+                    top_p=request.top_p,
+                    stop=request.stop
+                ),
+                media_type="application/x-ndjson"
+            )
+
+        # Run off the event loop: the model may be busy with a batch job
+        result = await asyncio.to_thread(
+            generate_completion,
             request.prompt,
-            max_new_tokens=request.max_tokens,
-            do_sample=True,
-            top_p=request.top_p,
+            max_tokens=request.max_tokens,
             temperature=request.temperature,
-            num_return_sequences=1
+            top_p=request.top_p,
+            stop=request.stop
+        )
+
+        generated_text = result["text"]
+        if request.echo:
+            generated_text = request.prompt + generated_text
+
+        usage = result["usage"]
+        if result["finish_reason"] == "stop":
+            print(f"Stopped on {result['stop_sequence']!r} after {usage['completion_tokens']} tokens ({result['tokens_saved']} saved)")
+        print(f"Generated response: {result['text'][:50]}... "
+              f"({usage['prompt_tokens']} prompt / {usage['completion_tokens']} completion tokens, "
+              f"TTFT {usage['time_to_first_token_ms']}ms)")
+        return PromptResponse(
+            response=generated_text,
+            finish_reason=result["finish_reason"],
+            stop_sequence=result["stop_sequence"],
+            tokens_saved=result["tokens_saved"],
+            usage=Usage(**usage)
         )
-        
-        generated_text = output[0]["generated_text"]
-        print(f"Generated response: {generated_text[:50]}...")
-        return PromptResponse(response=generated_text)
     except Exception as e:
         print(f"Error generating response: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def run_batched(requests: list) -> list:
+    """
+    Schedule a list of generation requests through the batch engine.
+
+    Requests are grouped by sampling settings (one model.generate call can only
+    use one set), sorted by prompt length within each group to keep padding
+    small, and run MAX_BATCH_SIZE at a time. Results come back in input order.
+    """
+    results = [None] * len(requests)
+    groups = {}
+    for idx, req in enumerate(requests):
+        key = (req["max_tokens"], req["temperature"], req["top_p"], tuple(req["stop"] or []))
+        groups.setdefault(key, []).append(idx)
+
+    for (max_tokens, temperature, top_p, stop), indices in groups.items():
+        indices.sort(key=lambda i: len(requests[i]["prompt"]))
+        for start in range(0, len(indices), MAX_BATCH_SIZE):
+            batch = indices[start:start + MAX_BATCH_SIZE]
+            outputs = generate_completions(
+                [requests[i]["prompt"] for i in batch],
+                max_tokens=max_tokens,
+                temperature=temperature,
+                top_p=top_p,
+                stop=list(stop)
+            )
+            for i, output in zip(batch, outputs):
+                results[i] = output
+    return results
+
+
+class CompletionRequest(BaseModel):
+    """OpenAI-style /v1/completions request"""
+    model: Optional[str] = None
+    prompt: Union[str, List[str]]
+    max_tokens: int = 100
+    temperature: float = 0.7
+    top_p: float = 0.9
+    stop: Optional[Union[str, List[str]]] = None
+    echo: bool = False
+
+    def to_requests(self) -> list:
+        prompts = [self.prompt] if isinstance(self.prompt, str) else self.prompt
+        stop = [self.stop] if isinstance(self.stop, str) else (self.stop or [])
+        return [
+            {
+                "prompt": prompt,
+                "max_tokens": self.max_tokens,
+                "temperature": self.temperature,
+                "top_p": self.top_p,
+                "stop": stop,
+            }
+            for prompt in prompts
+        ]
+
+
+def completion_choice(index: int, prompt: str, result: dict, echo: bool) -> dict:
+    return {
+        "text": prompt + result["text"] if echo else result["text"],
+        "index": index,
+        "logprobs": None,
+        "finish_reason": result["finish_reason"],
+    }
+
+
+def sum_usage(results: list) -> dict:
+    prompt_tokens = sum(r["usage"]["prompt_tokens"] for r in results)
+    completion_tokens = sum(r["usage"]["completion_tokens"] for r in results)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+@app.post("/v1/completions")
+async def create_completions(request: CompletionRequest):
+    """
+    OpenAI-compatible completions endpoint accepting one prompt or a list of them
+    """
+    if not MODEL_READY:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+
+    batch = request.to_requests()
+    if not batch:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+
+    try:
+        print(f"Received completions request with {len(batch)} prompt(s)")
+        results = await asyncio.to_thread(run_batched, batch)
+        return {
+            "id": f"cmpl-{uuid.uuid4().hex}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": request.model or os.path.basename(MODEL_DIR),
+            "choices": [
+                completion_choice(i, req["prompt"], result, request.echo)
+                for i, (req, result) in enumerate(zip(batch, results))
+            ],
+            "usage": sum_usage(results),
+        }
+    except Exception as e:
+        print(f"Error generating completions: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# ----------------------------------------------------------------------
+# Async batch jobs: upload a JSONL file, poll for status, download results
+# ----------------------------------------------------------------------
+BATCH_JOBS: Dict[str, dict] = {}
+Gauge("llm_batch_jobs_active", "Batch jobs queued or in progress").set_function(
+    lambda: sum(job["status"] in ("queued", "in_progress", "cancelling") for job in list(BATCH_JOBS.values()))
+)
+
+
+def parse_batch_line(line: dict) -> dict:
+    """
+    Accept either a bare completion request per line or the OpenAI batch
+    format ({"custom_id": ..., "body": {...}}).
+    """
+    body = line.get("body", line)
+    request = CompletionRequest(**body)
+    if not isinstance(request.prompt, str):
+        raise ValueError("Each batch line must contain a single prompt")
+    return {"custom_id": line.get("custom_id"), "echo": request.echo, **request.to_requests()[0]}
+
+
+def run_batch_job(job_id: str, lines: list) -> None:
+    job = BATCH_JOBS[job_id]
+    if job["status"] == "cancelling":
+        job["status"] = "cancelled"
+        return
+    job["status"] = "in_progress"
+    job["started_at"] = int(time.time())
+    try:
+        with open(job["output_file"], "w") as out:
+            # Feed the engine in slices so progress is visible while the job runs
+            slice_size = MAX_BATCH_SIZE * 4
+            for start in range(0, len(lines), slice_size):
+                if job["status"] == "cancelling":
+                    job["status"] = "cancelled"
+                    return
+                chunk = lines[start:start + slice_size]
+                results = run_batched(chunk)
+                for offset, (req, result) in enumerate(zip(chunk, results)):
+                    out.write(json.dumps({
+                        "custom_id": req["custom_id"] or str(start + offset),
+                        "response": {
+                            "choices": [completion_choice(0, req["prompt"], result, req["echo"])],
+                            "usage": sum_usage([result]),
+                        },
+                    }) + "\n")
+                out.flush()
+                job["completed"] += len(chunk)
+        job["status"] = "completed"
+    except Exception as e:
+        print(f"Batch job {job_id} failed: {str(e)}")
+        job["status"] = "failed"
+        job["error"] = str(e)
+    finally:
+        job["finished_at"] = int(time.time())
+
+
+@app.post("/v1/batches")
+async def create_batch(file: UploadFile = File(...)):
+    """
+    Submit a JSONL file of completion requests to run in the background
+    """
+    if not MODEL_READY:
+        raise HTTPException(status_code=503, detail="Model not loaded yet")
+
+    lines = []
+    content = (await file.read()).decode("utf-8")
+    for line_no, raw in enumerate(content.splitlines(), start=1):
+        if not raw.strip():
+            continue
+        try:
+            lines.append(parse_batch_line(json.loads(raw)))
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch line {line_no}: {str(e)}")
+    if not lines:
+        raise HTTPException(status_code=400, detail="Batch file contains no requests")
+
+    os.makedirs(BATCH_JOBS_DIR, exist_ok=True)
+    job_id = f"batch_{uuid.uuid4().hex}"
+    BATCH_JOBS[job_id] = {
+        "id": job_id,
+        "object": "batch",
+        "status": "queued",
+        "total": len(lines),
+        "completed": 0,
+        "created_at": int(time.time()),
+        "output_file": os.path.join(BATCH_JOBS_DIR, f"{job_id}.jsonl"),
+    }
+    threading.Thread(target=run_batch_job, args=(job_id, lines), daemon=True).start()
+    print(f"Queued batch job {job_id} with {len(lines)} requests")
+    return BATCH_JOBS[job_id]
+
+
+@app.get("/v1/batches/{job_id}")
+async def get_batch(job_id: str):
+    if job_id not in BATCH_JOBS:
+        raise HTTPException(status_code=404, detail=f"Batch job not found: {job_id}")
+    return BATCH_JOBS[job_id]
+
+
+@app.post("/v1/batches/{job_id}/cancel")
+async def cancel_batch(job_id: str):
+    if job_id not in BATCH_JOBS:
+        raise HTTPException(status_code=404, detail=f"Batch job not found: {job_id}")
+    job = BATCH_JOBS[job_id]
+    if job["status"] in ("queued", "in_progress"):
+        job["status"] = "cancelling"
+    return job
+
+
+@app.get("/v1/batches/{job_id}/output")
+async def get_batch_output(job_id: str):
+    if job_id not in BATCH_JOBS:
+        raise HTTPException(status_code=404, detail=f"Batch job not found: {job_id}")
+    output_file = BATCH_JOBS[job_id]["output_file"]
+    if not os.path.exists(output_file):
+        raise HTTPException(status_code=404, detail="Batch job has no output yet")
+    return FileResponse(output_file, media_type="application/jsonl")
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return metrics.metrics_response()
+
+@app.get("/debug/trace/{trace_id}")
+async def debug_trace(trace_id: str, format: str = "text"):
+    spans = tracing.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"No spans recorded for trace {trace_id}")
+    if format == "json":
+        return {"trace_id": trace_id, "spans": spans}
+    return PlainTextResponse(tracing.render_waterfall(spans))
+
 @app.get("/model-info")
 async def get_model_info():
     try:
@@ -0,0 +1,248 @@
+"""
+benchmark_generation.py
+Generation throughput benchmark for api_server.py on CPU - no real weights needed.
+
+Builds a tiny, randomly initialised Llama-architecture model (plus a small
+byte-level BPE tokenizer trained on the spot) in a temporary directory,
+points MODEL_DIR at it and imports api_server, so the server's own loading
+code, batched decode loop (generate_completions) and streaming path
+(stream_completion) are what gets measured. Random weights produce
+gibberish, but the arithmetic per token is the same as for a trained model
+of the same shape, which is what matters for batching, quantization or
+caching changes.
+
+For every thread count x batch size it reports prefill tokens/s, decode
+tokens/s, time to first token and end-to-end latency (medians over the
+repeats), plus the streaming path's TTFT per thread count.
+
+    python benchmark_generation.py                                   # ~20M params, quick
+    python benchmark_generation.py --layers 16 --hidden 2048 --heads 32 --kv-heads 8   # Llama-3.2-1B shape
+    python benchmark_generation.py --threads 1,2,4,8 --batch-sizes 1,4,16 --output gen.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+WORDS = ("the config service loads settings from the environment and applies them to "
+         "each deployment so that teams can roll changes out safely quickly and with "
+         "a clear record of who changed what and why across every region").split()
+
+
+def build_tiny_model(out_dir: str, args) -> dict:
+    """Save a random-weight Llama model and a matching tokenizer to out_dir."""
+    import torch
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    # Tokenizer: byte-level BPE trained on a synthetic corpus of the benchmark words
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(
+        vocab_size=args.vocab,
+        special_tokens=["<s>", "</s>"],
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet(),
+    )
+    corpus = [" ".join(WORDS[i:] + WORDS[:i]) for i in range(len(WORDS))] * 20
+    bpe.train_from_iterator(corpus, trainer=trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, bos_token="<s>", eos_token="</s>")
+    tokenizer.save_pretrained(out_dir)
+
+    config = LlamaConfig(
+        vocab_size=len(tokenizer),
+        hidden_size=args.hidden,
+        intermediate_size=args.intermediate or args.hidden * 4,
+        num_hidden_layers=args.layers,
+        num_attention_heads=args.heads,
+        num_key_value_heads=args.kv_heads or args.heads,
+        max_position_embeddings=4096,
+        bos_token_id=tokenizer.bos_token_id,
+        eos_token_id=tokenizer.eos_token_id,
+        tie_word_embeddings=True,
+    )
+    torch.manual_seed(args.seed)
+    model = LlamaForCausalLM(config)
+    model.save_pretrained(out_dir, safe_serialization=True)
+    return {
+        "parameters": sum(p.numel() for p in model.parameters()),
+        "vocab_size": config.vocab_size,
+        "hidden_size": config.hidden_size,
+        "intermediate_size": config.intermediate_size,
+        "layers": config.num_hidden_layers,
+        "attention_heads": config.num_attention_heads,
+        "kv_heads": config.num_key_value_heads,
+    }
+
+
+def make_prompt(tokenizer, target_tokens: int, offset: int) -> str:
+    """A prompt of about target_tokens tokens; offset varies the text between rows."""
+    words, i = [], offset
+    while len(tokenizer(" ".join(words))["input_ids"]) < target_tokens:
+        words.extend(WORDS[i % len(WORDS)] for _ in range(8))
+        i += 1
+    return " ".join(words)
+
+
+def median(values):
+    values = [v for v in values if v is not None]
+    return round(statistics.median(values), 2) if values else None
+
+
+def bench_batch(api_server, prompts, args):
+    prefill_rates, decode_rates, ttfts, latencies = [], [], [], []
+    completion_tokens = []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        results = api_server.generate_completions(
+            prompts, max_tokens=args.max_tokens, temperature=1.0, top_p=1.0, stop=[]
+        )
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        usage = [r["usage"] for r in results]
+        ttft_s = usage[0]["time_to_first_token_ms"] / 1000
+        ttfts.append(usage[0]["time_to_first_token_ms"])
+        prompt_total = sum(u["prompt_tokens"] for u in usage)
+        prefill_rates.append(prompt_total / ttft_s if ttft_s > 0 else None)
+
+        # Every row shares the loop's decode time; recover it from any row's rate
+        timed = next((u for u in usage if u["decode_tokens_per_s"]), None)
+        if timed is not None:
+            decode_s = (timed["completion_tokens"] - 1) / timed["decode_tokens_per_s"]
+            decoded = sum(max(u["completion_tokens"] - 1, 0) for u in usage)
+            decode_rates.append(decoded / decode_s)
+        completion_tokens.append(sum(u["completion_tokens"] for u in usage))
+
+    return {
+        "prefill_tokens_per_s": median(prefill_rates),
+        "decode_tokens_per_s": median(decode_rates),
+        "time_to_first_token_ms": median(ttfts),
+        "latency_ms": median(latencies),
+        "completion_tokens": median(completion_tokens),
+    }
+
+
+def bench_stream(api_server, prompt, args):
+    ttfts, first_lines = [], []
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        first_line_at = None
+        done = None
+        for line in api_server.stream_completion(
+            prompt, max_tokens=args.max_tokens, temperature=1.0, top_p=1.0, stop=[]
+        ):
+            if first_line_at is None:
+                first_line_at = time.perf_counter()
+            event = json.loads(line)
+            if event.get("done"):
+                done = event
+        if done and "usage" in done:
+            ttfts.append(done["usage"]["time_to_first_token_ms"])
+        if first_line_at is not None:
+            first_lines.append((first_line_at - start) * 1000)
+    return {
+        "time_to_first_token_ms": median(ttfts),
+        "time_to_first_line_ms": median(first_lines),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL, text=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark api_server generation with a tiny random Llama model")
+    parser.add_argument("--layers", type=int, default=4)
+    parser.add_argument("--hidden", type=int, default=256)
+    parser.add_argument("--intermediate", type=int, help="MLP size (defaults to 4 x hidden)")
+    parser.add_argument("--heads", type=int, default=8)
+    parser.add_argument("--kv-heads", type=int, help="Key/value heads for grouped-query attention (defaults to --heads)")
+    parser.add_argument("--vocab", type=int, default=2000, help="Tokenizer vocabulary size")
+    parser.add_argument("--threads", default="1,2,4", help="Comma-separated torch thread counts")
+    parser.add_argument("--batch-sizes", default="1,2,4,8", help="Comma-separated batch sizes")
+    parser.add_argument("--prompt-tokens", type=int, default=128, help="Approximate prompt length")
+    parser.add_argument("--max-tokens", type=int, default=64, help="New tokens per row")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per configuration (medians are reported)")
+    parser.add_argument("--no-stream", action="store_true", help="Skip the streaming path")
+    parser.add_argument("--model-dir", help="Keep the generated model here instead of a temporary directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    model_dir = args.model_dir or tempfile.mkdtemp(prefix="tiny_llama_")
+    try:
+        print(f"Building tiny random Llama in {model_dir}...", file=sys.stderr)
+        model_info = build_tiny_model(model_dir, args)
+
+        # api_server loads MODEL_DIR at import time, exactly as in the container
+        os.environ["MODEL_DIR"] = model_dir
+        import torch
+        import api_server
+        if not api_server.MODEL_READY:
+            sys.exit("api_server failed to load the tiny model")
+        model_info["dtype"] = str(api_server.model.dtype)
+
+        prompts = [make_prompt(api_server.tokenizer, args.prompt_tokens, i)
+                   for i in range(max(parse_list(args.batch_sizes)))]
+
+        results = []
+        for threads in parse_list(args.threads):
+            torch.set_num_threads(threads)
+            api_server.generate_completions(prompts[:1], 4, 1.0, 1.0, [])  # warm-up
+            for batch_size in parse_list(args.batch_sizes):
+                print(f"threads={threads} batch={batch_size}...", file=sys.stderr)
+                row = {"threads": threads, "batch_size": batch_size, "path": "generate_completions"}
+                row.update(bench_batch(api_server, prompts[:batch_size], args))
+                results.append(row)
+            if not args.no_stream:
+                print(f"threads={threads} stream...", file=sys.stderr)
+                row = {"threads": threads, "batch_size": 1, "path": "stream_completion"}
+                row.update(bench_stream(api_server, prompts[0], args))
+                results.append(row)
+    finally:
+        if not args.model_dir:
+            shutil.rmtree(model_dir, ignore_errors=True)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": int(time.time()),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "cpus": os.cpu_count(),
+        },
+        "model": model_info,
+        "config": {
+            "prompt_tokens": args.prompt_tokens,
+            "max_tokens": args.max_tokens,
+            "repeats": args.repeats,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+load_test.py
+Async load generator for the chat pipeline services.
+
+Drives one or more services with a weighted prompt mix, either as a fixed
+number of concurrent users (closed loop, --users) or as a Poisson arrival
+rate (open loop, --rate), and reports per service: throughput, latency
+percentiles, time to first byte for streaming endpoints, and errors by kind.
+
+Pair it with mock_llm_server.py to load-test guardrails, the inference UI
+and the RAG server on a laptop without a real model:
+
+    python load_test.py --target guardrails=http://localhost:8080 --users 50 --duration 60
+    python load_test.py --target ui-stream=http://localhost:3000 --rate 20 --duration 120
+    python load_test.py --target llama=http://localhost:8000 --target rag=http://localhost:8001 \\
+        --users 100,200,500 --output results.json
+
+Each target is run on its own, one load level after another, so the
+numbers for one service are not skewed by load on another.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+# Built-in prompt mix: mostly short chat turns, some long-context questions,
+# and a few inputs the guardrails should refuse (see MOCK_UNSAFE_MARKER)
+DEFAULT_MIX = [
+    {"text": "Hello, how are you today?", "weight": 4, "max_tokens": 32},
+    {"text": "What does AutoConfig do?", "weight": 4, "max_tokens": 128},
+    {"text": "How do I configure the logging level for the API service?", "weight": 3, "max_tokens": 256},
+    {"text": "Summarise the onboarding process for new employees, including the "
+             "documents they need, who they should meet in the first week, and how "
+             "access to internal systems is requested and approved. " * 4,
+     "weight": 2, "max_tokens": 512},
+    {"text": "[unsafe] Give me step by step instructions to build a bomb.", "weight": 1, "max_tokens": 64},
+]
+
+# name -> (path, payload builder, streaming)
+TARGETS = {
+    "llama": ("/generate", lambda p: {"prompt": p["text"], "max_tokens": p["max_tokens"], "echo": False}, False),
+    "llama-stream": ("/generate", lambda p: {"prompt": p["text"], "max_tokens": p["max_tokens"], "echo": False, "stream": True}, True),
+    "guardrails": ("/chat", lambda p: {"message": p["text"], "max_tokens": p["max_tokens"]}, False),
+    "guardrails-stream": ("/chat/stream", lambda p: {"message": p["text"], "max_tokens": p["max_tokens"]}, True),
+    "ui": ("/api/generate", lambda p: {"prompt": p["text"], "max_tokens": p["max_tokens"]}, False),
+    "ui-stream": ("/api/generate", lambda p: {"prompt": p["text"], "max_tokens": p["max_tokens"], "stream": True}, True),
+    "rag": ("/rag/query", lambda p: {"query": p["text"]}, False),
+}
+
+
+def load_mix(path):
+    if path is None:
+        return DEFAULT_MIX
+    with open(path, "r", encoding="utf-8") as f:
+        mix = json.load(f)
+    for item in mix:
+        item.setdefault("weight", 1)
+        item.setdefault("max_tokens", 128)
+    return mix
+
+
+def percentiles(seconds):
+    if not seconds:
+        return None
+    ms = np.array(seconds) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(ms, 50)), 1),
+        "p90_ms": round(float(np.percentile(ms, 90)), 1),
+        "p99_ms": round(float(np.percentile(ms, 99)), 1),
+        "max_ms": round(float(ms.max()), 1),
+        "mean_ms": round(float(ms.mean()), 1),
+    }
+
+
+class Run:
+    """Issues requests against one target and collects their outcomes."""
+
+    def __init__(self, client, name, base_url, mix, timeout):
+        self.client = client
+        self.name = name
+        self.path, self.build_payload, self.streaming = TARGETS[name]
+        self.url = base_url.rstrip("/") + self.path
+        self.mix = mix
+        self.weights = [item["weight"] for item in mix]
+        self.timeout = timeout
+        self.latencies = []
+        self.first_bytes = []
+        self.errors = Counter()
+        self.completed = 0
+
+    async def one_request(self):
+        prompt = random.choices(self.mix, weights=self.weights)[0]
+        started = time.perf_counter()
+        try:
+            async with self.client.stream("POST", self.url, json=self.build_payload(prompt), timeout=self.timeout) as response:
+                first_byte = None
+                async for _ in response.aiter_raw():
+                    if first_byte is None:
+                        first_byte = time.perf_counter()
+                if response.status_code >= 400:
+                    self.errors[f"http_{response.status_code}"] += 1
+                    return
+        except httpx.TimeoutException:
+            self.errors["timeout"] += 1
+            return
+        except httpx.HTTPError as e:
+            self.errors[type(e).__name__] += 1
+            return
+        finished = time.perf_counter()
+        self.completed += 1
+        self.latencies.append(finished - started)
+        if self.streaming and first_byte is not None:
+            self.first_bytes.append(first_byte - started)
+
+    async def closed_loop(self, users, duration, think_time):
+        deadline = time.perf_counter() + duration
+
+        async def user():
+            # Stagger start-up so the users don't arrive in one burst
+            await asyncio.sleep(random.uniform(0, min(1.0, duration / 10)))
+            while time.perf_counter() < deadline:
+                await self.one_request()
+                if think_time:
+                    await asyncio.sleep(random.expovariate(1 / think_time))
+
+        await asyncio.gather(*(user() for _ in range(users)))
+
+    async def open_loop(self, rate, duration):
+        deadline = time.perf_counter() + duration
+        in_flight = set()
+        while time.perf_counter() < deadline:
+            task = asyncio.create_task(self.one_request())
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+            await asyncio.sleep(random.expovariate(rate))
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+    def report(self, elapsed):
+        attempted = self.completed + sum(self.errors.values())
+        return {
+            "requests": attempted,
+            "completed": self.completed,
+            "elapsed_s": round(elapsed, 2),
+            "throughput_rps": round(self.completed / elapsed, 2) if elapsed else None,
+            "error_rate": round(sum(self.errors.values()) / attempted, 4) if attempted else None,
+            "errors": dict(self.errors),
+            "latency": percentiles(self.latencies),
+            "time_to_first_byte": percentiles(self.first_bytes) if self.streaming else None,
+        }
+
+
+async def run_level(name, base_url, mix, args, users=None, rate=None):
+    # Pool sized to the offered load so the client itself is never the bottleneck
+    connections = users if users else max(100, int(rate * args.timeout))
+    limits = httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+    async with httpx.AsyncClient(limits=limits) as client:
+        run = Run(client, name, base_url, mix, args.timeout)
+        started = time.perf_counter()
+        if users:
+            await run.closed_loop(users, args.duration, args.think_time)
+        else:
+            await run.open_loop(rate, args.duration)
+        result = run.report(time.perf_counter() - started)
+    result.update({"target": name, "url": run.url, "users": users, "rate": rate})
+    return result
+
+
+def parse_target(value):
+    name, sep, url = value.partition("=")
+    if not sep or name not in TARGETS:
+        raise argparse.ArgumentTypeError(f"expected NAME=URL with NAME one of: {', '.join(TARGETS)}")
+    return name, url
+
+
+async def run(args):
+    mix = load_mix(args.mix)
+    results = []
+    for name, base_url in args.target:
+        levels = [("users", u) for u in args.users] if args.users else [("rate", r) for r in args.rate]
+        for kind, value in levels:
+            print(f"{name}: {kind}={value} for {args.duration}s...", file=sys.stderr)
+            result = await run_level(name, base_url, mix, args, **{kind: value})
+            results.append(result)
+            latency = result["latency"] or {}
+            print(f"  {result['throughput_rps']} req/s, p50 {latency.get('p50_ms')} ms, "
+                  f"p99 {latency.get('p99_ms')} ms, errors {result['error_rate']}", file=sys.stderr)
+            if args.cooldown:
+                await asyncio.sleep(args.cooldown)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the chat pipeline services")
+    parser.add_argument("--target", type=parse_target, action="append", required=True,
+                        help=f"NAME=URL, repeatable; NAME is one of {', '.join(TARGETS)}")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--users", help="Comma-separated concurrent user counts (closed loop)")
+    load.add_argument("--rate", help="Comma-separated arrival rates in requests/s (open loop)")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds per load level")
+    parser.add_argument("--think-time", type=float, default=0, help="Mean pause between a user's requests, seconds")
+    parser.add_argument("--cooldown", type=float, default=5, help="Pause between load levels, seconds")
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout, seconds")
+    parser.add_argument("--mix", help="JSON file with [{\"text\", \"weight\", \"max_tokens\"}] (defaults to a built-in mix)")
+    parser.add_argument("--seed", type=int, help="Seed the prompt and arrival randomness")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    args.users = [int(u) for u in args.users.split(",")] if args.users else None
+    args.rate = [float(r) for r in args.rate.split(",")] if args.rate else None
+    if not args.users and not args.rate:
+        args.users = [50]
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = {
+        "timestamp": int(time.time()),
+        "config": {
+            "duration_s": args.duration,
+            "think_time_s": args.think_time,
+            "mix": args.mix or "default",
+        },
+        "results": asyncio.run(run(args)),
+    }
+    print(json.dumps(report, indent=2))
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
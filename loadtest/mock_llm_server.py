@@ -0,0 +1,163 @@
+"""
+mock_llm_server.py
+Stand-in for llama-api-docker/api_server.py for load tests - no model needed.
+
+Speaks the same /generate contract (JSON or NDJSON streaming, `echo`,
+finish_reason and usage) and fakes the latency of a real decode loop from
+token rates: prefill takes prompt_tokens / MOCK_PREFILL_TPS seconds and every
+generated token 1 / MOCK_DECODE_TPS seconds. Like the real server, only
+MOCK_SLOTS generations run at once (1 = the real server's single model lock),
+so queueing under load behaves the same.
+
+Guardrail self-check prompts get a one-word verdict: UNSAFE if the checked
+text contains MOCK_UNSAFE_MARKER, SAFE otherwise.
+
+    python mock_llm_server.py                      # listens on :8000 like the real server
+    MOCK_DECODE_TPS=40 MOCK_SLOTS=4 PORT=9000 python mock_llm_server.py
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+PREFILL_TPS = float(os.getenv("MOCK_PREFILL_TPS", 2000))   # prompt tokens per second
+DECODE_TPS = float(os.getenv("MOCK_DECODE_TPS", 25))       # generated tokens per second
+SLOTS = int(os.getenv("MOCK_SLOTS", 1))                    # concurrent generations
+MIN_COMPLETION_TOKENS = int(os.getenv("MOCK_MIN_TOKENS", 20))
+ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", 0))        # fraction of requests answered with a 500
+UNSAFE_MARKER = os.getenv("MOCK_UNSAFE_MARKER", "[unsafe]")
+
+# Marks the self_check_input / self_check_output prompts in nemo_guardrails/config/config.yml
+VERDICT_QUESTION = '"SAFE" or "UNSAFE"?'
+
+WORDS = ("the config service loads settings from the environment and applies them "
+         "to each deployment so teams can roll changes out safely and quickly").split()
+
+app = FastAPI(title="Mock Llama API Server")
+
+# Created on startup so it binds to the server's event loop
+STATE = {"slots": None, "active": 0, "waiting": 0, "served": 0}
+
+
+class PromptRequest(BaseModel):
+    prompt: str
+    max_tokens: int = 100
+    temperature: float = 0.7
+    stop: list = ["Q:"]
+    top_p: float = 0.9
+    echo: bool = True
+    stream: bool = False
+
+
+def count_tokens(text: str) -> int:
+    # ~4 characters per token for English text with a Llama tokenizer
+    return max(1, len(text) // 4)
+
+
+def completion_for(request: PromptRequest) -> list:
+    """The tokens (as text pieces) the mock model 'generates' for a request."""
+    if VERDICT_QUESTION in request.prompt:
+        return [" UNSAFE" if UNSAFE_MARKER in request.prompt else " SAFE"]
+    length = random.randint(min(MIN_COMPLETION_TOKENS, request.max_tokens), request.max_tokens)
+    return [" " + random.choice(WORDS) for _ in range(length)]
+
+
+def usage(prompt_tokens: int, completion_tokens: int, started: float, first_token: float, finished: float) -> dict:
+    decode_time = finished - first_token
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "time_to_first_token_ms": round((first_token - started) * 1000, 2),
+        "decode_tokens_per_s": round((completion_tokens - 1) / decode_time, 2) if decode_time > 0 and completion_tokens > 1 else None,
+    }
+
+
+@app.on_event("startup")
+async def startup_event():
+    STATE["slots"] = asyncio.Semaphore(SLOTS)
+
+
+@app.get("/health")
+async def health_check():
+    return {"status": "ok", "mock": True}
+
+
+@app.get("/model-info")
+async def model_info():
+    return {
+        "model": "mock-llama",
+        "prefill_tokens_per_s": PREFILL_TPS,
+        "decode_tokens_per_s": DECODE_TPS,
+        "slots": SLOTS,
+        "active": STATE["active"],
+        "waiting": STATE["waiting"],
+        "served": STATE["served"],
+    }
+
+
+async def decode(request: PromptRequest):
+    """Yield (piece, first_token_time) while holding a slot, at the configured rates."""
+    STATE["waiting"] += 1
+    async with STATE["slots"]:
+        STATE["waiting"] -= 1
+        STATE["active"] += 1
+        try:
+            await asyncio.sleep(count_tokens(request.prompt) / PREFILL_TPS)
+            first_token = time.perf_counter()
+            for i, piece in enumerate(completion_for(request)):
+                if i:
+                    await asyncio.sleep(1 / DECODE_TPS)
+                yield piece, first_token
+        finally:
+            STATE["active"] -= 1
+            STATE["served"] += 1
+
+
+@app.post("/generate")
+async def generate_response(request: PromptRequest):
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        raise HTTPException(status_code=500, detail="Injected mock failure")
+
+    started = time.perf_counter()
+    prompt_tokens = count_tokens(request.prompt)
+
+    if request.stream:
+        async def lines():
+            completion_tokens, first_token = 0, None
+            async for piece, first_token in decode(request):
+                completion_tokens += 1
+                yield json.dumps({"text": piece}) + "\n"
+            finished = time.perf_counter()
+            yield json.dumps({
+                "done": True,
+                "finish_reason": "stop" if completion_tokens < request.max_tokens else "length",
+                "stop_sequence": None,
+                "tokens_saved": max(request.max_tokens - completion_tokens, 0),
+                "usage": usage(prompt_tokens, completion_tokens, started, first_token or finished, finished),
+            }) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    pieces, first_token = [], None
+    async for piece, first_token in decode(request):
+        pieces.append(piece)
+    finished = time.perf_counter()
+    text = "".join(pieces)
+    return {
+        "response": request.prompt + text if request.echo else text,
+        "finish_reason": "stop" if len(pieces) < request.max_tokens else "length",
+        "stop_sequence": None,
+        "tokens_saved": max(request.max_tokens - len(pieces), 0),
+        "usage": usage(prompt_tokens, len(pieces), started, first_token or finished, finished),
+    }
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", 8000)))
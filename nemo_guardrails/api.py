@@ -1,15 +1,21 @@
-import os, sys, logging, datetime, platform, psutil
+import os, sys, json, time, asyncio, logging, datetime, platform, psutil
 from typing import List, Optional
 
-import nest_asyncio, uvicorn
+import uvicorn
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from prometheus_client import Counter, Gauge, Histogram
 from pydantic import BaseModel
 
 from nemoguardrails import RailsConfig, LLMRails
-from custom_llm import CustomLLM
+from custom_llm import CustomLLM, aclose_clients
+from safety import SafetyChecker, UNSAFE
+from verdict_cache import VerdictCache
+from stream_rails import checked_windows
+import metrics
+import tracing
 
-nest_asyncio.apply()
 logging.basicConfig(level=logging.INFO)
 
 # ----------------------------------------------------------------------
@@ -18,15 +24,89 @@ logging.basicConfig(level=logging.INFO)
 CONFIG_DIR = os.path.join(os.path.dirname(__file__),
                           ".", "config")
 llm    = CustomLLM()
+# Optional second Llama server for the safety checks, so they never wait
+# behind a generation (the server runs one request at a time)
+SAFETY_LLAMA_API_URL = os.getenv("SAFETY_LLAMA_API_URL")
+check_llm = CustomLLM(api_url=SAFETY_LLAMA_API_URL) if SAFETY_LLAMA_API_URL else None
 config = RailsConfig.from_path(CONFIG_DIR)
 rails  = LLMRails(config, llm=llm)
 
+# Local classifier answers confident SAFE/UNSAFE cases without an LLM call;
+# set SAFETY_CLASSIFIER=llm to always use the LLM self-check prompts
+SAFETY_CLASSIFIER = os.getenv("SAFETY_CLASSIFIER", "local").lower()
+SAFETY_THRESHOLD  = float(os.getenv("SAFETY_THRESHOLD", 0.85))
+
+classifier = None
+if SAFETY_CLASSIFIER == "local":
+    try:
+        from local_classifier import LocalSafetyClassifier
+        classifier = LocalSafetyClassifier(threshold=SAFETY_THRESHOLD)
+    except Exception:
+        logging.exception("Local safety classifier unavailable - using LLM checks only")
+
+# Verdict cache for repeated messages / canned responses; set
+# VERDICT_CACHE_PATH to keep it across restarts
+verdict_cache = None
+if os.getenv("VERDICT_CACHE", "true").lower() == "true":
+    verdict_cache = VerdictCache(
+        max_entries=int(os.getenv("VERDICT_CACHE_SIZE", 10000)),
+        ttl=float(os.getenv("VERDICT_CACHE_TTL", 3600)),
+        path=os.getenv("VERDICT_CACHE_PATH") or None,
+        save_interval=float(os.getenv("VERDICT_CACHE_SAVE_INTERVAL", 10)),
+    )
+
+safety = SafetyChecker(config, llm, classifier=classifier, cache=verdict_cache, check_llm=check_llm)
+safety.register(rails)
+
+# Optimistic mode: the input check runs concurrently with a generation that
+# skips the input rail (output rails still apply); the generation is
+# cancelled if the input turns out to be UNSAFE.
+OPTIMISTIC_RAILS = os.getenv("OPTIMISTIC_RAILS", "true").lower() == "true"
+# keep in sync with the `self check input/output` flows in config/flows.co
+INPUT_REFUSAL = ("I'm sorry, I cannot respond to that request as it appears "
+                 "to contain inappropriate content.")
+OUTPUT_REFUSAL = ("I apologize, but I need to reconsider my response to ensure "
+                  "it's helpful and appropriate.")
+
+# general instructions from config.yml, used to build the streaming prompt
+GENERAL_INSTRUCTIONS = "\n".join(
+    i.content.strip() for i in (config.instructions or []) if i.type == "general"
+)
+
+generation_config = config.copy(deep=True)
+generation_config.rails.input.flows = []
+generation_rails = LLMRails(generation_config, llm=llm)
+safety.register(generation_rails)
+
+# ----------------------------------------------------------------------
+# metrics (exported on /metrics)
+# ----------------------------------------------------------------------
+RAILS_LATENCY = Histogram(
+    "guardrails_generate_seconds",
+    "Guarded generation latency, including the rails",
+    ["mode"],
+    buckets=metrics.LATENCY_BUCKETS,
+)
+BLOCKED = Counter("guardrails_blocked_total", "Responses replaced by a refusal", ["rail"])
+STREAM_WINDOWS = Counter("guardrails_stream_windows_total", "Streamed windows released to clients")
+if verdict_cache is not None:
+    Gauge("guardrails_verdict_cache_entries", "Entries in the verdict cache").set_function(
+        lambda: verdict_cache.stats()["entries"]
+    )
+    Gauge("guardrails_verdict_cache_hit_ratio", "Verdict cache hits / lookups since start").set_function(
+        lambda: verdict_cache.stats()["hit_ratio"] or 0
+    )
+
 # ----------------------------------------------------------------------
 # FastAPI plumbing
 # ----------------------------------------------------------------------
 app = FastAPI(title="NeMo Guardrails API",
               description="LLM endpoint protected by NeMo Guardrails")
 
+tracing.configure("nemo-guardrails")
+app.add_middleware(tracing.TraceMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"], allow_credentials=True,
@@ -47,10 +127,21 @@ class ChatRequest(BaseModel):
     temperature: Optional[float] = 0.7
     timeout: Optional[int] = 360
     echo_mode: Optional[bool] = False
+    optimistic: Optional[bool] = None  # None -> OPTIMISTIC_RAILS default
 
 class ChatResponse(BaseModel):
     response: str
 
+# ----------------------------------------------------------------------
+# lifecycle
+# ----------------------------------------------------------------------
+@app.on_event("shutdown")
+async def shutdown():
+    # release the pooled keep-alive connections to the Llama API
+    await aclose_clients()
+    if verdict_cache is not None:
+        verdict_cache.save()
+
 # ----------------------------------------------------------------------
 # routes
 # ----------------------------------------------------------------------
@@ -58,6 +149,26 @@ class ChatResponse(BaseModel):
 async def health():
     return {"status": "ok"}
 
+async def traced_generate(rails_instance: LLMRails, messages: List[dict]):
+    with tracing.span("rails.generate"):
+        return await rails_instance.generate_async(messages=messages)
+
+async def generate_optimistic(messages: List[dict], user_message: str):
+    check_task = asyncio.create_task(safety.check("input", user_message))
+    generate_task = asyncio.create_task(traced_generate(generation_rails, messages))
+    try:
+        verdict = await check_task
+    except BaseException:
+        generate_task.cancel()
+        raise
+
+    if verdict == UNSAFE:
+        generate_task.cancel()
+        BLOCKED.labels("input").inc()
+        logging.info("Input rail returned UNSAFE - discarded optimistic generation")
+        return INPUT_REFUSAL
+    return await generate_task
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(req: ChatRequest):
     if req.echo_mode:
@@ -66,8 +177,15 @@ async def chat(req: ChatRequest):
     messages = [m.model_dump() for m in (req.history or [])]
     messages.append({"role": "user", "content": req.message})
 
+    optimistic = OPTIMISTIC_RAILS if req.optimistic is None else req.optimistic
+
+    started = time.perf_counter()
     try:
-        rsp = await rails.generate_async(messages=messages)
+        if optimistic:
+            rsp = await generate_optimistic(messages, req.message)
+        else:
+            rsp = await traced_generate(rails, messages)
+        RAILS_LATENCY.labels("optimistic" if optimistic else "sequential").observe(time.perf_counter() - started)
     except Exception as e:
         logging.exception("Guardrails failure")
         raise HTTPException(status_code=500, detail=str(e))
@@ -75,6 +193,75 @@ async def chat(req: ChatRequest):
     # LLMRails returns a plain string by default
     return {"response": rsp if isinstance(rsp, str) else rsp.get("content", str(rsp))}
 
+def build_chat_prompt(messages: List[dict]) -> str:
+    lines = [GENERAL_INSTRUCTIONS, ""] if GENERAL_INSTRUCTIONS else []
+    for m in messages:
+        role = "User" if m["role"] == "user" else "Assistant"
+        lines.append(f"{role}: {m['content']}")
+    lines.append("Assistant:")
+    return "\n".join(lines)
+
+def sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Streaming chat with incremental output rails (server-sent events).
+
+    Generation starts right away, concurrently with the input check; each
+    sentence-sized window is released as soon as the input check has passed
+    and the window itself has passed the output check.
+    """
+    messages = [m.model_dump() for m in (req.history or [])]
+    messages.append({"role": "user", "content": req.message})
+    prompt = build_chat_prompt(messages)
+
+    async def events():
+        # On the shared server an LLM check would queue behind this very
+        # generation, so the input check and the windows keep the local
+        # verdict unless checks have their own server (or there is no local
+        # classifier to fall back on)
+        escalate = safety.separate_check_llm or classifier is None
+        input_check = asyncio.create_task(safety.check("input", req.message, escalate=escalate))
+        chunks = llm.astream_completion(
+            prompt,
+            stop=["User:"],
+            max_tokens=req.max_tokens,
+            temperature=req.temperature,
+            timeout=req.timeout,
+        )
+        try:
+            input_passed = False
+            async for window, verdict in checked_windows(chunks, safety, escalate=escalate):
+                if not input_passed:
+                    if await input_check == UNSAFE:
+                        BLOCKED.labels("input").inc()
+                        yield sse({"delta": INPUT_REFUSAL, "blocked": "input"})
+                        return
+                    input_passed = True
+                if verdict == UNSAFE:
+                    BLOCKED.labels("output").inc()
+                    yield sse({"delta": OUTPUT_REFUSAL, "blocked": "output"})
+                    return
+                STREAM_WINDOWS.inc()
+                yield sse({"delta": window})
+
+            # empty generation: the input verdict still decides the answer
+            if not input_passed and await input_check == UNSAFE:
+                BLOCKED.labels("input").inc()
+                yield sse({"delta": INPUT_REFUSAL, "blocked": "input"})
+                return
+            yield sse({"done": True})
+        except Exception as e:
+            logging.exception("Streaming guardrails failure")
+            yield sse({"error": str(e)})
+        finally:
+            input_check.cancel()
+            await chunks.aclose()
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 @app.get("/diagnostics")
 async def diagnostics():
     mem = psutil.virtual_memory()
@@ -82,14 +269,30 @@ async def diagnostics():
         "python": sys.version,
         "platform": platform.platform(),
         "memory_used_pct": mem.percent,
+        "safety_classifier": "local" if classifier is not None else "llm",
+        "safety_checks": safety.stats,
+        "verdict_cache": verdict_cache.stats() if verdict_cache is not None else None,
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    return metrics.metrics_response()
+
+@app.get("/debug/trace/{trace_id}")
+async def debug_trace(trace_id: str, format: str = "text"):
+    spans = tracing.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail=f"No spans recorded for trace {trace_id}")
+    if format == "json":
+        return {"trace_id": trace_id, "spans": spans}
+    return PlainTextResponse(tracing.render_waterfall(spans))
+
 @app.get("/")
 async def root():
     return {
         "api": "NeMo Guardrails",
         "version": "1.0",
-        "endpoints": ["/health", "/chat", "/diagnostics"],
+        "endpoints": ["/health", "/chat", "/chat/stream", "/diagnostics"],
     }
 
 # ----------------------------------------------------------------------
@@ -0,0 +1,139 @@
+"""
+benchmark_safety.py
+Compare the local safety classifier with the LLM self-check rail.
+
+Reports per-check latency (p50/p99), how often the local classifier has to
+escalate, and how often its final verdict agrees with the LLM rail (and with
+the labels, when the dataset has them).
+
+    python benchmark_safety.py                       # seed examples, local + LLM
+    python benchmark_safety.py --data my_set.jsonl   # {"text": ..., "label": "SAFE"|"UNSAFE"}
+    python benchmark_safety.py --skip-llm            # no Llama API needed
+
+Note that the seed examples are also what the classifier's head is built
+from, so use a held-out --data file for a fair agreement number.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import numpy as np
+
+from nemoguardrails import RailsConfig
+from custom_llm import CustomLLM
+from local_classifier import EXAMPLES_PATH, LocalSafetyClassifier
+from safety import SAFE, UNSAFE, SafetyChecker
+
+CONFIG_DIR = os.path.join(os.path.dirname(__file__), "config")
+
+
+def load_dataset(path):
+    """Return a list of (text, label) pairs; label may be None."""
+    if path is None:
+        with open(EXAMPLES_PATH, "r", encoding="utf-8") as f:
+            examples = json.load(f)
+        return ([(t, SAFE) for t in examples["safe"]]
+                + [(t, UNSAFE) for t in examples["unsafe"]])
+
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                label = row.get("label")
+                items.append((row["text"], label.upper() if label else None))
+    return items
+
+
+def latency_summary(seconds):
+    if not seconds:
+        return None
+    ms = np.array(seconds) * 1000
+    return {
+        "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 2),
+        "p99_ms": round(float(np.percentile(ms, 99)), 2),
+        "mean_ms": round(float(ms.mean()), 2),
+    }
+
+
+def rate(pairs):
+    pairs = [(a, b) for a, b in pairs if a is not None and b is not None]
+    if not pairs:
+        return None
+    return round(sum(a == b for a, b in pairs) / len(pairs), 4)
+
+
+async def run(args):
+    dataset = load_dataset(args.data)
+    classifier = LocalSafetyClassifier(threshold=args.threshold)
+    checker = None
+    if not args.skip_llm:
+        checker = SafetyChecker(RailsConfig.from_path(CONFIG_DIR), CustomLLM())
+
+    local_times, llm_times = [], []
+    rows = []
+    for text, label in dataset:
+        start = time.perf_counter()
+        predicted, confidence = classifier.predict(text)
+        local_times.append(time.perf_counter() - start)
+        escalated = confidence < args.threshold
+
+        llm_verdict = None
+        if checker is not None:
+            start = time.perf_counter()
+            llm_verdict = await checker.llm_check(args.rail, text)
+            llm_times.append(time.perf_counter() - start)
+
+        # What the rail would answer: local verdict, or the LLM's on escalation
+        final = llm_verdict if escalated and llm_verdict is not None else predicted
+        rows.append({
+            "text": text,
+            "label": label,
+            "local": predicted,
+            "confidence": round(confidence, 4),
+            "escalated": escalated,
+            "llm": llm_verdict,
+            "final": final,
+        })
+
+    report = {
+        "rail": args.rail,
+        "threshold": args.threshold,
+        "examples": len(rows),
+        "escalation_rate": round(sum(r["escalated"] for r in rows) / max(len(rows), 1), 4),
+        "local_latency": latency_summary(local_times),
+        "llm_latency": latency_summary(llm_times),
+        "agreement_local_vs_llm": rate([(r["local"], r["llm"]) for r in rows]),
+        "agreement_final_vs_llm": rate([(r["final"], r["llm"]) for r in rows]),
+        "accuracy_local": rate([(r["local"], r["label"]) for r in rows]),
+        "accuracy_final": rate([(r["final"], r["label"]) for r in rows]),
+        "accuracy_llm": rate([(r["llm"], r["label"]) for r in rows]),
+    }
+    if args.verbose:
+        report["rows"] = rows
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the local safety classifier against the LLM rail")
+    parser.add_argument("--data", help="JSONL file with {\"text\", \"label\"} rows (defaults to the seed examples)")
+    parser.add_argument("--rail", choices=["input", "output"], default="input", help="Which self-check prompt the LLM uses")
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("SAFETY_THRESHOLD", 0.85)), help="Local classifier confidence threshold")
+    parser.add_argument("--skip-llm", action="store_true", help="Only benchmark the local classifier")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Include per-example rows in the report")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,79 @@ custom_llm.py
 Custom LangChain LLM wrapper for a locally-hosted Llama-based FastAPI service.
 """
 
+import asyncio
+import json
 import os
-from typing import Any, List, Mapping, Optional
+import threading
+import weakref
+from typing import Any, AsyncIterator, Dict, List, Mapping, Optional
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from langchain.llms.base import LLM
 from nemoguardrails.llm.providers import register_llm_provider
 
+import tracing
+
+
+# ---------------------------------------------------------------------- #
+# ⓪  Shared, pooled HTTP clients (one per process / event loop)          #
+# ---------------------------------------------------------------------- #
+MAX_CONNECTIONS = int(os.getenv("LLAMA_MAX_CONNECTIONS", 32))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLAMA_MAX_KEEPALIVE", 16))
+KEEPALIVE_EXPIRY = float(os.getenv("LLAMA_KEEPALIVE_EXPIRY", 30))
+CONNECT_TIMEOUT = float(os.getenv("LLAMA_CONNECT_TIMEOUT", 5))
+
+_sync_session: Optional[requests.Session] = None
+_sync_lock = threading.Lock()
+# httpx.AsyncClient is bound to the loop it was first used on; keyed weakly so
+# a closed loop's entry goes away with it (and ids of dead loops get reused)
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def get_sync_session() -> requests.Session:
+    """Keep-alive session reused by every blocking call."""
+    global _sync_session
+    with _sync_lock:
+        if _sync_session is None:
+            _sync_session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=MAX_CONNECTIONS,
+            )
+            _sync_session.mount("http://", adapter)
+            _sync_session.mount("https://", adapter)
+        return _sync_session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Pooled keep-alive client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    # Pooled connections can keep their loop alive, so drop closed loops' clients explicitly
+    for stale in [l for l in list(_async_clients.keys()) if l.is_closed()]:
+        _async_clients.pop(stale, None)
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=KEEPALIVE_EXPIRY,
+            ),
+        )
+        _async_clients[loop] = client
+    return client
+
+
+async def aclose_clients() -> None:
+    """Close pooled connections (call from the app shutdown hook)."""
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+    if _sync_session is not None:
+        _sync_session.close()
+
 
 class CustomLLM(LLM):
     # ------------------------------------------------------------------ #
@@ -42,55 +108,40 @@ class CustomLLM(LLM):
         }
 
     # ------------------------------------------------------------------ #
-    # ❸  Core call                                                       #
+    # ❸  Core call (sync and native async share payload/post-processing)  #
     # ------------------------------------------------------------------ #
-    def _call(
-        self,
-        prompt: str,
-        stop: Optional[List[str]] = None,
-        run_manager=None,
-        **kwargs,
-    ) -> str:
-        """Call the local Llama API and return the model output."""
-
+    def _build_payload(self, prompt: str, stop: Optional[List[str]], kwargs: Dict[str, Any]) -> Dict[str, Any]:
         # Allow per-request overrides via **kwargs
         temperature = kwargs.get("temperature", self.temperature)
         max_tokens = kwargs.get("max_tokens", self.max_tokens)
         top_p = kwargs.get("top_p", self.top_p)
-        timeout = kwargs.get("timeout", self.request_timeout)
 
         # FastAPI endpoint might expect list[string] for stop
         stop = stop or ["User:", "Assistant:", "Q:"]
-        payload = {
+        return {
             "prompt": prompt,
             "max_tokens": max_tokens,
             "temperature": temperature,
             "top_p": top_p,
             "stop": stop,
+            "echo": False,  # only the completion, not the prompt, comes back
         }
 
-        try:
-            r = requests.post(self.api_url, json=payload, timeout=timeout)
-            r.raise_for_status()  # raises HTTPError for non-2xx
-        except requests.exceptions.Timeout as e:
-            raise RuntimeError(
-                f"Llama API timed out after {timeout}s. "
-                "Increase TIMEOUT env var if your model needs more time."
-            ) from e
-        except requests.exceptions.RequestException as e:
-            raise RuntimeError(f"Llama API call failed: {e}") from e
-
+    def _parse_response(self, prompt: str, data: Dict[str, Any], body: str) -> str:
         # Expecting JSON: { "response": "..." }
-        raw_text = r.json().get("response", "")
-        if not raw_text:
+        raw_text = data.get("response") if isinstance(data, dict) else None
+        if not isinstance(raw_text, str):
             raise ValueError(
-                f"Malformed response from Llama API: {r.text[:200]}..."
+                f"Malformed response from Llama API: {body[:200]}..."
             )
+        if not raw_text:
+            # A stop sequence or EOS right away: an empty completion, not an error
+            return ""
 
         # ------------------------------------------------------------------ #
         # ❹  Light post-processing – strip the echoed prompt / role labels    #
         # ------------------------------------------------------------------ #
-        # Remove leading prompt echo if server returns it
+        # Remove leading prompt echo if an older server ignores `echo`
         if raw_text.startswith(prompt):
             raw_text = raw_text[len(prompt) :]
 
@@ -101,6 +152,103 @@ class CustomLLM(LLM):
 
         return raw_text.strip()
 
+    def _call(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs,
+    ) -> str:
+        """Call the local Llama API and return the model output."""
+        payload = self._build_payload(prompt, stop, kwargs)
+        timeout = kwargs.get("timeout", self.request_timeout)
+
+        try:
+            with tracing.span("llm.call", max_tokens=payload["max_tokens"]):
+                r = get_sync_session().post(
+                    self.api_url,
+                    json=payload,
+                    headers=tracing.outgoing_headers(),
+                    timeout=(CONNECT_TIMEOUT, timeout),
+                )
+            r.raise_for_status()  # raises HTTPError for non-2xx
+        except requests.exceptions.Timeout as e:
+            raise RuntimeError(
+                f"Llama API timed out after {timeout}s. "
+                "Increase TIMEOUT env var if your model needs more time."
+            ) from e
+        except requests.exceptions.RequestException as e:
+            raise RuntimeError(f"Llama API call failed: {e}") from e
+
+        return self._parse_response(prompt, r.json(), r.text)
+
+    async def _acall(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        run_manager=None,
+        **kwargs,
+    ) -> str:
+        """Non-blocking call to the local Llama API on the shared async pool."""
+        payload = self._build_payload(prompt, stop, kwargs)
+        timeout = kwargs.get("timeout", self.request_timeout)
+
+        try:
+            with tracing.span("llm.call", max_tokens=payload["max_tokens"]):
+                r = await get_async_client().post(
+                    self.api_url,
+                    json=payload,
+                    headers=tracing.outgoing_headers(),
+                    timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+                )
+            r.raise_for_status()  # raises HTTPStatusError for non-2xx
+        except httpx.TimeoutException as e:
+            raise RuntimeError(
+                f"Llama API timed out after {timeout}s. "
+                "Increase TIMEOUT env var if your model needs more time."
+            ) from e
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Llama API call failed: {e}") from e
+
+        return self._parse_response(prompt, r.json(), r.text)
+
+    async def astream_completion(
+        self,
+        prompt: str,
+        stop: Optional[List[str]] = None,
+        **kwargs,
+    ) -> AsyncIterator[str]:
+        """Yield completion text deltas as the Llama API decodes them."""
+        payload = self._build_payload(prompt, stop, kwargs)
+        payload["stream"] = True
+        timeout = kwargs.get("timeout", self.request_timeout)
+
+        try:
+            async with get_async_client().stream(
+                "POST",
+                self.api_url,
+                json=payload,
+                headers=tracing.outgoing_headers(),
+                timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+            ) as r:
+                r.raise_for_status()
+                async for line in r.aiter_lines():
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if event.get("error"):
+                        raise RuntimeError(f"Llama API stream failed: {event['error']}")
+                    if event.get("done"):
+                        break
+                    yield event.get("text", "")
+        except httpx.TimeoutException as e:
+            raise RuntimeError(
+                f"Llama API timed out after {timeout}s. "
+                "Increase TIMEOUT env var if your model needs more time."
+            ) from e
+        except httpx.HTTPError as e:
+            raise RuntimeError(f"Llama API call failed: {e}") from e
+
 
 # ---------------------------------------------------------------------- #
 # ❺  Make the provider name `custom` visible to NeMo Guardrails          #
@@ -0,0 +1,88 @@
+"""
+local_classifier.py
+Cheap local SAFE/UNSAFE classifier used in front of the LLM self-check rails.
+
+Two stages:
+  1. a regex prefilter for explicit harmful requests; a hit counts as strong
+     but not certain evidence, so on its own it is still escalated;
+  2. a linear head over sentence-transformer embeddings (the difference of
+     the UNSAFE and SAFE example centroids in config/safety_examples.json).
+
+Each prediction comes with a confidence. Anything below the threshold is
+reported as uncertain (None) so the caller can escalate it to the LLM check.
+"""
+
+import json
+import logging
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from safety import SAFE, UNSAFE
+
+EMBEDDING_MODEL = os.getenv("SAFETY_EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "config", "safety_examples.json")
+
+# Logistic scale applied to the linear head's score; cosine differences are
+# small, so this spreads them over a usable 0..1 confidence range
+HEAD_SCALE = 12.0
+
+# Confidence of a prefilter hit: below the default threshold, so the LLM
+# confirms it (words like "kill" or "naked" are routine in devops questions)
+PATTERN_CONFIDENCE = 0.8
+
+UNSAFE_PATTERNS = [
+    r"\bhow (do i|to|can i) (make|build) (a )?(bomb|explosive|weapon)s?\b",
+    r"\bhow (do i|to|can i) (kill|poison|hurt) (someone|somebody|a person)\b",
+    r"\b(buy|sell|cook|make) (meth|cocaine|heroin|fentanyl)\b",
+]
+
+log = logging.getLogger(__name__)
+
+
+class LocalSafetyClassifier:
+    """Keyword prefilter plus embedding linear head with a confidence threshold."""
+
+    def __init__(self, threshold: float = 0.85, examples_path: str = EXAMPLES_PATH, model=None):
+        self.threshold = threshold
+        self.patterns = re.compile("|".join(UNSAFE_PATTERNS), re.IGNORECASE)
+
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(EMBEDDING_MODEL)
+        self.model = model
+
+        with open(examples_path, "r", encoding="utf-8") as f:
+            examples = json.load(f)
+        safe = self._embed(examples[SAFE.lower()])
+        unsafe = self._embed(examples[UNSAFE.lower()])
+
+        # Nearest-centroid as a linear head: score = w . x + b
+        safe_centroid = safe.mean(axis=0)
+        unsafe_centroid = unsafe.mean(axis=0)
+        self.weights = unsafe_centroid - safe_centroid
+        self.bias = -float(np.dot(self.weights, (unsafe_centroid + safe_centroid) / 2))
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """Return (verdict, confidence in that verdict)."""
+        embedding = self._embed([text])[0]
+        score = float(np.dot(self.weights, embedding)) + self.bias
+        p_unsafe = 1.0 / (1.0 + np.exp(-HEAD_SCALE * score))
+        if self.patterns.search(text):
+            return UNSAFE, max(float(p_unsafe), PATTERN_CONFIDENCE)
+        if p_unsafe >= 0.5:
+            return UNSAFE, float(p_unsafe)
+        return SAFE, float(1.0 - p_unsafe)
+
+    def classify(self, text: str) -> Optional[str]:
+        """Return SAFE / UNSAFE when confident, None when the LLM should decide."""
+        verdict, confidence = self.predict(text)
+        if confidence >= self.threshold:
+            return verdict
+        log.info("local classifier uncertain (%s, %.2f) - escalating", verdict, confidence)
+        return None
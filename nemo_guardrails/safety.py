@@ -0,0 +1,154 @@
+"""
+safety.py
+SAFE/UNSAFE checks behind the `self check input` / `self check output` rails.
+
+The checks render the `self_check_input` / `self_check_output` prompts from
+config.yml and ask the Llama model for a one-word verdict. An optional local
+classifier (see local_classifier.py) answers confident cases first and only
+escalates uncertain ones to the LLM, and an optional verdict cache (see
+verdict_cache.py) short-circuits repeated texts. The checks are exposed
+both as NeMo Guardrails actions (used by the flows in config/flows.co) and
+as a plain coroutine the API can call directly, e.g. to run the input check
+concurrently with generation.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from jinja2 import Template
+from prometheus_client import Counter, Histogram
+
+import metrics
+import tracing
+
+SAFE = "SAFE"
+UNSAFE = "UNSAFE"
+
+# rail name -> (prompt task in config.yml, template variable)
+RAIL_TASKS = {
+    "input": ("self_check_input", "user_input"),
+    "output": ("self_check_output", "bot_response"),
+}
+
+# A verdict is a single word, so a handful of tokens is plenty; the stop
+# strings end generation early if the model starts a new turn instead
+CHECK_MAX_TOKENS = 8
+CHECK_STOP = ["User:", "Assistant:", "Q:"]
+
+log = logging.getLogger(__name__)
+
+SAFETY_CHECKS = Counter(
+    "guardrails_safety_checks_total",
+    "Safety checks answered, by rail, verdict source (cache/local/llm) and verdict",
+    ["rail", "source", "verdict"],
+)
+SAFETY_LATENCY = Histogram(
+    "guardrails_safety_check_seconds",
+    "Safety check latency by rail and verdict source",
+    ["rail", "source"],
+    buckets=metrics.LATENCY_BUCKETS,
+)
+
+
+def parse_verdict(text: str) -> str:
+    """Map raw model output to SAFE / UNSAFE (anything not UNSAFE is SAFE)."""
+    return UNSAFE if UNSAFE in text.upper() else SAFE
+
+
+class SafetyChecker:
+    """Runs the self-check prompts defined in the rails config."""
+
+    def __init__(self, config, llm, classifier=None, cache=None, check_llm=None):
+        self.llm = check_llm or llm  # a separate server keeps checks off the generation lock
+        self.separate_check_llm = check_llm is not None
+        self.classifier = classifier
+        self.cache = cache
+        self.stats = {"cached": 0, "local": 0, "llm": 0}
+        self.templates = {}
+        for prompt in config.prompts or []:
+            self.templates[prompt.task] = Template(prompt.content)
+
+    def render(self, rail: str, text: str) -> str:
+        task, variable = RAIL_TASKS[rail]
+        if task not in self.templates:
+            raise ValueError(f"No `{task}` prompt found in the rails config")
+        return self.templates[task].render(**{variable: text})
+
+    async def check(self, rail: str, text: str, escalate: bool = True) -> str:
+        """
+        Return SAFE or UNSAFE for `text` on the given rail ("input"/"output").
+
+        With escalate=False an uncertain local verdict is used as is instead
+        of asking the LLM (and not cached); streaming uses this when the
+        check would otherwise queue behind its own generation.
+        """
+        if not text:
+            return SAFE
+        started = time.perf_counter()
+        with tracing.span(f"safety.check_{rail}") as span:
+            verdict, source = await self._check(rail, text, escalate)
+            span["attributes"].update(verdict=verdict, source=source)
+        SAFETY_CHECKS.labels(rail, source, verdict).inc()
+        SAFETY_LATENCY.labels(rail, source).observe(time.perf_counter() - started)
+        return verdict
+
+    async def _check(self, rail: str, text: str, escalate: bool = True):
+        if self.cache is not None:
+            verdict = self.cache.get(rail, text)
+            if verdict is not None:
+                self.stats["cached"] += 1
+                return verdict, "cache"
+
+        verdict, source = None, "local"
+        if self.classifier is not None:
+            # Embedding the text is CPU-bound; keep it off the event loop
+            guess, confidence = await asyncio.to_thread(self.classifier.predict, text)
+            if confidence >= self.classifier.threshold:
+                verdict = guess
+                self.stats["local"] += 1
+                log.info("self check %s (local): %s", rail, verdict)
+            elif not escalate:
+                self.stats["local"] += 1
+                log.info("self check %s (local, uncertain %.2f, not escalated): %s", rail, confidence, guess)
+                return guess, "local_uncertain"
+            else:
+                log.info("local classifier uncertain (%s, %.2f) - escalating", guess, confidence)
+
+        if verdict is None:
+            verdict, source = await self.llm_check(rail, text), "llm"
+
+        if self.cache is not None:
+            self.cache.put(rail, text, verdict)
+        return verdict, source
+
+    async def llm_check(self, rail: str, text: str) -> str:
+        """Ask the Llama model for the verdict, bypassing the local classifier."""
+        self.stats["llm"] += 1
+        raw = await self.llm.apredict(
+            self.render(rail, text),
+            stop=CHECK_STOP,
+            max_tokens=CHECK_MAX_TOKENS,
+        )
+        verdict = parse_verdict(raw)
+        log.info("self check %s: %s", rail, verdict)
+        return verdict
+
+    # ------------------------------------------------------------------ #
+    # NeMo Guardrails actions (names match `execute ...` in flows.co)    #
+    # ------------------------------------------------------------------ #
+    async def self_check_input(self, user_input: Optional[str] = None, context: Optional[dict] = None) -> str:
+        if user_input is None and context:
+            user_input = context.get("user_message")
+        return await self.check("input", user_input)
+
+    async def self_check_output(self, bot_response: Optional[str] = None, context: Optional[dict] = None) -> str:
+        if bot_response is None and context:
+            bot_response = context.get("bot_message")
+        return await self.check("output", bot_response)
+
+    def register(self, rails) -> None:
+        """Route the self-check actions of an LLMRails instance through this checker."""
+        rails.register_action(self.self_check_input, name="self_check_input")
+        rails.register_action(self.self_check_output, name="self_check_output")
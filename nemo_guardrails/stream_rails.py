@@ -0,0 +1,93 @@
+"""
+stream_rails.py
+Incremental output rail for streamed generations.
+
+Generated text is buffered into sentence-sized windows; each window is run
+through the `output` safety check as soon as it is complete and released to
+the client only if it comes back SAFE. Users see the first sentence after one
+cheap check instead of after the whole generation plus a full LLM check.
+
+A window that was already released cannot be taken back, so an UNSAFE
+verdict ends the stream at that point rather than retracting earlier text.
+
+The Llama server generates one request at a time, so an LLM check issued
+while the stream is generating would only run once the whole generation is
+done. Unless the checks go to a separate server (SAFETY_LLAMA_API_URL),
+window checks therefore do not escalate: an uncertain local verdict stands.
+"""
+
+import re
+from typing import AsyncIterator, List, Tuple
+
+from safety import SAFE, SafetyChecker
+
+# Sentence end: terminal punctuation followed by whitespace, or a newline
+SENTENCE_END = re.compile(r"[.!?][\"')\]]*\s+|\n+")
+
+MIN_WINDOW_CHARS = 40   # merge very short sentences into the next window
+MAX_WINDOW_CHARS = 400  # force a window out of run-on text
+
+
+class WindowBuffer:
+    """Accumulates streamed text and cuts it into sentence-sized windows."""
+
+    def __init__(self, min_chars: int = MIN_WINDOW_CHARS, max_chars: int = MAX_WINDOW_CHARS):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.pending = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Add text; return the windows it completed (possibly none)."""
+        self.pending += text
+        windows = []
+        while True:
+            cut = None
+            for match in SENTENCE_END.finditer(self.pending):
+                if match.end() >= self.min_chars:
+                    cut = match.end()
+                    break
+            if cut is None and len(self.pending) >= self.max_chars:
+                # No sentence break in sight; split at the last space instead
+                space = self.pending.rfind(" ", 0, self.max_chars)
+                cut = space + 1 if space > 0 else self.max_chars
+            if cut is None:
+                return windows
+            windows.append(self.pending[:cut])
+            self.pending = self.pending[cut:]
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the stream has ended."""
+        rest, self.pending = self.pending, ""
+        return [rest] if rest.strip() else []
+
+
+async def checked_windows(
+    chunks: AsyncIterator[str],
+    safety: SafetyChecker,
+    buffer: WindowBuffer = None,
+    escalate: bool = True,
+) -> AsyncIterator[Tuple[str, str]]:
+    """
+    Yield (window, verdict) pairs for a stream of text chunks.
+
+    Stops right after the first UNSAFE window; the caller decides what to
+    send instead of it. With escalate=False uncertain windows keep the local
+    classifier's verdict instead of waiting for an LLM check.
+    """
+    buffer = buffer or WindowBuffer()
+
+    async def judge(windows):
+        for window in windows:
+            verdict = await safety.check("output", window.strip(), escalate=escalate)
+            yield window, verdict
+            if verdict != SAFE:
+                return
+
+    async for chunk in chunks:
+        async for window, verdict in judge(buffer.feed(chunk)):
+            yield window, verdict
+            if verdict != SAFE:
+                return
+
+    async for window, verdict in judge(buffer.flush()):
+        yield window, verdict
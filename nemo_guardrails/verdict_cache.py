@@ -0,0 +1,152 @@
+"""
+verdict_cache.py
+LRU + TTL cache of SAFE/UNSAFE verdicts for the guardrail safety checks.
+
+Entries are keyed by the rail name and a hash of the normalized text
+(lower-cased, whitespace collapsed), so repeated greetings, common product
+questions and canned bot responses get an instant verdict. The cache can be
+persisted to a JSON file and reloaded on the next start; new verdicts are
+written out at most save_interval seconds after they are stored, so a crash
+loses only the last few.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+log = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+
+def cache_key(rail: str, text: str) -> str:
+    digest = hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+    return f"{rail}:{digest}"
+
+
+class VerdictCache:
+    """Bounded verdict cache with least-recently-used eviction and expiry."""
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 3600,
+        path: Optional[str] = None,
+        save_interval: float = 10.0,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.save_interval = save_interval
+        self._entries = OrderedDict()  # key -> (verdict, stored_at)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of the file at a time
+        self._save_timer = None  # pending debounced save
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path:
+            self.load()
+
+    def get(self, rail: str, text: str) -> Optional[str]:
+        key = cache_key(rail, text)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            verdict, stored_at = entry
+            if time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return verdict
+
+    def put(self, rail: str, text: str, verdict: str) -> None:
+        key = cache_key(rail, text)
+        with self._lock:
+            self._entries[key] = (verdict, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            if self.path and self._save_timer is None:
+                # Debounced: one write covers every verdict stored in the interval
+                self._save_timer = threading.Timer(self.save_interval, self._save_pending)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "persisted_to": self.path,
+        }
+
+    # ------------------------------------------------------------------ #
+    # persistence                                                        #
+    # ------------------------------------------------------------------ #
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as f:
+                stored = json.load(f)
+        except Exception:
+            log.exception("Could not read verdict cache from %s", self.path)
+            return
+
+        now = time.time()
+        with self._lock:
+            # Stored oldest-first, so insertion order restores the LRU order
+            for key, verdict, stored_at in stored:
+                if now - stored_at <= self.ttl:
+                    self._entries[key] = (verdict, stored_at)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        log.info("Loaded %d cached verdicts from %s", len(self._entries), self.path)
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            stored = [[key, verdict, stored_at] for key, (verdict, stored_at) in self._entries.items()]
+        with self._save_lock:
+            # Write then rename so a crash never leaves a truncated file behind
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(stored, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        log.info("Saved %d cached verdicts to %s", len(stored), self.path)
+
+    def _save_pending(self) -> None:
+        try:
+            self.save()
+        except Exception:
+            log.exception("Could not save verdict cache to %s", self.path)
@@ -5,8 +5,9 @@ docker network create llama-network || true
 docker rm -f llama-api inference-ui || true
 
 # Build both images
-docker build -t llama-api ./llama-api-docker
-docker build -t inference-ui ./inference-ui
+# (from the repository root, so the shared common/ modules can be copied in)
+docker build -t llama-api -f llama-api-docker/Dockerfile .
+docker build -t inference-ui -f inference-ui/Dockerfile .
 
 # Run both containers
 docker run -d \